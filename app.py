@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Request, Form, BackgroundTasks, HTTPException
+from fastapi import FastAPI, Request, Form, File, Query, UploadFile, HTTPException
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, JSONResponse
@@ -6,16 +6,22 @@ import uvicorn
 from pathlib import Path
 import json
 from datetime import datetime
+from typing import List, Optional
 import asyncio
 
 from rank_tracker import RankTracker
 from database import Database
+from async_database import AsyncDatabase
+from crawl_budget import BudgetExceeded
+from crawl_queue import PRIORITY_MANUAL
+from keyword_import import iter_keyword_file
 from scheduler import RankScheduler
 
 # Inizializza componenti
 db = Database()
+adb = AsyncDatabase(db)  # Accesso dagli handler async: le query non bloccano l'event loop
 tracker = RankTracker()
-scheduler = RankScheduler(tracker, db)
+scheduler = RankScheduler(tracker, db, adb)
 
 def filter_target_domain_results(serp_results: dict, target_domain: str) -> dict:
     """Filtra i risultati SERP per mostrare solo quelli del dominio target"""
@@ -100,7 +106,10 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown
     scheduler.stop()
+    await scheduler.queue.close()
     await tracker.close_crawler()
+    adb.shutdown()
+    db.close()
     print("Applicazione chiusa")
 
 app = FastAPI(title="Crawl4AI Rank Tracker", lifespan=lifespan)
@@ -117,20 +126,19 @@ except:
 
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    projects = db.get_all_projects()
+    projects = await adb.get_all_projects()
     return templates.TemplateResponse("dashboard.html", {"request": request, "projects": projects})
 
 @app.get("/project/{project_id}")
 async def project_detail(request: Request, project_id: int):
     """Pagina dettaglio progetto con risultati SERP modulari"""
-    project = db.get_project(project_id)
-    keywords = db.get_keywords(project_id)
+    project, keywords = await asyncio.gather(adb.get_project(project_id), adb.get_keywords(project_id))
     
     if not project:
         raise HTTPException(status_code=404, detail="Progetto non trovato")
     
     # Ottieni i risultati SERP modulari più recenti
-    all_serp_results = db.get_latest_serp_results(project_id)
+    all_serp_results = await adb.get_latest_serp_results(project_id)
     
     # Filtra solo risultati del dominio target
     target_domain = project['domain']
@@ -147,7 +155,8 @@ async def project_detail(request: Request, project_id: int):
 async def create_project(
     name: str = Form(...),
     domain: str = Form(...),
-    keywords: str = Form(...),
+    keywords: str = Form(""),
+    keywords_file: UploadFile = File(None),
     schedule_hours: int = Form(24),
     country_code: str = Form("IT"),
     language_code: str = Form("it"),
@@ -157,11 +166,13 @@ async def create_project(
     track_ads: bool = Form(False),
     track_snippets: bool = Form(False),
     track_local: bool = Form(False),
-    track_shopping: bool = Form(False)
+    track_shopping: bool = Form(False),
+    rate_limit_per_minute: float = Form(4),
+    rate_limit_burst: int = Form(1),
+    archive_max_age_hours: float = Form(0),
+    daily_fetch_quota: int = Form(0)
 ):
-    keyword_list = [kw.strip() for kw in keywords.split('\n') if kw.strip()]
-    
-    project_id = db.create_project(
+    project_id = await adb.create_project(
         name=name,
         domain=domain, 
         schedule_hours=schedule_hours,
@@ -173,116 +184,144 @@ async def create_project(
         track_ads=track_ads,
         track_snippets=track_snippets,
         track_local=track_local,
-        track_shopping=track_shopping
+        track_shopping=track_shopping,
+        rate_limit_per_minute=rate_limit_per_minute,
+        rate_limit_burst=rate_limit_burst,
+        archive_max_age_hours=archive_max_age_hours,
+        daily_fetch_quota=daily_fetch_quota
     )
-    db.add_keywords(project_id, keyword_list)
+    # Keywords dal textarea e/o da file CSV/TXT, importate a blocchi senza duplicati
+    keyword_report = await adb.add_keywords(project_id, keywords.splitlines())
+    if keywords_file is not None and keywords_file.filename:
+        file_report = await adb.run(db.import_keywords, project_id,
+                                    iter_keyword_file(keywords_file.file, keywords_file.filename))
+        keyword_report = {key: keyword_report[key] + file_report[key] for key in keyword_report}
     
-    # Schedule il tracking
-    scheduler.schedule_project(project_id, schedule_hours)
+    # Schedule il tracking (legge e salva la scadenza nel thread pool; add_job di APScheduler è thread-safe)
+    await adb.run(scheduler.schedule_project, project_id, schedule_hours)
     
-    return {"status": "success", "project_id": project_id}
+    return {"status": "success", "project_id": project_id, "keywords": keyword_report}
+
+@app.post("/api/projects/{project_id}/keywords/import")
+async def import_project_keywords(project_id: int, file: UploadFile = File(...)):
+    """Import in streaming di un file CSV/TXT di keywords (duplicati saltati)"""
+    if not await adb.get_project(project_id):
+        raise HTTPException(status_code=404, detail="Progetto non trovato")
+    
+    report = await adb.run(db.import_keywords, project_id, iter_keyword_file(file.file, file.filename or ''))
+    return {"status": "success", "project_id": project_id, **report}
+
+@app.post("/api/projects/{project_id}/keywords/tier")
+async def set_project_keyword_tier(project_id: int, tier: str = Form(...), keywords: str = Form(...)):
+    """Frequenza di check per keyword: tier hourly/daily/weekly, 'default' = intervallo del progetto"""
+    if not await adb.get_project(project_id):
+        raise HTTPException(status_code=404, detail="Progetto non trovato")
+    try:
+        updated = await adb.set_keyword_tier(project_id, keywords.splitlines(), None if tier == 'default' else tier)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "updated": updated, "tiers": await adb.get_keyword_tiers(project_id)}
+
+@app.get("/api/projects/{project_id}/keywords/tiers")
+async def get_project_keyword_tiers(project_id: int):
+    """Numero di keywords per tier di frequenza"""
+    return await adb.get_keyword_tiers(project_id)
 
 @app.post("/run_check/{project_id}")
-async def run_check(project_id: int, background_tasks: BackgroundTasks):
-    background_tasks.add_task(run_rank_check, project_id)
-    return {"status": "started"}
+async def run_check(project_id: int):
+    """Accoda un check manuale: precede i check schedulati nella coda globale (se il budget del giorno basta)"""
+    # Progetto già in coda: il job esistente viene solo promosso a priorità manuale
+    already_queued = scheduler.is_queued(project_id)
+    try:
+        job = await run_rank_check(project_id)
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    if already_queued:
+        return JSONResponse(status_code=202, content={
+            "status": "already_queued",
+            "run_id": job.run_id if job else None,
+            "queued": len(job.pending) if job else None
+        })
+    if job is None:
+        raise HTTPException(status_code=404, detail="Progetto non trovato, inattivo o senza keywords")
+    return {"status": "started", "run_id": job.run_id, "queued": len(job.pending)}
 
 async def run_rank_check(project_id: int):
-    """Esegue check manuale con il nuovo sistema modulare"""
-    project = db.get_project(project_id)
-    keywords = db.get_keywords(project_id)
-    
-    if not project or not keywords:
-        print(f"❌ Progetto {project_id} non trovato o senza keywords")
-        return
-    
-    print(f"🚀 Avvio check manuale per progetto {project_id}: {project['name']}")
-    
-    # Configurazioni per il nuovo sistema
-    localization_config = db.get_project_localization(project_id)
-    tracking_config = db.get_project_tracking_config(project_id)
-    keyword_list = [kw['keyword'] for kw in keywords]
-    
+    """Esegue check manuale con il nuovo sistema modulare (via coda di crawl condivisa con lo scheduler)"""
+    print(f"🚀 Avvio check manuale per progetto {project_id}")
+    return await scheduler.enqueue_project(project_id, trigger='manual', priority=PRIORITY_MANUAL)
+
+# Righe massime per pagina nelle API paginate
+MAX_PAGE_SIZE = 10000
+
+@app.get("/api/results/{project_id}")
+async def get_results(project_id: int, days: int = 30, resolution: str = None,
+                      group_by: str = None, keywords: Optional[List[str]] = Query(None), top: int = None,
+                      limit: int = None, cursor: str = None):
+    """
+    Storico posizioni (risoluzione scelta in base all'intervallo se non indicata).
+    - top=N: solo le N keywords con la migliore posizione corrente
+    - group_by=day|keyword: aggregati calcolati in SQL invece delle righe
+    - limit/cursor: paginazione keyset, risposta {items, next_cursor, resolution}
+    """
     try:
-        # Usa il nuovo metodo modulare
-        results = await tracker.check_rankings_complete(
-            domain=project['domain'],
-            keywords=keyword_list,
-            localization_config=localization_config,
-            tracking_config=tracking_config
-        )
-        
-        # Salva risultati usando la stessa logica dello scheduler
-        save_modular_results(project_id, results)
-        
-        # Calcola statistiche
-        found_count, avg_position = calculate_stats(results)
-        
-        print(f"✅ Check manuale completato per progetto {project_id}")
-        print(f"   Keywords trovate: {found_count}/{len(keyword_list)}")
-        print(f"   Posizione media: {avg_position:.1f}")
-        
-    except Exception as e:
-        print(f"❌ Errore durante check manuale progetto {project_id}: {str(e)}")
+        if top:
+            keywords = (keywords or []) + await adb.get_top_keywords(project_id, min(top, MAX_PAGE_SIZE))
+        if group_by:
+            return await adb.get_history_summary(project_id, days, group_by, resolution, keywords,
+                                                 min(limit or 1000, MAX_PAGE_SIZE), cursor)
+        if limit or cursor:
+            return await adb.get_results_page(project_id, days, resolution, keywords,
+                                              min(limit or 1000, MAX_PAGE_SIZE), cursor)
+        return await adb.get_results_history(project_id, days, resolution, keywords)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-def save_modular_results(project_id: int, results: dict):
-    """Salva i risultati modulari nel database (condiviso con scheduler)"""
-    for keyword, result_data in results.items():
-        if 'error' in result_data:
-            continue
-        
-        # Salva risultati organici nel vecchio formato per compatibilità
-        organic_position = None
-        target_positions = result_data.get('target_positions', {})
-        if 'organic' in target_positions:
-            organic_position = target_positions['organic'].get('position')
-        
-        # Salva nel vecchio formato
-        db.save_result(project_id, keyword, organic_position)
-        
-        # Salva tutte le SERP features
-        all_features = []
-        for result_type, results_list in result_data.items():
-            if result_type in ['metadata', 'target_positions']:
-                continue
-            
-            if isinstance(results_list, list):
-                for result in results_list:
-                    all_features.append({
-                        'result_type': result_type,
-                        'position': result.get('position'),
-                        'domain': result.get('domain'),
-                        'url': result.get('url'),
-                        'title': result.get('title'),
-                        'snippet': result.get('snippet')
-                    })
-        
-        if all_features:
-            db.save_serp_features_batch(project_id, keyword, all_features)
+@app.get("/api/projects/{project_id}/features")
+async def get_features(project_id: int, keyword: str = None, result_type: str = None,
+                       limit: int = 500, cursor: str = None):
+    """SERP features salvate, paginate dal check più recente"""
+    try:
+        return await adb.get_serp_features_page(project_id, keyword, result_type,
+                                                min(limit, MAX_PAGE_SIZE), cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-def calculate_stats(results: dict) -> tuple:
-    """Calcola statistiche dai risultati modulari"""
-    found_count = 0
-    total_position = 0
-    
-    for keyword, result_data in results.items():
-        if 'error' in result_data:
-            continue
-        
-        target_positions = result_data.get('target_positions', {})
-        if 'organic' in target_positions:
-            organic_pos = target_positions['organic'].get('position')
-            if organic_pos:
-                found_count += 1
-                total_position += organic_pos
-    
-    avg_position = total_position / max(found_count, 1)
-    return found_count, avg_position
+@app.get("/api/projects/{project_id}/presence")
+async def get_presence(project_id: int, days: int = 30, resolution: str = None):
+    """Presenza del dominio target per tipo di risultato (rollup giornalieri/settimanali)"""
+    try:
+        return await adb.get_presence_history(project_id, days, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/api/results/{project_id}")
-async def get_results(project_id: int, days: int = 30):
-    results = db.get_results_history(project_id, days)
-    return results
+@app.get("/api/projects/{project_id}/runs")
+async def get_project_runs(project_id: int, limit: int = 20):
+    """Storico dei check run di un progetto"""
+    return await adb.get_check_runs(project_id, limit)
+
+@app.get("/api/rate_limits")
+async def get_rate_limits():
+    """Metriche dei tempi di attesa del rate limiter per localizzazione"""
+    return tracker.rate_limiter.metrics()
+
+@app.get("/api/budget")
+async def get_crawl_budget(day: str = None):
+    """Fetch consumati e keywords rinviate nel giorno UTC (oggi se non indicato), globali e per progetto"""
+    return await adb.get_crawl_budget(day)
+
+@app.get("/api/crawler")
+async def get_crawler_stats():
+    """Stato del pool browser e della deduplicazione SERP tra progetti"""
+    return {
+        'queue': scheduler.queue.stats(),
+        'lifecycle': tracker.lifecycle.stats(),
+        'coalescer': tracker.coalescer.stats(),
+        'archive': tracker.archive.stats(),
+        'parser': tracker.parse_executor.stats(),
+        'database': {**db.connections.stats(), 'async': adb.stats()},
+        'retention': scheduler.retention.stats()
+    }
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
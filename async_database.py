@@ -0,0 +1,65 @@
+"""
+Accesso asincrono al database
+Facciata di Database con gli stessi metodi, eseguiti come coroutine in un thread pool dedicato:
+le query SQLite non bloccano l'event loop che gestisce crawl, scheduler e richieste HTTP
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from database import Database
+
+
+class AsyncDatabase:
+    """Espone ogni metodo pubblico di Database come coroutine (es. await adb.get_project(3))"""
+
+    def __init__(self, db: Database, max_workers: Optional[int] = None):
+        self.db = db
+        # Un thread per reader del pool più uno per il writer: più thread resterebbero in attesa
+        self.max_workers = max_workers or db.connections.max_readers + 1
+        self._executor = None
+        self.calls = 0
+        self.pending = 0
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        # Il wrapper viene creato una sola volta per metodo
+        self.__dict__[name] = call
+        return call
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='rank-tracker-db')
+        return self._executor
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Esegue una funzione sincrona (che usa il database) nel thread pool del database"""
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+        finally:
+            self.pending -= 1
+            self.calls += 1
+
+    def shutdown(self):
+        """Chiude il thread pool (viene ricreato al prossimo utilizzo)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        return {
+            'max_workers': self.max_workers,
+            'pending': self.pending,
+            'calls': self.calls
+        }
@@ -0,0 +1,211 @@
+"""
+Pool di contesti browser isolati per crawling SERP concorrente
+Ogni contesto ha il proprio AsyncWebCrawler, ciclo di vita e stato di salute
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+
+# Numero di contesti browser di default (configurabile per deployment)
+DEFAULT_POOL_SIZE = int(os.getenv('RANK_TRACKER_POOL_SIZE', '1'))
+# Pagine servite da un contesto prima di riciclarlo (0 = mai)
+DEFAULT_MAX_PAGES_PER_CONTEXT = int(os.getenv('RANK_TRACKER_MAX_PAGES', '200'))
+
+
+def create_crawler(egress: Optional[str] = None):
+    """Crea un AsyncWebCrawler con la configurazione anti-detection standard"""
+    from crawl4ai import AsyncWebCrawler
+
+    options = dict(
+        browser_type="chromium",
+        headless=True,
+        verbose=False,
+        # Configurazione browser realistica
+        viewport_width=1920,
+        viewport_height=1080,
+        # Simula comportamento umano
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        # Anti-detection features
+        accept_downloads=False,
+        override_navigator=True,
+        mask_fingerprint=True,
+        simulate_user=True,
+        magic=True  # Attiva tutte le feature anti-detection
+    )
+    if egress:
+        options['proxy'] = egress
+
+    return AsyncWebCrawler(**options)
+
+
+async def close_crawler_instance(crawler):
+    """Chiude un crawler gestendo le differenze tra versioni di crawl4ai"""
+    try:
+        await crawler.aclose()
+    except AttributeError:
+        # Versioni più recenti usano close() o non richiedono chiusura esplicita
+        try:
+            await crawler.close()
+        except:
+            pass
+
+
+class PooledBrowser:
+    """Contesto browser isolato gestito dal pool"""
+
+    def __init__(self, context_id: int, crawler_factory: Callable, egress: Optional[str] = None):
+        self.context_id = context_id
+        self.crawler_factory = crawler_factory
+        self.egress = egress
+        self.crawler = None
+        self.pages = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.started_at = None
+        self.last_used = None
+
+    @property
+    def egress_id(self) -> str:
+        """Identità di uscita del contesto (proxy o connessione diretta)"""
+        return self.egress or 'direct'
+
+    async def start(self):
+        if not self.crawler:
+            self.crawler = self.crawler_factory(self.egress)
+            self.started_at = time.time()
+            self.pages = 0
+            self.consecutive_failures = 0
+
+    async def close(self):
+        if self.crawler:
+            await close_crawler_instance(self.crawler)
+            self.crawler = None
+
+    async def recycle(self):
+        """Chiude e ricrea il crawler del contesto"""
+        await self.close()
+        await self.start()
+
+    def record_success(self):
+        self.pages += 1
+        self.consecutive_failures = 0
+        self.last_used = time.time()
+
+    def record_failure(self):
+        self.pages += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_used = time.time()
+
+    def stats(self) -> Dict:
+        return {
+            'context_id': self.context_id,
+            'egress': self.egress_id,
+            'running': self.crawler is not None,
+            'pages': self.pages,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'last_used': self.last_used
+        }
+
+
+class BrowserPool:
+    """Pool di N contesti browser con checkout equo (FIFO) e health check"""
+
+    def __init__(self,
+                 size: Optional[int] = None,
+                 crawler_factory: Callable = create_crawler,
+                 egress_list: Optional[List[str]] = None,
+                 max_consecutive_failures: int = 3,
+                 max_pages_per_context: Optional[int] = None):
+        self.size = max(1, size or DEFAULT_POOL_SIZE)
+        self.crawler_factory = crawler_factory
+        self.max_consecutive_failures = max_consecutive_failures
+        self.max_pages_per_context = (DEFAULT_MAX_PAGES_PER_CONTEXT if max_pages_per_context is None
+                                      else max_pages_per_context)
+
+        # Proxy opzionali, assegnati ai contesti a rotazione
+        if egress_list is None:
+            egress_list = [p.strip() for p in os.getenv('RANK_TRACKER_PROXIES', '').split(',') if p.strip()]
+        self.egress_list = egress_list
+
+        self.contexts = [
+            PooledBrowser(
+                context_id=i,
+                crawler_factory=crawler_factory,
+                egress=egress_list[i % len(egress_list)] if egress_list else None
+            )
+            for i in range(self.size)
+        ]
+        # Una coda di contesti liberi per identità di uscita (il rate limit è per uscita)
+        self.egress_ids = list(dict.fromkeys(context.egress_id for context in self.contexts))
+        self._next_egress = 0
+        self._available: Optional[Dict[str, asyncio.Queue]] = None
+        self.started = False
+
+    async def start(self):
+        """Avvia tutti i contesti del pool"""
+        if self.started:
+            return
+
+        self._available = {egress_id: asyncio.Queue() for egress_id in self.egress_ids}
+        for context in self.contexts:
+            await context.start()
+            self._available[context.egress_id].put_nowait(context)
+
+        self.started = True
+        print(f"🌐 Pool browser avviato con {self.size} contesti anti-detection")
+
+    async def close(self):
+        """Chiude tutti i contesti del pool"""
+        for context in self.contexts:
+            await context.close()
+        self._available = None
+        self.started = False
+
+    def is_healthy(self, context: PooledBrowser) -> bool:
+        return context.crawler is not None and context.consecutive_failures < self.max_consecutive_failures
+
+    def needs_recycle(self, context: PooledBrowser) -> bool:
+        return bool(self.max_pages_per_context) and context.pages >= self.max_pages_per_context
+
+    async def health_check(self, context: PooledBrowser):
+        """Ricrea un contesto non sano o che ha servito troppe pagine"""
+        if not self.is_healthy(context):
+            print(f"♻️ Contesto browser {context.context_id} non sano "
+                  f"({context.consecutive_failures} errori consecutivi), riavvio...")
+            await context.recycle()
+        elif self.needs_recycle(context):
+            print(f"♻️ Contesto browser {context.context_id} ha servito {context.pages} pagine, riciclo...")
+            await context.recycle()
+
+    def next_egress(self) -> str:
+        """Identità di uscita per la prossima richiesta, a rotazione tra quelle del pool"""
+        egress_id = self.egress_ids[self._next_egress % len(self.egress_ids)]
+        self._next_egress += 1
+        return egress_id
+
+    @asynccontextmanager
+    async def checkout(self, egress_id: Optional[str] = None):
+        """
+        Prende in prestito un contesto dell'uscita indicata (o della prossima a rotazione);
+        i richiedenti della stessa uscita sono serviti in ordine di arrivo
+        """
+        await self.start()
+        context = await self._available[egress_id or self.next_egress()].get()
+        try:
+            await self.health_check(context)
+            yield context
+        finally:
+            if self._available is not None:
+                self._available[context.egress_id].put_nowait(context)
+
+    def stats(self) -> Dict:
+        return {
+            'size': self.size,
+            'available': sum(queue.qsize() for queue in self._available.values()) if self._available else 0,
+            'contexts': [context.stats() for context in self.contexts]
+        }
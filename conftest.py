@@ -0,0 +1,45 @@
+"""
+Fixture condivise dai test: database e progetto in una directory temporanea di pytest (tmp_path,
+rimossa automaticamente) e salvataggio di check datati per costruire uno storico
+"""
+
+import os
+import pytest
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Database vuoto, chiuso a fine test"""
+    database = Database(os.path.join(tmp_path, 'test.db'))
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def project_id(db):
+    """Progetto di test per isacco.it con check giornaliero"""
+    return db.create_project(name="Test", domain="isacco.it", schedule_hours=24)
+
+
+@pytest.fixture
+def save_check(db):
+    """
+    save_check(project_id, checked_at, {keyword: risultato}) salva un check come lo scheduler
+    (save_check_run) ma con la data indicata; un risultato int o None è la sola posizione organica
+    """
+    def save(project_id: int, checked_at: str, results: dict) -> dict:
+        results = {
+            keyword: result if isinstance(result, dict) else {'target_positions': {'organic': {'position': result}}}
+            for keyword, result in results.items()
+        }
+        run = db.save_check_run(project_id, results)
+        with db.connections.writer() as conn:
+            for table in ('ranking_results', 'serp_feature_rows'):
+                conn.execute(f"UPDATE {table} SET checked_at = ? WHERE run_id = ?", (checked_at, run['run_id']))
+            conn.execute("UPDATE check_runs SET started_at = ?, finished_at = ? WHERE id = ?",
+                         (checked_at, checked_at, run['run_id']))
+        db.rebuild_latest_positions(project_id)
+        return run
+
+    return save
@@ -0,0 +1,132 @@
+"""
+Budget giornaliero dei fetch SERP
+Ogni keyword ammessa in coda consuma un'unità del budget globale e di quello del progetto per il giorno
+UTC corrente (contatori nel database, condivisi tra riavvii). I check schedulati oltre il budget
+vengono rinviati alla finestra successiva; i check manuali sono ammessi solo se ci stanno per intero
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+# 0 = illimitato
+GLOBAL_DAILY_BUDGET = int(os.getenv('RANK_TRACKER_DAILY_FETCH_BUDGET', '0'))
+# Quota dei progetti senza daily_fetch_quota propria
+PROJECT_DAILY_QUOTA = int(os.getenv('RANK_TRACKER_PROJECT_DAILY_QUOTA', '0'))
+
+# Riga dei contatori globali (gli id dei progetti partono da 1)
+GLOBAL_KEY = 0
+
+
+class BudgetExceeded(Exception):
+    """Check non ammesso: budget giornaliero globale o del progetto esaurito"""
+
+    def __init__(self, project_id: int, requested: int, remaining: int):
+        self.project_id = project_id
+        self.requested = requested
+        self.remaining = remaining
+        super().__init__(f"Budget giornaliero esaurito per il progetto {project_id}: "
+                         f"{requested} keywords richieste, {remaining} fetch disponibili")
+
+
+def init_budget_tables(conn):
+    """Contatori per giorno UTC: fetch ammessi e keywords rinviate, per progetto e globali"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS crawl_budget_usage (
+            day TEXT NOT NULL,
+            project_id INTEGER NOT NULL,
+            fetches INTEGER NOT NULL DEFAULT 0,
+            deferred INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, project_id)
+        ) WITHOUT ROWID
+    """)
+
+
+def budget_day(now: datetime = None) -> str:
+    return (now or datetime.now(timezone.utc)).astimezone(timezone.utc).date().isoformat()
+
+
+def next_window(now: datetime = None) -> datetime:
+    """Inizio del prossimo giorno di budget (mezzanotte UTC)"""
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    return datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+
+
+def _used(conn, day: str, key: int) -> int:
+    row = conn.execute(
+        "SELECT fetches FROM crawl_budget_usage WHERE day = ? AND project_id = ?", (day, key)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def _add(conn, day: str, key: int, fetches: int, deferred: int = 0):
+    conn.execute("""
+        INSERT INTO crawl_budget_usage (day, project_id, fetches, deferred) VALUES (?, ?, ?, ?)
+        ON CONFLICT (day, project_id) DO UPDATE SET
+            fetches = fetches + excluded.fetches,
+            deferred = deferred + excluded.deferred
+    """, (day, key, fetches, deferred))
+
+
+def remaining_budget(conn, day: str, project_id: int, project_quota: int = 0,
+                     global_quota: int = GLOBAL_DAILY_BUDGET) -> Optional[int]:
+    """Fetch ancora disponibili per il progetto (None = nessun limite)"""
+    limits = []
+    if project_quota:
+        limits.append(project_quota - _used(conn, day, project_id))
+    if global_quota:
+        limits.append(global_quota - _used(conn, day, GLOBAL_KEY))
+    return max(0, min(limits)) if limits else None
+
+
+def reserve(conn, day: str, project_id: int, requested: int, project_quota: int = 0,
+            global_quota: int = GLOBAL_DAILY_BUDGET, all_or_nothing: bool = False) -> int:
+    """
+    Riserva fino a requested fetch (da chiamare nella transazione di scrittura).
+    Ritorna quanti ne sono stati concessi; il resto viene contato come rinviato.
+    Con all_or_nothing solleva BudgetExceeded se non ci stanno tutti (e non registra nulla)
+    """
+    if requested <= 0:
+        return 0
+
+    granted = requested
+    remaining = remaining_budget(conn, day, project_id, project_quota, global_quota)
+    if remaining is not None:
+        granted = min(requested, remaining)
+    if all_or_nothing and granted < requested:
+        raise BudgetExceeded(project_id, requested, remaining)
+
+    _add(conn, day, project_id, granted, requested - granted)
+    _add(conn, day, GLOBAL_KEY, granted, requested - granted)
+    return granted
+
+
+def release(conn, day: str, project_id: int, count: int):
+    """Restituisce fetch riservati e non usati (es. meno keywords scadute del previsto)"""
+    if count > 0:
+        _add(conn, day, project_id, -count)
+        _add(conn, day, GLOBAL_KEY, -count)
+
+
+def usage(conn, day: str, global_quota: int = GLOBAL_DAILY_BUDGET) -> Dict:
+    """Consumo del giorno: globale e per progetto, con le quote applicate"""
+    projects = {}
+    for project_id, fetches, deferred, quota in conn.execute("""
+        SELECT u.project_id, u.fetches, u.deferred, p.daily_fetch_quota
+        FROM crawl_budget_usage u
+        LEFT JOIN projects p ON p.id = u.project_id
+        WHERE u.day = ? AND u.project_id != ?
+        ORDER BY u.fetches DESC
+    """, (day, GLOBAL_KEY)):
+        projects[project_id] = {'fetches': fetches, 'deferred': deferred, 'quota': quota or PROJECT_DAILY_QUOTA}
+
+    row = conn.execute(
+        "SELECT fetches, deferred FROM crawl_budget_usage WHERE day = ? AND project_id = ?", (day, GLOBAL_KEY)
+    ).fetchone() or (0, 0)
+    return {
+        'day': day,
+        'fetches': row[0],
+        'deferred': row[1],
+        'quota': global_quota,
+        'projects': projects
+    }
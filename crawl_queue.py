@@ -0,0 +1,236 @@
+"""
+Coda di crawl globale condivisa da tutti i progetti
+Scheduler e check manuali accodano un job per progetto; un numero fisso di worker estrae una keyword
+alla volta: prima le priorità più alte (check manuali), poi a rotazione tra i progetti della stessa
+priorità, così un progetto da 10k keywords non blocca quelli piccoli e la concorrenza totale è unica
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Priorità: valore più basso = estratto prima
+PRIORITY_MANUAL = 0
+PRIORITY_SCHEDULED = 10
+
+# Keywords in lavorazione contemporaneamente (0 = 5 per contesto del pool browser)
+DEFAULT_CONCURRENCY = int(os.getenv('RANK_TRACKER_QUEUE_CONCURRENCY', '0'))
+KEYWORDS_PER_CONTEXT = 5
+
+
+class CrawlJob:
+    """Un check di un progetto: keywords da controllare e risultati raccolti dai worker"""
+
+    def __init__(self, project_id: int, domain: str, keywords: List[str], localization_config: Dict,
+                 tracking_config: Dict, rate_limit_config: Dict = None, cache_config: Dict = None,
+                 priority: int = PRIORITY_SCHEDULED, run_id: int = None,
+                 on_complete: Callable[['CrawlJob'], Awaitable] = None,
+                 on_abort: Callable[['CrawlJob'], Awaitable] = None):
+        self.project_id = project_id
+        self.domain = domain
+        self.keywords = list(keywords)
+        self.localization_config = localization_config
+        self.tracking_config = tracking_config
+        self.rate_limit_config = rate_limit_config
+        self.cache_config = cache_config
+        self.priority = priority
+        self.run_id = run_id
+        self.on_complete = on_complete
+        self.on_abort = on_abort
+
+        self.pending = deque(self.keywords)
+        self.in_flight = 0
+        self.results: Dict[str, Dict] = {}
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.done: Optional[asyncio.Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return not self.pending and not self.in_flight
+
+    def ordered_results(self) -> Dict[str, Dict]:
+        """Risultati nell'ordine delle keywords del progetto (i worker completano in ordine sparso)"""
+        return {keyword: self.results[keyword] for keyword in self.keywords if keyword in self.results}
+
+    def stats(self) -> Dict:
+        return {
+            'project_id': self.project_id,
+            'run_id': self.run_id,
+            'priority': self.priority,
+            'total': len(self.keywords),
+            'pending': len(self.pending),
+            'in_flight': self.in_flight,
+            'done': len(self.results),
+            'waited': (self.started_at or time.time()) - self.enqueued_at
+        }
+
+
+class CrawlQueue:
+    """Coda a priorità con fairness round-robin tra progetti e budget di concorrenza globale"""
+
+    def __init__(self, tracker, concurrency: Optional[int] = None):
+        self.tracker = tracker
+        pool_size = getattr(getattr(tracker, 'pool', None), 'size', 1)
+        self.concurrency = max(1, concurrency or DEFAULT_CONCURRENCY or KEYWORDS_PER_CONTEXT * pool_size)
+
+        # priorità -> progetti in attesa in ordine di turno (un job attivo per progetto)
+        self._levels: Dict[int, "OrderedDict[int, CrawlJob]"] = {}
+        self._jobs: Dict[int, CrawlJob] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = None
+        self._session = False
+
+        self.active = 0
+        self.completed_items = 0
+        self.completed_jobs = 0
+
+    def get_job(self, project_id: int) -> Optional[CrawlJob]:
+        """Job in coda o in lavorazione per il progetto"""
+        return self._jobs.get(project_id)
+
+    async def submit(self, job: CrawlJob) -> asyncio.Future:
+        """Accoda un job; il future si completa con i risultati dopo on_complete"""
+        if job.project_id in self._jobs:
+            raise ValueError(f"Progetto {job.project_id} già in coda")
+
+        job.done = asyncio.get_running_loop().create_future()
+        self._jobs[job.project_id] = job
+        if not job.pending:
+            await self._complete(job)
+            return job.done
+
+        # Il pool browser resta aperto finché la coda ha lavoro
+        if not self._session:
+            self._session = True
+            await self.tracker.lifecycle.acquire()
+
+        self._levels.setdefault(job.priority, OrderedDict())[job.project_id] = job
+        self._start_workers()
+        self._wakeup.set()
+        return job.done
+
+    def promote(self, project_id: int, priority: int) -> bool:
+        """Sposta le keywords rimanenti di un job a una priorità più alta (es. check manuale richiesto)"""
+        job = self._jobs.get(project_id)
+        if not job or priority >= job.priority:
+            return False
+
+        level = self._levels.get(job.priority)
+        if level is not None and level.pop(project_id, None) is not None:
+            if not level:
+                del self._levels[job.priority]
+            self._levels.setdefault(priority, OrderedDict())[project_id] = job
+        job.priority = priority
+        return True
+
+    def _next_item(self) -> Optional[Tuple[CrawlJob, str]]:
+        """Prossima keyword: priorità più alta, poi il progetto di turno (che passa in fondo)"""
+        if not self._levels:
+            return None
+
+        priority = min(self._levels)
+        level = self._levels[priority]
+        project_id, job = next(iter(level.items()))
+        keyword = job.pending.popleft()
+        if job.pending:
+            level.move_to_end(project_id)
+        else:
+            del level[project_id]
+            if not level:
+                del self._levels[priority]
+        return job, keyword
+
+    def _start_workers(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._workers = [task for task in self._workers if not task.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def _worker(self):
+        while True:
+            item = self._next_item()
+            if item is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            job, keyword = item
+            if job.started_at is None:
+                job.started_at = time.time()
+            job.in_flight += 1
+            self.active += 1
+            try:
+                result = await self.tracker.check_keyword(
+                    keyword=keyword,
+                    domain=job.domain,
+                    localization_config=job.localization_config,
+                    tracking_config=job.tracking_config,
+                    rate_limit_config=job.rate_limit_config,
+                    cache_config=job.cache_config
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result = {'error': str(e)}
+            finally:
+                job.in_flight -= 1
+                self.active -= 1
+
+            job.results[keyword] = result
+            self.completed_items += 1
+            if job.finished:
+                await self._complete(job)
+
+    async def _complete(self, job: CrawlJob):
+        self._jobs.pop(job.project_id, None)
+        self.completed_jobs += 1
+        try:
+            if job.on_complete:
+                await job.on_complete(job)
+        except Exception as e:
+            print(f"❌ Errore a fine check progetto {job.project_id}: {str(e)}")
+        finally:
+            if not job.done.done():
+                job.done.set_result(job.ordered_results())
+            if not self._jobs and self._session:
+                self._session = False
+                await self.tracker.lifecycle.release()
+
+    async def close(self):
+        """
+        Ferma i worker. I job non completati vengono passati a on_abort (es. chiusura del run e
+        restituzione del budget delle keywords mai avviate, ancora in job.pending) e scartati
+        """
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wakeup = None
+        self._levels.clear()
+
+        jobs = list(self._jobs.values())
+        self._jobs.clear()
+        for job in jobs:
+            try:
+                if job.on_abort:
+                    await job.on_abort(job)
+            except Exception as e:
+                print(f"❌ Errore chiudendo il check interrotto del progetto {job.project_id}: {str(e)}")
+            finally:
+                if not job.done.done():
+                    job.done.cancel()
+        self._session = False
+
+    def stats(self) -> Dict:
+        return {
+            'concurrency': self.concurrency,
+            'active': self.active,
+            'queued': sum(len(job.pending) for job in self._jobs.values()),
+            'completed_items': self.completed_items,
+            'completed_jobs': self.completed_jobs,
+            'jobs': [job.stats() for job in sorted(self._jobs.values(), key=lambda job: job.priority)]
+        }
@@ -0,0 +1,81 @@
+"""
+Ciclo di vita condiviso del pool browser tra job concorrenti
+Reference counting: il browser resta caldo tra un job e l'altro e viene chiuso solo dopo un periodo di inattività
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from browser_pool import BrowserPool
+
+# Secondi di inattività dopo i quali il browser viene chiuso
+DEFAULT_IDLE_TIMEOUT = float(os.getenv('RANK_TRACKER_IDLE_TIMEOUT', '300'))
+
+
+class CrawlerLifecycle:
+    """Gestore reference-counted del pool browser condiviso da scheduler e web app"""
+
+    def __init__(self, pool: BrowserPool, idle_timeout: Optional[float] = None):
+        self.pool = pool
+        self.idle_timeout = DEFAULT_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.refcount = 0
+        self.launches = 0
+        self._idle_task = None
+
+    async def acquire(self):
+        """Registra un utilizzatore e avvia il pool se non è già caldo"""
+        self._cancel_idle_close()
+        self.refcount += 1
+        if not self.pool.started:
+            self.launches += 1
+            await self.pool.start()
+
+    async def release(self):
+        """Rilascia un utilizzatore; l'ultimo avvia il timer di inattività"""
+        self.refcount = max(0, self.refcount - 1)
+        if self.refcount == 0 and self.pool.started:
+            if self.idle_timeout <= 0:
+                await self.pool.close()
+            else:
+                self._idle_task = asyncio.create_task(self._close_when_idle())
+
+    @asynccontextmanager
+    async def session(self):
+        """Mantiene il pool aperto per tutta la durata del blocco"""
+        await self.acquire()
+        try:
+            yield self.pool
+        finally:
+            await self.release()
+
+    async def _close_when_idle(self):
+        try:
+            await asyncio.sleep(self.idle_timeout)
+        except asyncio.CancelledError:
+            return
+
+        if self.refcount == 0 and self.pool.started:
+            print(f"💤 Browser inattivo da {self.idle_timeout:.0f}s, chiusura pool")
+            await self.pool.close()
+
+    def _cancel_idle_close(self):
+        if self._idle_task and not self._idle_task.done():
+            self._idle_task.cancel()
+        self._idle_task = None
+
+    async def shutdown(self):
+        """Chiusura definitiva (es. arresto applicazione), indipendente dai riferimenti"""
+        self._cancel_idle_close()
+        self.refcount = 0
+        await self.pool.close()
+
+    def stats(self) -> Dict:
+        return {
+            'refcount': self.refcount,
+            'launches': self.launches,
+            'warm': self.pool.started,
+            'idle_timeout': self.idle_timeout,
+            'pool': self.pool.stats()
+        }
@@ -1,16 +1,91 @@
 import sqlite3
+import base64
+import hashlib
 import json
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from db_connections import ConnectionManager, DEFAULT_READERS
+from keyword_import import DEFAULT_CHUNK_SIZE, chunked, normalize_keyword
+from serp_analyzer import flatten_serp_features
+from history_export import init_export_tables, record_rewrites
+from crawl_budget import GLOBAL_DAILY_BUDGET, PROJECT_DAILY_QUOTA, budget_day, init_budget_tables
+import crawl_budget
+from schedule_planner import KEYWORD_TIERS, format_timestamp, next_due, parse_timestamp, tier_hours
+from volatility import (ADAPTIVE_SCHEDULING, MIN_INTERVAL_HOURS, VOLATILITY_LOOKBACK_DAYS, interval_factor,
+                        keyword_volatility)
+from retention import (RESOLUTIONS, init_rollup_tables, choose_resolution, rollup_history, history_summary,
+                       presence_history)
+
+# Upsert di latest_positions: la riga più recente diventa la posizione corrente e la corrente
+# scala a precedente; righe più vecchie aggiornano solo la precedente (stesso risultato del ricalcolo)
+UPSERT_LATEST_POSITION = """
+    INSERT INTO latest_positions (project_id, keyword, position, checked_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (project_id, keyword) DO UPDATE SET
+        previous_position = CASE
+            WHEN excluded.checked_at > latest_positions.checked_at THEN latest_positions.position
+            WHEN excluded.checked_at < latest_positions.checked_at
+                 AND (latest_positions.previous_checked_at IS NULL
+                      OR excluded.checked_at >= latest_positions.previous_checked_at)
+                THEN excluded.position
+            ELSE latest_positions.previous_position END,
+        previous_checked_at = CASE
+            WHEN excluded.checked_at > latest_positions.checked_at THEN latest_positions.checked_at
+            WHEN excluded.checked_at < latest_positions.checked_at
+                 AND (latest_positions.previous_checked_at IS NULL
+                      OR excluded.checked_at >= latest_positions.previous_checked_at)
+                THEN excluded.checked_at
+            ELSE latest_positions.previous_checked_at END,
+        position = CASE
+            WHEN excluded.checked_at >= latest_positions.checked_at THEN excluded.position
+            ELSE latest_positions.position END,
+        checked_at = MAX(excluded.checked_at, latest_positions.checked_at)
+"""
+
+
+def text_hash(text: Optional[str]) -> Optional[bytes]:
+    """Hash di titoli e snippet usato come chiave del dizionario dei testi"""
+    return hashlib.sha1(text.encode('utf-8')).digest() if text is not None else None
+
+
+def utc_timestamp() -> str:
+    """Timestamp nel formato di CURRENT_TIMESTAMP di SQLite (UTC)"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def encode_cursor(*values) -> str:
+    """Cursore opaco di paginazione keyset: la chiave di ordinamento dell'ultima riga restituita"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[list]:
+    """Chiave contenuta nel cursore (None senza cursore); ValueError se non valido"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("Cursore non valido")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Cursore non valido")
+    return values
+
 
 class Database:
-    def __init__(self, db_path: str = "rank_tracker.db"):
+    def __init__(self, db_path: str = "rank_tracker.db", readers: int = None):
         self.db_path = db_path
+        # Connessioni persistenti (writer + pool di reader, WAL) condivise da tutti i metodi
+        self.connections = ConnectionManager(db_path, readers or DEFAULT_READERS)
         self.init_database()
     
+    def close(self):
+        """Chiude le connessioni persistenti"""
+        self.connections.close()
+    
     def init_database(self):
         """Inizializza il database con le tabelle necessarie"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.writer() as conn:
             # Migrazione: aggiungi colonne se non esistono
             self._migrate_localization_fields(conn)
             self._migrate_tracking_mode_fields(conn)
@@ -29,6 +104,10 @@ class Database:
                     track_snippets BOOLEAN DEFAULT 0,
                     track_local BOOLEAN DEFAULT 0,
                     track_shopping BOOLEAN DEFAULT 0,
+                    rate_limit_per_minute REAL DEFAULT 4,
+                    rate_limit_burst INTEGER DEFAULT 1,
+                    archive_max_age_hours REAL DEFAULT 0,
+                    daily_fetch_quota INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     last_check TIMESTAMP,
                     active BOOLEAN DEFAULT 1
@@ -45,6 +124,8 @@ class Database:
                 )
             """)
             
+            self._migrate_keyword_tiers(conn)
+            
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS ranking_results (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -52,6 +133,8 @@ class Database:
                     keyword TEXT NOT NULL,
                     position INTEGER,
                     checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    content_hash TEXT,
+                    parser_version TEXT,
                     FOREIGN KEY (project_id) REFERENCES projects (id)
                 )
             """)
@@ -66,32 +149,148 @@ class Database:
                 ON ranking_results (keyword, checked_at)
             """)
             
-            # Nuova tabella per tracciare tutti i tipi di risultati SERP
+            # SERP features normalizzate: testi ripetuti salvati una volta nei dizionari
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dict_keywords (
+                    id INTEGER PRIMARY KEY,
+                    keyword TEXT NOT NULL UNIQUE
+                )
+            """)
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dict_domains (
+                    id INTEGER PRIMARY KEY,
+                    domain TEXT NOT NULL UNIQUE
+                )
+            """)
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dict_urls (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL UNIQUE
+                )
+            """)
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dict_hashes (
+                    id INTEGER PRIMARY KEY,
+                    content_hash TEXT NOT NULL UNIQUE
+                )
+            """)
+            
+            # Titoli e snippet deduplicati per hash (indice unico sull'hash, non sul testo)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dict_texts (
+                    id INTEGER PRIMARY KEY,
+                    text_hash BLOB NOT NULL UNIQUE,
+                    text TEXT NOT NULL
+                )
+            """)
+            
             conn.execute("""
-                CREATE TABLE IF NOT EXISTS serp_features (
+                CREATE TABLE IF NOT EXISTS serp_feature_rows (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     project_id INTEGER,
-                    keyword TEXT NOT NULL,
+                    keyword_id INTEGER NOT NULL REFERENCES dict_keywords (id),
                     result_type TEXT NOT NULL,
                     position INTEGER,
-                    url TEXT,
-                    title TEXT,
-                    snippet TEXT,
-                    domain TEXT,
+                    url_id INTEGER REFERENCES dict_urls (id),
+                    title_id INTEGER REFERENCES dict_texts (id),
+                    snippet_id INTEGER REFERENCES dict_texts (id),
+                    domain_id INTEGER REFERENCES dict_domains (id),
                     checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    content_hash_id INTEGER REFERENCES dict_hashes (id),
+                    parser_version TEXT,
+                    run_id INTEGER REFERENCES check_runs (id),
                     FOREIGN KEY (project_id) REFERENCES projects (id)
                 )
             """)
             
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_serp_features_project_type 
-                ON serp_features (project_id, result_type, checked_at)
+                CREATE INDEX IF NOT EXISTS idx_feature_rows_project_run 
+                ON serp_feature_rows (project_id, run_id, result_type, position)
             """)
             
+            # Indici compatti (solo interi): i timestamp testuali raddoppierebbero lo spazio
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_serp_features_keyword_type 
-                ON serp_features (keyword, result_type, checked_at)
+                CREATE INDEX IF NOT EXISTS idx_feature_rows_keyword 
+                ON serp_feature_rows (keyword_id, project_id)
             """)
+            
+            # Ordine delle letture per progetto (dal check più recente): sostituisce gli indici
+            # su (project_id, result_type, checked_at) della tabella serp_features originale
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_feature_rows_project_date 
+                ON serp_feature_rows (project_id, checked_at DESC, id)
+            """)
+            
+            self._migrate_rate_limit_fields(conn)
+            self._migrate_archive_fields(conn)
+            self._migrate_budget_fields(conn)
+            self._migrate_result_provenance_fields(conn)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_results_project_hash 
+                ON ranking_results (project_id, content_hash)
+            """)
+            
+            self._migrate_latest_positions(conn)
+            
+            # Check run: ogni risultato fa riferimento al run che l'ha prodotto
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS check_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    project_id INTEGER NOT NULL,
+                    trigger TEXT DEFAULT 'scheduled',
+                    status TEXT DEFAULT 'running',
+                    started_at TIMESTAMP NOT NULL,
+                    finished_at TIMESTAMP,
+                    keywords_total INTEGER DEFAULT 0,
+                    keywords_checked INTEGER DEFAULT 0,
+                    keywords_found INTEGER DEFAULT 0,
+                    errors INTEGER DEFAULT 0,
+                    error_message TEXT,
+                    FOREIGN KEY (project_id) REFERENCES projects (id)
+                )
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_check_runs_project 
+                ON check_runs (project_id, status, id)
+            """)
+            
+            self._migrate_check_run_fields(conn)
+            
+            # Stato dello scheduler: i riavvii riprendono dalle stesse scadenze (vedi schedule_planner.py)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS project_schedules (
+                    project_id INTEGER PRIMARY KEY,
+                    interval_hours REAL NOT NULL,
+                    next_due_at TIMESTAMP NOT NULL,
+                    last_run_at TIMESTAMP,
+                    FOREIGN KEY (project_id) REFERENCES projects (id)
+                )
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_results_project_run 
+                ON ranking_results (project_id, run_id)
+            """)
+            
+            # Vista di compatibilità con le colonne della vecchia tabella serp_features
+            self._migrate_serp_features_storage(conn)
+            
+            # Rollup giornalieri/settimanali dello storico (vedi retention.py)
+            init_rollup_tables(conn)
+            
+            # Watermark degli export colonnari (vedi history_export.py)
+            init_export_tables(conn)
+            
+            # Contatori del budget giornaliero dei fetch (vedi crawl_budget.py)
+            init_budget_tables(conn)
+            
+            # Keywords uniche in forma canonica (dopo le tabelle dello storico, che vengono riallineate)
+            self._migrate_keyword_uniqueness(conn)
     
     def create_project(self, 
                       name: str, 
@@ -105,32 +304,59 @@ class Database:
                       track_ads: bool = False,
                       track_snippets: bool = False,
                       track_local: bool = False,
-                      track_shopping: bool = False) -> int:
+                      track_shopping: bool = False,
+                      rate_limit_per_minute: float = 4,
+                      rate_limit_burst: int = 1,
+                      archive_max_age_hours: float = 0,
+                      daily_fetch_quota: int = 0) -> int:
         """Crea un nuovo progetto con localizzazione moderna e opzioni tracking"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.writer() as conn:
             cursor = conn.execute("""
                 INSERT INTO projects 
                 (name, domain, schedule_hours, country_code, language_code, city_code, content_restriction,
-                 tracking_mode, track_ads, track_snippets, track_local, track_shopping) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 tracking_mode, track_ads, track_snippets, track_local, track_shopping,
+                 rate_limit_per_minute, rate_limit_burst, archive_max_age_hours, daily_fetch_quota) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 (name, domain, schedule_hours, country_code, language_code, city_code, content_restriction,
-                 tracking_mode, track_ads, track_snippets, track_local, track_shopping)
+                 tracking_mode, track_ads, track_snippets, track_local, track_shopping,
+                 rate_limit_per_minute, rate_limit_burst, archive_max_age_hours, daily_fetch_quota)
             )
             return cursor.lastrowid
     
-    def add_keywords(self, project_id: int, keywords: List[str]):
-        """Aggiunge keywords a un progetto"""
-        with sqlite3.connect(self.db_path) as conn:
-            for keyword in keywords:
-                conn.execute(
-                    "INSERT INTO keywords (project_id, keyword) VALUES (?, ?)",
-                    (project_id, keyword.strip())
-                )
+    def add_keywords(self, project_id: int, keywords: Iterable[str]) -> Dict:
+        """Aggiunge keywords a un progetto (normalizzate, i duplicati vengono saltati)"""
+        return self.import_keywords(project_id, keywords)
+    
+    def import_keywords(self, project_id: int, keywords: Iterable[str],
+                        chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict:
+        """
+        Import in streaming: le keywords vengono consumate a blocchi di chunk_size, una transazione
+        per blocco. I duplicati (nel file o già nel progetto) sono saltati dall'indice unico.
+        Restituisce i conteggi inserted, skipped (duplicati) e invalid (troppo lunghe).
+        """
+        report = {'inserted': 0, 'skipped': 0, 'invalid': 0}
+        
+        for chunk in chunked(keywords, chunk_size):
+            # Le righe vuote vengono ignorate senza contarle
+            lines = [keyword for keyword in chunk if keyword and not keyword.isspace()]
+            valid = [keyword for keyword in map(normalize_keyword, lines) if keyword]
+            report['invalid'] += len(lines) - len(valid)
+            
+            with self.connections.writer() as conn:
+                inserted = conn.executemany("""
+                    INSERT INTO keywords (project_id, keyword) VALUES (?, ?)
+                    ON CONFLICT (project_id, keyword) DO NOTHING
+                """, [(project_id, keyword) for keyword in valid]).rowcount
+            
+            report['inserted'] += inserted
+            report['skipped'] += len(valid) - inserted
+        
+        return report
     
     def get_all_projects(self) -> List[Dict]:
         """Recupera tutti i progetti"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.reader() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.execute("""
                 SELECT p.*, 
@@ -147,7 +373,7 @@ class Database:
     
     def get_project(self, project_id: int) -> Optional[Dict]:
         """Recupera un progetto specifico"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.reader() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.execute(
                 "SELECT * FROM projects WHERE id = ? AND active = 1",
@@ -158,7 +384,7 @@ class Database:
     
     def get_keywords(self, project_id: int) -> List[Dict]:
         """Recupera le keywords di un progetto"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.reader() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.execute(
                 "SELECT * FROM keywords WHERE project_id = ? ORDER BY keyword",
@@ -166,81 +392,496 @@ class Database:
             )
             return [dict(row) for row in cursor.fetchall()]
     
-    def save_result(self, project_id: int, keyword: str, position: Optional[int]):
+    def set_keyword_tier(self, project_id: int, keywords: Iterable[str], tier: Optional[str]) -> int:
+        """
+        Assegna un tier di frequenza (KEYWORD_TIERS in schedule_planner.py, None = intervallo del progetto).
+        Le keywords aggiornate sono in scadenza al prossimo check del progetto; ritorna quante sono
+        """
+        if tier is not None:
+            tier_hours(tier, 0)  # Valida il nome del tier
+        normalized = [keyword for keyword in (normalize_keyword(k) for k in keywords) if keyword]
+        
+        updated = 0
+        with self.connections.writer() as conn:
+            for chunk in chunked(normalized, 500):
+                placeholders = ','.join('?' * len(chunk))
+                updated += conn.execute(f"""
+                    UPDATE keywords SET tier = ?, next_check_at = NULL
+                    WHERE project_id = ? AND keyword IN ({placeholders})
+                """, [tier, project_id, *chunk]).rowcount
+        return updated
+    
+    def get_keyword_tiers(self, project_id: int) -> Dict[str, int]:
+        """Numero di keywords per tier ('default' = intervallo del progetto)"""
+        with self.connections.reader() as conn:
+            rows = conn.execute("""
+                SELECT COALESCE(tier, 'default'), COUNT(*) FROM keywords
+                WHERE project_id = ? GROUP BY tier ORDER BY tier
+            """, (project_id,)).fetchall()
+            return dict(rows)
+    
+    def reserve_crawl_budget(self, project_id: int, requested: int, all_or_nothing: bool = False,
+                             day: str = None) -> int:
+        """
+        Ammissione di requested fetch nel budget del giorno (globale e del progetto).
+        Ritorna i fetch concessi; con all_or_nothing tutti, altrimenti BudgetExceeded
+        """
+        project = self.get_project(project_id) or {}
+        with self.connections.writer() as conn:
+            return crawl_budget.reserve(conn, day or budget_day(), project_id, requested,
+                                        project_quota=project.get('daily_fetch_quota') or PROJECT_DAILY_QUOTA,
+                                        global_quota=GLOBAL_DAILY_BUDGET, all_or_nothing=all_or_nothing)
+    
+    def release_crawl_budget(self, project_id: int, count: int, day: str = None):
+        """Restituisce fetch riservati e non usati"""
+        with self.connections.writer() as conn:
+            crawl_budget.release(conn, day or budget_day(), project_id, count)
+    
+    def get_crawl_budget(self, day: str = None) -> Dict:
+        """Consumo del budget del giorno, globale e per progetto"""
+        with self.connections.reader() as conn:
+            return crawl_budget.usage(conn, day or budget_day(), GLOBAL_DAILY_BUDGET)
+    
+    def count_due_keywords(self, project_id: int, until: str) -> int:
+        """Keywords mai controllate o in scadenza entro until"""
+        with self.connections.reader() as conn:
+            return conn.execute("""
+                SELECT COUNT(*) FROM keywords
+                WHERE project_id = ? AND (next_check_at IS NULL OR next_check_at <= ?)
+            """, (project_id, until)).fetchone()[0]
+    
+    def claim_due_keywords(self, project_id: int, project_hours: float, until: str, anchor: str = None,
+                           adaptive: bool = ADAPTIVE_SCHEDULING, limit: int = None) -> List[str]:
+        """
+        Keywords da controllare entro until (mai controllate o scadute), in ordine di scadenza;
+        con limit al più limit keywords (le altre restano in scadenza, es. budget esaurito).
+        La loro prossima scadenza avanza di un intervallo del tier mantenendo la fase; le keywords
+        mai pianificate partono da anchor (la scadenza del progetto) o da until.
+        Con adaptive l'intervallo è scalato dalla volatilità recente della keyword (vedi volatility.py)
+        """
+        until_at = parse_timestamp(until)
+        anchor_at = parse_timestamp(anchor) or until_at
+        
+        due_query = """
+            SELECT id, keyword, tier, next_check_at FROM keywords
+            WHERE project_id = ? AND (next_check_at IS NULL OR next_check_at <= ?)
+            ORDER BY next_check_at, id
+            LIMIT ?
+        """
+        limit = -1 if limit is None else limit
+        
+        # La volatilità si calcola su un reader, senza tenere occupata la connessione di scrittura
+        scores = {}
+        if adaptive:
+            since = format_timestamp(until_at - timedelta(days=VOLATILITY_LOOKBACK_DAYS))
+            with self.connections.reader() as conn:
+                due = [row[1] for row in conn.execute(due_query, (project_id, until, limit))]
+                if due:
+                    scores = keyword_volatility(conn, project_id, due, since)
+        
+        with self.connections.writer() as conn:
+            rows = conn.execute(due_query, (project_id, until, limit)).fetchall()
+            
+            updates = []
+            for keyword_id, keyword, tier, next_check_at in rows:
+                hours = tier_hours(tier if tier in KEYWORD_TIERS else None, project_hours)
+                volatility = scores.get(keyword)
+                if volatility is not None:
+                    hours = max(MIN_INTERVAL_HOURS, hours * interval_factor(volatility))
+                due = next_due(parse_timestamp(next_check_at) or anchor_at, hours, until_at)
+                updates.append((format_timestamp(due), volatility, keyword_id))
+            conn.executemany("UPDATE keywords SET next_check_at = ?, volatility = ? WHERE id = ?", updates)
+            return [row[1] for row in rows]
+    
+    def reset_keywords_due(self, project_id: int, keywords: Iterable[str]) -> int:
+        """
+        Rimette in scadenza keywords assegnate a un check che non ha salvato risultati (es. interrotto):
+        come le keywords nuove ripartono dalla scadenza del progetto al prossimo check
+        """
+        updated = 0
+        with self.connections.writer() as conn:
+            for chunk in chunked(list(keywords), 500):
+                placeholders = ','.join('?' * len(chunk))
+                updated += conn.execute(f"""
+                    UPDATE keywords SET next_check_at = NULL
+                    WHERE project_id = ? AND keyword IN ({placeholders})
+                """, [project_id, *chunk]).rowcount
+        return updated
+    
+    def get_next_keyword_due(self, project_id: int) -> Optional[str]:
+        """Prima scadenza tra le keywords già pianificate di un progetto"""
+        with self.connections.reader() as conn:
+            return conn.execute("""
+                SELECT MIN(next_check_at) FROM keywords
+                WHERE project_id = ? AND next_check_at IS NOT NULL
+            """, (project_id,)).fetchone()[0]
+    
+    def save_result(self, project_id: int, keyword: str, position: Optional[int],
+                    content_hash: str = None, parser_version: str = None):
         """Salva un risultato di ranking"""
-        with sqlite3.connect(self.db_path) as conn:
+        checked_at = utc_timestamp()
+        with self.connections.writer() as conn:
             conn.execute(
-                "INSERT INTO ranking_results (project_id, keyword, position) VALUES (?, ?, ?)",
-                (project_id, keyword, position)
+                """INSERT INTO ranking_results (project_id, keyword, position, checked_at, content_hash, parser_version) 
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (project_id, keyword, position, checked_at, content_hash, parser_version)
             )
+            conn.execute(UPSERT_LATEST_POSITION, (project_id, keyword, position, checked_at))
     
     def save_results_batch(self, project_id: int, results: Dict[str, Optional[int]]):
         """Salva multiple risultati in batch"""
-        with sqlite3.connect(self.db_path) as conn:
-            for keyword, position in results.items():
-                conn.execute(
-                    "INSERT INTO ranking_results (project_id, keyword, position) VALUES (?, ?, ?)",
-                    (project_id, keyword, position)
-                )
+        checked_at = utc_timestamp()
+        rows = [(project_id, keyword, position, checked_at) for keyword, position in results.items()]
+        with self.connections.writer() as conn:
+            conn.executemany(
+                "INSERT INTO ranking_results (project_id, keyword, position, checked_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            conn.executemany(UPSERT_LATEST_POSITION, rows)
             
             # Aggiorna last_check del progetto
             conn.execute(
-                "UPDATE projects SET last_check = CURRENT_TIMESTAMP WHERE id = ?",
-                (project_id,)
+                "UPDATE projects SET last_check = ? WHERE id = ?",
+                (checked_at, project_id)
             )
     
     def get_latest_results(self, project_id: int) -> List[Dict]:
-        """Recupera gli ultimi risultati per un progetto"""
-        with sqlite3.connect(self.db_path) as conn:
+        """Recupera gli ultimi risultati per un progetto (posizione corrente e precedente)"""
+        with self.connections.reader() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.execute("""
-                SELECT r1.keyword, r1.position, r1.checked_at,
-                       r2.position as previous_position
-                FROM ranking_results r1
-                LEFT JOIN ranking_results r2 ON (
-                    r1.keyword = r2.keyword 
-                    AND r1.project_id = r2.project_id
-                    AND r2.checked_at = (
-                        SELECT MAX(checked_at) 
-                        FROM ranking_results r3 
-                        WHERE r3.keyword = r1.keyword 
-                        AND r3.project_id = r1.project_id 
-                        AND r3.checked_at < r1.checked_at
-                    )
-                )
-                WHERE r1.project_id = ?
-                AND r1.checked_at = (
-                    SELECT MAX(checked_at) 
-                    FROM ranking_results r4 
-                    WHERE r4.keyword = r1.keyword 
-                    AND r4.project_id = r1.project_id
-                )
-                ORDER BY r1.keyword
+                SELECT keyword, position, checked_at, previous_position
+                FROM latest_positions
+                WHERE project_id = ?
+                ORDER BY keyword
             """, (project_id,))
             return [dict(row) for row in cursor.fetchall()]
     
-    def get_results_history(self, project_id: int, days: int = 30) -> List[Dict]:
-        """Recupera lo storico risultati per grafici"""
-        since_date = datetime.now() - timedelta(days=days)
+    def rebuild_latest_positions(self, project_id: int = None) -> int:
+        """Ricalcola latest_positions dallo storico (backfill o dopo modifiche manuali)"""
+        with self.connections.writer() as conn:
+            return self._rebuild_latest_positions(conn, project_id)
+    
+    def _rebuild_latest_positions(self, conn, project_id: int = None) -> int:
+        where = "WHERE project_id = ?" if project_id is not None else ""
+        params = [project_id] if project_id is not None else []
         
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
+        conn.execute(f"DELETE FROM latest_positions {where}", params)
+        cursor = conn.execute(f"""
+            INSERT INTO latest_positions
+            (project_id, keyword, position, checked_at, previous_position, previous_checked_at)
+            WITH per_check AS (
+                -- Un solo risultato per check (l'ultimo salvato)
+                SELECT project_id, keyword, position, checked_at,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY project_id, keyword, checked_at ORDER BY id DESC
+                       ) AS dup
+                FROM ranking_results
+                {where}
+            ),
+            ranked AS (
+                SELECT project_id, keyword, position, checked_at,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY project_id, keyword ORDER BY checked_at DESC
+                       ) AS rn
+                FROM per_check
+                WHERE dup = 1
+            )
+            SELECT project_id, keyword,
+                   MAX(CASE WHEN rn = 1 THEN position END),
+                   MAX(CASE WHEN rn = 1 THEN checked_at END),
+                   MAX(CASE WHEN rn = 2 THEN position END),
+                   MAX(CASE WHEN rn = 2 THEN checked_at END)
+            FROM ranked
+            WHERE rn <= 2
+            GROUP BY project_id, keyword
+        """, params)
+        return cursor.rowcount
+    
+    def _migrate_keyword_uniqueness(self, conn):
+        """
+        Rimuove le keywords duplicate, le porta nella forma canonica degli import e crea l'indice
+        unico (project_id, keyword). I database con il vecchio indice idx_keywords_project_keyword
+        (keywords non normalizzate) vengono migrati di nuovo
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_keywords_project_normalized'"
+        ).fetchone()
+        if exists:
+            return
+        
+        removed = conn.execute("""
+            DELETE FROM keywords WHERE id NOT IN (
+                SELECT MIN(id) FROM keywords GROUP BY project_id, keyword
+            )
+        """).rowcount
+        self._normalize_keywords(conn)
+        conn.execute("DROP INDEX IF EXISTS idx_keywords_project_keyword")
+        conn.execute("""
+            CREATE UNIQUE INDEX idx_keywords_project_normalized
+            ON keywords (project_id, keyword)
+        """)
+        if removed:
+            print(f"🔑 Rimosse {removed} keywords duplicate dai progetti")
+    
+    def _normalize_keywords(self, conn):
+        """
+        Porta le keywords nella forma canonica degli import (normalize_keyword): quelle che coincidono
+        nello stesso progetto vengono unite nella riga con id minore, e storico, SERP features e rollup
+        passano alla keyword canonica
+        """
+        conn.create_function('normalize_keyword', 1, normalize_keyword, deterministic=True)
+        rows = conn.execute("""
+            SELECT id, project_id, keyword, normalize_keyword(keyword) FROM keywords
+            WHERE keyword != normalize_keyword(keyword)
+        """).fetchall()
+        if not rows:
+            return
+        
+        groups = {}
+        for keyword_id, project_id, keyword, normalized in rows:
+            groups.setdefault((project_id, normalized), []).append((keyword_id, keyword))
+        dict_ids = self._intern(conn, 'dict_keywords', 'keyword', [normalized for _, normalized in groups])
+        
+        merged = 0
+        for (project_id, normalized), variants in groups.items():
+            ids = [keyword_id for keyword_id, _ in variants]
+            canonical = conn.execute(
+                "SELECT id FROM keywords WHERE project_id = ? AND keyword = ?", (project_id, normalized)
+            ).fetchone()
+            if canonical:
+                ids.append(canonical[0])
+            survivor = min(ids)
+            conn.executemany("DELETE FROM keywords WHERE id = ?", [(i,) for i in ids if i != survivor])
+            conn.execute("UPDATE keywords SET keyword = ? WHERE id = ?", (normalized, survivor))
+            merged += len(ids) - 1
+            
+            for _, keyword in variants:
+                conn.execute("UPDATE ranking_results SET keyword = ? WHERE project_id = ? AND keyword = ?",
+                             (normalized, project_id, keyword))
+                old_id = conn.execute("SELECT id FROM dict_keywords WHERE keyword = ?", (keyword,)).fetchone()
+                if old_id:
+                    self._merge_keyword_ids(conn, project_id, old_id[0], dict_ids[normalized])
+        
+        for project_id in {project_id for project_id, _ in groups}:
+            self._rebuild_latest_positions(conn, project_id)
+        print(f"🔑 Normalizzate {len(rows)} keywords ({merged} duplicate unite)")
+    
+    def _merge_keyword_ids(self, conn, project_id: int, old_id: int, new_id: int):
+        """Sposta SERP features e rollup di un progetto da una keyword del dizionario a un'altra"""
+        conn.execute("UPDATE serp_feature_rows SET keyword_id = ? WHERE project_id = ? AND keyword_id = ?",
+                     (new_id, project_id, old_id))
+        
+        # Rollup di entrambe le keywords nello stesso bucket: si sommano come nel rollup settimanale
+        ranking = conn.execute("""
+            SELECT project_id, resolution, bucket, ?, SUM(checks), SUM(found),
+                   MIN(best_position), MAX(worst_position), SUM(position_sum)
+            FROM ranking_rollups
+            WHERE project_id = ? AND keyword_id IN (?, ?)
+            GROUP BY resolution, bucket
+        """, (new_id, project_id, old_id, new_id)).fetchall()
+        features = conn.execute("""
+            SELECT project_id, resolution, bucket, ?, result_type, SUM(serps), SUM(target_serps), MIN(best_position)
+            FROM feature_rollups
+            WHERE project_id = ? AND keyword_id IN (?, ?)
+            GROUP BY resolution, bucket, result_type
+        """, (new_id, project_id, old_id, new_id)).fetchall()
+        for table in ('ranking_rollups', 'feature_rollups'):
+            conn.execute(f"DELETE FROM {table} WHERE project_id = ? AND keyword_id IN (?, ?)",
+                         (project_id, old_id, new_id))
+        conn.executemany("""
+            INSERT INTO ranking_rollups
+            (project_id, resolution, bucket, keyword_id, checks, found, best_position, worst_position, position_sum)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, ranking)
+        conn.executemany("""
+            INSERT INTO feature_rollups
+            (project_id, resolution, bucket, keyword_id, result_type, serps, target_serps, best_position)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, features)
+    
+    def _migrate_keyword_tiers(self, conn):
+        """Aggiunge tier, prossima scadenza e volatilità alle keywords, con l'indice delle keywords in scadenza"""
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(keywords)")]
+        if 'tier' not in columns:
+            conn.execute("ALTER TABLE keywords ADD COLUMN tier TEXT")
+        if 'next_check_at' not in columns:
+            conn.execute("ALTER TABLE keywords ADD COLUMN next_check_at TIMESTAMP")
+        if 'volatility' not in columns:
+            conn.execute("ALTER TABLE keywords ADD COLUMN volatility REAL")
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_keywords_due
+            ON keywords (project_id, next_check_at)
+        """)
+    
+    def _migrate_latest_positions(self, conn):
+        """Crea la tabella delle posizioni correnti e la popola dallo storico esistente"""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'latest_positions'"
+        ).fetchone()
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS latest_positions (
+                project_id INTEGER NOT NULL,
+                keyword TEXT NOT NULL,
+                position INTEGER,
+                checked_at TIMESTAMP NOT NULL,
+                previous_position INTEGER,
+                previous_checked_at TIMESTAMP,
+                PRIMARY KEY (project_id, keyword)
+            ) WITHOUT ROWID
+        """)
+        
+        if not exists:
+            backfilled = self._rebuild_latest_positions(conn)
+            if backfilled:
+                print(f"📌 latest_positions popolata con {backfilled} keywords dallo storico")
+    
+    def get_results_history(self, project_id: int, days: int = 30, resolution: str = None,
+                            keywords: List[str] = None, limit: int = None, cursor: str = None) -> List[Dict]:
+        """
+        Recupera lo storico risultati per grafici, in ordine (checked_at DESC, keyword).
+        Senza resolution viene scelta la più economica per l'intervallo: righe grezze,
+        rollup giornalieri (posizione media, migliore e peggiore) o settimanali.
+        keywords limita lo storico a quelle keywords; limit/cursor paginano (vedi get_results_page).
+        """
+        resolution = self._history_resolution(days, resolution)
+        after = decode_cursor(cursor, 2)
+        since_date = datetime.now(timezone.utc) - timedelta(days=days)
+        
+        with self.connections.reader() as conn:
+            if resolution != 'raw':
+                return rollup_history(conn, project_id, since_date.date(), resolution, keywords, limit, after)
+            
+            query = """
                 SELECT keyword, position, checked_at
                 FROM ranking_results
                 WHERE project_id = ? AND checked_at >= ?
-                ORDER BY checked_at DESC, keyword
-            """, (project_id, since_date.isoformat()))
-            return [dict(row) for row in cursor.fetchall()]
+            """
+            params = [project_id, since_date.strftime('%Y-%m-%d %H:%M:%S')]
+            
+            if keywords is not None:
+                query += f" AND keyword IN ({', '.join('?' * len(keywords))})"
+                params += keywords
+            
+            # Keyset: la condizione su checked_at resta utilizzabile dall'indice (project_id, checked_at)
+            if after is not None:
+                query += " AND checked_at <= ? AND (checked_at < ? OR keyword > ?)"
+                params += [after[0], after[0], after[1]]
+            
+            query += " ORDER BY checked_at DESC, keyword"
+            if limit:
+                query += " LIMIT ?"
+                params.append(limit)
+            
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
+    
+    def get_results_page(self, project_id: int, days: int = 30, resolution: str = None,
+                         keywords: List[str] = None, limit: int = 1000, cursor: str = None) -> Dict:
+        """Una pagina dello storico: items e next_cursor (None all'ultima pagina)"""
+        resolution = self._history_resolution(days, resolution)
+        items = self.get_results_history(project_id, days, resolution, keywords, limit + 1, cursor)
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1]['checked_at'], items[-1]['keyword'])
+        return {'items': items, 'next_cursor': next_cursor, 'resolution': resolution}
+    
+    def get_history_summary(self, project_id: int, days: int = 30, group_by: str = 'day',
+                            resolution: str = None, keywords: List[str] = None,
+                            limit: int = 1000, cursor: str = None) -> Dict:
+        """
+        Storico aggregato in SQL: una riga per giorno/settimana (group_by='day') con posizione media,
+        keywords trovate e in top 3/10, oppure una per keyword (group_by='keyword') con media,
+        migliore, peggiore e posizione corrente. Le righe grezze non vengono trasferite.
+        """
+        resolution = self._history_resolution(days, resolution)
+        # Il giornaliero copre anche l'intervallo delle righe grezze (bucket in attesa calcolati al volo)
+        if resolution == 'raw':
+            resolution = 'daily'
+        after = decode_cursor(cursor, 1)
+        since_date = datetime.now(timezone.utc) - timedelta(days=days)
+        
+        with self.connections.reader() as conn:
+            items = history_summary(conn, project_id, since_date.date(), resolution, group_by, keywords,
+                                    limit + 1, after[0] if after else None)
+        
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1]['checked_at' if group_by == 'day' else 'keyword'])
+        return {'items': items, 'next_cursor': next_cursor, 'resolution': resolution}
+    
+    def get_top_keywords(self, project_id: int, limit: int = 10) -> List[str]:
+        """Keywords con la migliore posizione corrente (le non trovate in coda)"""
+        with self.connections.reader() as conn:
+            return [row[0] for row in conn.execute("""
+                SELECT keyword FROM latest_positions 
+                WHERE project_id = ? 
+                ORDER BY position IS NULL, position, keyword 
+                LIMIT ?
+            """, (project_id, limit))]
+    
+    def _history_resolution(self, days: int, resolution: str = None) -> str:
+        resolution = resolution or choose_resolution(days)
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Risoluzione non valida: {resolution}")
+        return resolution
+    
+    def get_presence_history(self, project_id: int, days: int = 30, resolution: str = None) -> List[Dict]:
+        """Presenza del dominio target per tipo di risultato, a risoluzione giornaliera o settimanale"""
+        resolution = self._history_resolution(days, resolution)
+        if resolution == 'raw':
+            resolution = 'daily'
+        since_date = datetime.now(timezone.utc) - timedelta(days=days)
+        project = self.get_project(project_id)
+        if not project:
+            return []
+        
+        with self.connections.reader() as conn:
+            return presence_history(conn, project_id, project['domain'], since_date.date(), resolution)
     
     def update_project_schedule(self, project_id: int, schedule_hours: int):
         """Aggiorna la frequenza di controllo di un progetto"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.writer() as conn:
             conn.execute(
                 "UPDATE projects SET schedule_hours = ? WHERE id = ?",
                 (schedule_hours, project_id)
             )
     
+    def get_schedule_states(self) -> Dict[int, Dict]:
+        """Scadenze salvate dallo scheduler, per progetto"""
+        with self.connections.reader() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("SELECT * FROM project_schedules").fetchall()
+            return {row['project_id']: dict(row) for row in rows}
+    
+    def get_schedule_state(self, project_id: int) -> Optional[Dict]:
+        """Scadenza salvata di un progetto"""
+        with self.connections.reader() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM project_schedules WHERE project_id = ?", (project_id,)).fetchone()
+            return dict(row) if row else None
+    
+    def save_schedule_state(self, project_id: int, interval_hours: float, next_due_at: str,
+                            last_run_at: str = None):
+        """Salva la prossima scadenza di un progetto (last_run_at resta invariato se None)"""
+        with self.connections.writer() as conn:
+            conn.execute("""
+                INSERT INTO project_schedules (project_id, interval_hours, next_due_at, last_run_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (project_id) DO UPDATE SET
+                    interval_hours = excluded.interval_hours,
+                    next_due_at = excluded.next_due_at,
+                    last_run_at = COALESCE(excluded.last_run_at, project_schedules.last_run_at)
+            """, (project_id, interval_hours, next_due_at, last_run_at))
+    
+    def delete_schedule_state(self, project_id: int):
+        """Dimentica le scadenze di un progetto non più schedulato"""
+        with self.connections.writer() as conn:
+            conn.execute("DELETE FROM project_schedules WHERE project_id = ?", (project_id,))
+    
     def get_project_localization(self, project_id: int) -> Dict:
         """Recupera la configurazione di localizzazione di un progetto"""
         project = self.get_project(project_id)
@@ -291,29 +932,54 @@ class Database:
             print(f"Errore durante migrazione: {e}")
 
     def get_latest_serp_results(self, project_id: int) -> Dict:
-        """Ottiene i risultati SERP modulari più recenti per tipo"""
-        with sqlite3.connect(self.db_path) as conn:
+        """
+        Ottiene i risultati SERP modulari più recenti di ogni keyword, raggruppati per tipo.
+        Un run di tier (o limitato dal budget) controlla solo una parte delle keywords:
+        ogni keyword mostra l'ultimo run che l'ha controllata, non l'ultimo run del progetto.
+        """
+        latest_run = self.get_latest_run(project_id)
+        
+        with self.connections.reader() as conn:
             conn.row_factory = sqlite3.Row
             
-            # Trova la data di check più recente
-            latest_check = conn.execute("""
-                SELECT MAX(checked_at) as latest_date
-                FROM serp_features 
-                WHERE project_id = ?
-            """, (project_id,)).fetchone()
+            if latest_run:
+                # Run più recente per keyword da latest_positions (indice keyword, checked_at),
+                # poi un lookup sull'indice (project_id, run_id) per ogni run
+                all_results = conn.execute("""
+                    WITH latest AS (
+                        SELECT lp.keyword, MAX(r.run_id) AS run_id
+                        FROM latest_positions lp
+                        JOIN ranking_results r
+                            ON r.keyword = lp.keyword AND r.checked_at = lp.checked_at
+                            AND r.project_id = lp.project_id
+                        WHERE lp.project_id = ? AND r.run_id IS NOT NULL
+                        GROUP BY lp.keyword
+                    )
+                    SELECT f.* FROM latest
+                    JOIN serp_features f
+                        ON f.project_id = ? AND f.run_id = latest.run_id AND f.keyword = latest.keyword
+                    ORDER BY f.result_type, f.position
+                """, (project_id, project_id)).fetchall()
+            else:
+                # Storico precedente ai check run: data di check più recente
+                latest_check = conn.execute("""
+                    SELECT MAX(checked_at) as latest_date
+                    FROM serp_features 
+                    WHERE project_id = ?
+                """, (project_id,)).fetchone()
+                
+                if not latest_check or not latest_check['latest_date']:
+                    return {}
+                
+                all_results = conn.execute("""
+                    SELECT * FROM serp_features 
+                    WHERE project_id = ? AND checked_at = ?
+                    ORDER BY result_type, position
+                """, (project_id, latest_check['latest_date'])).fetchall()
             
-            if not latest_check or not latest_check['latest_date']:
+            if not all_results:
                 return {}
             
-            latest_date = latest_check['latest_date']
-            
-            # Ottieni tutti i risultati per quella data, raggruppati per tipo
-            all_results = conn.execute("""
-                SELECT * FROM serp_features 
-                WHERE project_id = ? AND checked_at = ?
-                ORDER BY result_type, position
-            """, (project_id, latest_date)).fetchall()
-            
             # Raggruppa per tipo di risultato
             serp_results = {
                 'organic': [],
@@ -357,31 +1023,217 @@ class Database:
                          position: int, url: str = None, title: str = None, 
                          snippet: str = None, domain: str = None):
         """Salva un risultato SERP feature"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO serp_features 
-                (project_id, keyword, result_type, position, url, title, snippet, domain) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (project_id, keyword, result_type, position, url, title, snippet, domain))
+        with self.connections.writer() as conn:
+            self._insert_serp_features(conn, [
+                (project_id, keyword, result_type, position, url, title, snippet, domain,
+                 None, None, None, None)
+            ])
     
-    def save_serp_features_batch(self, project_id: int, keyword: str, features: List[Dict]):
+    def save_serp_features_batch(self, project_id: int, keyword: str, features: List[Dict],
+                                 content_hash: str = None, parser_version: str = None):
         """Salva multiple SERP features in batch"""
-        with sqlite3.connect(self.db_path) as conn:
-            for feature in features:
-                conn.execute("""
-                    INSERT INTO serp_features 
-                    (project_id, keyword, result_type, position, url, title, snippet, domain) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    project_id, 
-                    keyword, 
-                    feature['result_type'],
-                    feature.get('position'),
-                    feature.get('url'),
-                    feature.get('title'),
-                    feature.get('snippet'),
-                    feature.get('domain')
+        with self.connections.writer() as conn:
+            self._insert_serp_features(conn, [(
+                project_id, 
+                keyword, 
+                feature['result_type'],
+                feature.get('position'),
+                feature.get('url'),
+                feature.get('title'),
+                feature.get('snippet'),
+                feature.get('domain'),
+                None,
+                content_hash,
+                parser_version,
+                None
+            ) for feature in features])
+    
+    def start_check_run(self, project_id: int, keywords_total: int = 0, trigger: str = 'scheduled') -> int:
+        """Registra l'inizio di un check e restituisce il run_id"""
+        with self.connections.writer() as conn:
+            cursor = conn.execute("""
+                INSERT INTO check_runs (project_id, trigger, status, started_at, keywords_total) 
+                VALUES (?, ?, 'running', ?, ?)
+            """, (project_id, trigger, utc_timestamp(), keywords_total))
+            return cursor.lastrowid
+    
+    def finish_check_run(self, run_id: int, status: str = 'failed', error_message: str = None):
+        """Chiude un run senza risultati (es. check interrotto da un errore)"""
+        with self.connections.writer() as conn:
+            conn.execute("""
+                UPDATE check_runs SET status = ?, finished_at = ?, error_message = ? 
+                WHERE id = ?
+            """, (status, utc_timestamp(), error_message, run_id))
+    
+    def abort_stale_runs(self, error_message: str = "Check interrotto da un riavvio") -> int:
+        """Chiude come 'aborted' i run rimasti 'running' (processo terminato durante un check)"""
+        with self.connections.writer() as conn:
+            return conn.execute("""
+                UPDATE check_runs SET status = 'aborted', finished_at = ?, error_message = ? 
+                WHERE status = 'running'
+            """, (utc_timestamp(), error_message)).rowcount
+    
+    def get_latest_run(self, project_id: int) -> Optional[Dict]:
+        """Ultimo run completato di un progetto"""
+        with self.connections.reader() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("""
+                SELECT * FROM check_runs 
+                WHERE project_id = ? AND status = 'completed' 
+                ORDER BY id DESC LIMIT 1
+            """, (project_id,)).fetchone()
+            return dict(row) if row else None
+    
+    def get_check_runs(self, project_id: int, limit: int = 20) -> List[Dict]:
+        """Storico dei run di un progetto, dal più recente"""
+        with self.connections.reader() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT * FROM check_runs 
+                WHERE project_id = ? 
+                ORDER BY id DESC LIMIT ?
+            """, (project_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def save_check_run(self, project_id: int, results: Dict[str, Dict], run_id: int = None) -> Dict:
+        """
+        Salva un intero check (output di check_rankings_complete) in un'unica transazione:
+        posizioni organiche, SERP features, chiusura del run e last_check del progetto.
+        Senza run_id il run viene creato nella stessa transazione.
+        """
+        checked_at = utc_timestamp()
+        ranking_rows = []
+        feature_rows = []
+        
+        for keyword, result_data in results.items():
+            if 'error' in result_data:
+                continue
+            
+            # Posizione organica nel vecchio formato per compatibilità
+            organic_position = result_data.get('target_positions', {}).get('organic', {}).get('position')
+            
+            # Provenienza: SERP archiviata e versione del parser
+            metadata = result_data.get('metadata', {})
+            content_hash = metadata.get('content_hash')
+            parser_version = metadata.get('parser_version')
+            
+            ranking_rows.append((project_id, keyword, organic_position, checked_at, content_hash, parser_version))
+            for feature in flatten_serp_features(result_data):
+                feature_rows.append((
+                    project_id, keyword, feature['result_type'], feature.get('position'),
+                    feature.get('url'), feature.get('title'), feature.get('snippet'), feature.get('domain'),
+                    checked_at, content_hash, parser_version
                 ))
+        
+        found = sum(1 for row in ranking_rows if row[2] is not None)
+        
+        with self.connections.writer() as conn:
+            if run_id is None:
+                run_id = conn.execute("""
+                    INSERT INTO check_runs (project_id, status, started_at, keywords_total) 
+                    VALUES (?, 'running', ?, ?)
+                """, (project_id, checked_at, len(results))).lastrowid
+            
+            conn.executemany("""
+                INSERT INTO ranking_results 
+                (project_id, keyword, position, checked_at, content_hash, parser_version, run_id) 
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [row + (run_id,) for row in ranking_rows])
+            self._insert_serp_features(conn, [row + (run_id,) for row in feature_rows])
+            conn.executemany(UPSERT_LATEST_POSITION, [row[:4] for row in ranking_rows])
+            conn.execute("""
+                UPDATE check_runs 
+                SET status = 'completed', finished_at = ?, keywords_checked = ?, keywords_found = ?, errors = ? 
+                WHERE id = ?
+            """, (checked_at, len(ranking_rows), found, len(results) - len(ranking_rows), run_id))
+            conn.execute(
+                "UPDATE projects SET last_check = ? WHERE id = ?",
+                (checked_at, project_id)
+            )
+        
+        return {
+            'run_id': run_id,
+            'checked_at': checked_at,
+            'results': len(ranking_rows),
+            'features': len(feature_rows),
+            'errors': len(results) - len(ranking_rows)
+        }
+    
+    def get_reanalysis_targets(self, project_id: int, since: str = None) -> List[Dict]:
+        """Risultati di un progetto collegati a una SERP archiviata, candidati alla ri-analisi"""
+        with self.connections.reader() as conn:
+            conn.row_factory = sqlite3.Row
+            
+            query = """
+                SELECT DISTINCT keyword, content_hash, checked_at, run_id, parser_version
+                FROM ranking_results
+                WHERE project_id = ? AND content_hash IS NOT NULL
+            """
+            params = [project_id]
+            
+            if since:
+                query += " AND checked_at >= ?"
+                params.append(since)
+            
+            query += " ORDER BY checked_at"
+            
+            cursor = conn.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def replace_reanalyzed_results(self, project_id: int, rows: List[Dict], parser_version: str) -> int:
+        """
+        Sostituisce in un'unica transazione i risultati derivati da SERP ri-analizzate.
+        Ogni riga: keyword, content_hash, checks (lista di (checked_at, run_id) dei check che hanno
+        usato la SERP), position, features
+        """
+        ranking_rows = []
+        feature_rows = []
+        stale_keys = []
+        
+        for row in rows:
+            stale_keys.append((project_id, row['keyword'], row['content_hash']))
+            for checked_at, run_id in row['checks']:
+                ranking_rows.append((
+                    project_id, row['keyword'], row['position'], checked_at,
+                    row['content_hash'], parser_version, run_id
+                ))
+                for feature in row['features']:
+                    feature_rows.append((
+                        project_id, row['keyword'], feature['result_type'], feature.get('position'),
+                        feature.get('url'), feature.get('title'), feature.get('snippet'), feature.get('domain'),
+                        checked_at, row['content_hash'], parser_version, run_id
+                    ))
+        
+        with self.connections.writer() as conn:
+            # Le righe cambiano id: le partizioni dell'export colonnare vanno riesportate (vedi history_export.py)
+            partitions = {(project_id, row[3][:7]) for row in ranking_rows}
+            for key in stale_keys:
+                partitions.update(conn.execute("""
+                    SELECT DISTINCT project_id, substr(checked_at, 1, 7) FROM ranking_results
+                    WHERE project_id = ? AND keyword = ? AND content_hash = ? AND checked_at IS NOT NULL
+                """, key).fetchall())
+            record_rewrites(conn, partitions)
+            
+            conn.executemany(
+                "DELETE FROM ranking_results WHERE project_id = ? AND keyword = ? AND content_hash = ?",
+                stale_keys
+            )
+            conn.executemany("""
+                DELETE FROM serp_feature_rows 
+                WHERE project_id = ?
+                AND keyword_id = (SELECT id FROM dict_keywords WHERE keyword = ?)
+                AND content_hash_id = (SELECT id FROM dict_hashes WHERE content_hash = ?)
+            """, stale_keys)
+            conn.executemany("""
+                INSERT INTO ranking_results 
+                (project_id, keyword, position, checked_at, content_hash, parser_version, run_id) 
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, ranking_rows)
+            self._insert_serp_features(conn, feature_rows)
+            # Le posizioni riscritte possono riguardare il check corrente o il precedente
+            conn.executemany(UPSERT_LATEST_POSITION, [row[:4] for row in ranking_rows])
+        
+        return len(ranking_rows) + len(feature_rows)
     
     def get_project_tracking_config(self, project_id: int) -> Dict:
         """Recupera la configurazione di tracking di un progetto"""
@@ -397,10 +1249,238 @@ class Database:
             'track_shopping': bool(project.get('track_shopping', False))
         }
     
+    def get_project_rate_limit_config(self, project_id: int) -> Dict:
+        """Recupera la configurazione di rate limiting di un progetto"""
+        project = self.get_project(project_id)
+        if not project:
+            return {}
+            
+        return {
+            'requests_per_minute': project.get('rate_limit_per_minute') or 4,
+            'burst': project.get('rate_limit_burst') or 1
+        }
+    
+    def _migrate_rate_limit_fields(self, conn):
+        """Migra progetti esistenti ai nuovi campi di rate limiting"""
+        try:
+            cursor = conn.execute("PRAGMA table_info(projects)")
+            columns = [row[1] for row in cursor.fetchall()]
+            
+            if 'rate_limit_per_minute' not in columns:
+                conn.execute("ALTER TABLE projects ADD COLUMN rate_limit_per_minute REAL DEFAULT 4")
+            if 'rate_limit_burst' not in columns:
+                conn.execute("ALTER TABLE projects ADD COLUMN rate_limit_burst INTEGER DEFAULT 1")
+                
+        except Exception as e:
+            print(f"Errore durante migrazione rate limit: {e}")
+    
+    def get_project_cache_config(self, project_id: int) -> Dict:
+        """Recupera la policy di freschezza dell'archivio SERP di un progetto"""
+        project = self.get_project(project_id)
+        if not project:
+            return {}
+            
+        return {
+            'max_age_hours': project.get('archive_max_age_hours') or 0
+        }
+    
+    def _migrate_archive_fields(self, conn):
+        """Migra progetti esistenti al campo di freschezza dell'archivio SERP"""
+        try:
+            cursor = conn.execute("PRAGMA table_info(projects)")
+            columns = [row[1] for row in cursor.fetchall()]
+            
+            if 'archive_max_age_hours' not in columns:
+                conn.execute("ALTER TABLE projects ADD COLUMN archive_max_age_hours REAL DEFAULT 0")
+                
+        except Exception as e:
+            print(f"Errore durante migrazione archivio SERP: {e}")
+    
+    def _migrate_budget_fields(self, conn):
+        """Migra progetti esistenti alla quota giornaliera di fetch"""
+        try:
+            cursor = conn.execute("PRAGMA table_info(projects)")
+            columns = [row[1] for row in cursor.fetchall()]
+            
+            if columns and 'daily_fetch_quota' not in columns:
+                conn.execute("ALTER TABLE projects ADD COLUMN daily_fetch_quota INTEGER DEFAULT 0")
+                
+        except Exception as e:
+            print(f"Errore durante migrazione budget: {e}")
+    
+    def _migrate_result_provenance_fields(self, conn):
+        """Aggiunge hash della SERP archiviata e versione parser ai risultati"""
+        try:
+            for table in ('ranking_results', 'serp_features'):
+                cursor = conn.execute(f"PRAGMA table_info({table})")
+                columns = [row[1] for row in cursor.fetchall()]
+                
+                # serp_features nuova: già una vista con tutte le colonne (o non ancora creata)
+                if not columns:
+                    continue
+                
+                if 'content_hash' not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN content_hash TEXT")
+                if 'parser_version' not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN parser_version TEXT")
+                    
+        except Exception as e:
+            print(f"Errore durante migrazione provenienza risultati: {e}")
+    
+    def _migrate_check_run_fields(self, conn):
+        """Aggiunge il riferimento al check run ai risultati"""
+        try:
+            for table in ('ranking_results', 'serp_features'):
+                cursor = conn.execute(f"PRAGMA table_info({table})")
+                columns = [row[1] for row in cursor.fetchall()]
+                
+                if not columns:
+                    continue
+                
+                if 'run_id' not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN run_id INTEGER REFERENCES check_runs (id)")
+                    
+        except Exception as e:
+            print(f"Errore durante migrazione check run: {e}")
+    
+    def _insert_serp_features(self, conn, rows: List[tuple]):
+        """
+        Inserisce SERP features codificando i testi nei dizionari.
+        Ogni riga ha le colonne della vista serp_features: project_id, keyword, result_type, position,
+        url, title, snippet, domain, checked_at, content_hash, parser_version, run_id
+        """
+        if not rows:
+            return
+        
+        keyword_ids = self._intern(conn, 'dict_keywords', 'keyword', (row[1] for row in rows))
+        url_ids = self._intern(conn, 'dict_urls', 'url', (row[4] for row in rows))
+        domain_ids = self._intern(conn, 'dict_domains', 'domain', (row[7] for row in rows))
+        hash_ids = self._intern(conn, 'dict_hashes', 'content_hash', (row[9] for row in rows))
+        text_ids = self._intern_texts(conn, [text for row in rows for text in (row[5], row[6])])
+        default_checked_at = utc_timestamp()
+        
+        conn.executemany("""
+            INSERT INTO serp_feature_rows 
+            (project_id, keyword_id, result_type, position, url_id, title_id, snippet_id, domain_id,
+             checked_at, content_hash_id, parser_version, run_id) 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(
+            project_id,
+            keyword_ids[keyword],
+            result_type,
+            position,
+            url_ids.get(url),
+            text_ids.get(title),
+            text_ids.get(snippet),
+            domain_ids.get(domain),
+            checked_at or default_checked_at,
+            hash_ids.get(content_hash),
+            parser_version,
+            run_id
+        ) for (project_id, keyword, result_type, position, url, title, snippet, domain,
+               checked_at, content_hash, parser_version, run_id) in rows])
+    
+    def _intern(self, conn, table: str, column: str, values) -> Dict[str, int]:
+        """Id dei valori nel dizionario, inserendo quelli mancanti"""
+        values = list({value for value in values if value is not None})
+        if not values:
+            return {}
+        
+        conn.executemany(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", [(v,) for v in values])
+        
+        ids = {}
+        for i in range(0, len(values), 500):
+            chunk = values[i:i + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            ids.update(conn.execute(
+                f"SELECT {column}, id FROM {table} WHERE {column} IN ({placeholders})", chunk
+            ).fetchall())
+        return ids
+    
+    def _intern_texts(self, conn, texts) -> Dict[str, int]:
+        """Id di titoli e snippet, deduplicati per hash del contenuto"""
+        by_hash = {text_hash(text): text for text in set(texts) if text is not None}
+        if not by_hash:
+            return {}
+        
+        conn.executemany(
+            "INSERT OR IGNORE INTO dict_texts (text_hash, text) VALUES (?, ?)",
+            list(by_hash.items())
+        )
+        
+        ids = {}
+        hashes = list(by_hash)
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            for hash_value, text_id in conn.execute(
+                f"SELECT text_hash, id FROM dict_texts WHERE text_hash IN ({placeholders})", chunk
+            ):
+                ids[by_hash[hash_value]] = text_id
+        return ids
+    
+    def _migrate_serp_features_storage(self, conn):
+        """Converte la vecchia tabella serp_features nel formato a dizionari e crea la vista di compatibilità"""
+        legacy = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'serp_features'"
+        ).fetchone()
+        
+        if legacy:
+            conn.create_function('text_hash', 1, text_hash, deterministic=True)
+            for table, column in (('dict_keywords', 'keyword'), ('dict_urls', 'url'),
+                                  ('dict_domains', 'domain'), ('dict_hashes', 'content_hash')):
+                conn.execute(f"""
+                    INSERT OR IGNORE INTO {table} ({column})
+                    SELECT DISTINCT {column} FROM serp_features WHERE {column} IS NOT NULL
+                """)
+            conn.execute("""
+                INSERT OR IGNORE INTO dict_texts (text_hash, text)
+                SELECT text_hash(text), text FROM (
+                    SELECT title AS text FROM serp_features WHERE title IS NOT NULL
+                    UNION
+                    SELECT snippet FROM serp_features WHERE snippet IS NOT NULL
+                )
+            """)
+            migrated = conn.execute("""
+                INSERT INTO serp_feature_rows 
+                (id, project_id, keyword_id, result_type, position, url_id, title_id, snippet_id, domain_id,
+                 checked_at, content_hash_id, parser_version, run_id)
+                SELECT f.id, f.project_id, k.id, f.result_type, f.position, u.id, t.id, s.id, d.id,
+                       f.checked_at, h.id, f.parser_version, f.run_id
+                FROM serp_features f
+                JOIN dict_keywords k ON k.keyword = f.keyword
+                LEFT JOIN dict_urls u ON u.url = f.url
+                LEFT JOIN dict_texts t ON t.text_hash = text_hash(f.title)
+                LEFT JOIN dict_texts s ON s.text_hash = text_hash(f.snippet)
+                LEFT JOIN dict_domains d ON d.domain = f.domain
+                LEFT JOIN dict_hashes h ON h.content_hash = f.content_hash
+            """).rowcount
+            conn.execute("DROP TABLE serp_features")
+            print(f"🗜️ serp_features convertita nel formato a dizionari: {migrated} righe")
+        
+        conn.execute("""
+            CREATE VIEW IF NOT EXISTS serp_features AS
+            SELECT f.id, f.project_id, k.keyword, f.result_type, f.position, u.url,
+                   t.text AS title, s.text AS snippet, d.domain, f.checked_at,
+                   h.content_hash, f.parser_version, f.run_id
+            FROM serp_feature_rows f
+            JOIN dict_keywords k ON k.id = f.keyword_id
+            LEFT JOIN dict_urls u ON u.id = f.url_id
+            LEFT JOIN dict_texts t ON t.id = f.title_id
+            LEFT JOIN dict_texts s ON s.id = f.snippet_id
+            LEFT JOIN dict_domains d ON d.id = f.domain_id
+            LEFT JOIN dict_hashes h ON h.id = f.content_hash_id
+        """)
+    
     def get_serp_features(self, project_id: int, keyword: str = None, 
-                         result_type: str = None) -> List[Dict]:
-        """Recupera SERP features per un progetto"""
-        with sqlite3.connect(self.db_path) as conn:
+                         result_type: str = None, limit: int = None, cursor: str = None) -> List[Dict]:
+        """
+        Recupera SERP features per un progetto, dal check più recente (nello stesso check
+        in ordine di inserimento, cioè di posizione). limit/cursor paginano (vedi get_serp_features_page).
+        """
+        after = decode_cursor(cursor, 2)
+        
+        with self.connections.reader() as conn:
             conn.row_factory = sqlite3.Row
             
             query = "SELECT * FROM serp_features WHERE project_id = ?"
@@ -414,14 +1494,31 @@ class Database:
                 query += " AND result_type = ?"
                 params.append(result_type)
             
-            query += " ORDER BY checked_at DESC, position"
+            # Cursore e ordinamento seguono idx_feature_rows_project_date: ogni pagina parte dal cursore
+            if after is not None:
+                query += " AND checked_at <= ? AND (checked_at < ? OR id > ?)"
+                params += [after[0], after[0], after[1]]
             
-            cursor = conn.execute(query, params)
-            return [dict(row) for row in cursor.fetchall()]
+            query += " ORDER BY checked_at DESC, id"
+            if limit:
+                query += " LIMIT ?"
+                params.append(limit)
+            
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
+    
+    def get_serp_features_page(self, project_id: int, keyword: str = None, result_type: str = None,
+                               limit: int = 500, cursor: str = None) -> Dict:
+        """Una pagina di SERP features: items e next_cursor (None all'ultima pagina)"""
+        items = self.get_serp_features(project_id, keyword, result_type, limit + 1, cursor)
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1]['checked_at'], items[-1]['id'])
+        return {'items': items, 'next_cursor': next_cursor}
     
     def delete_project(self, project_id: int):
         """Disattiva un progetto (soft delete)"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.writer() as conn:
             conn.execute(
                 "UPDATE projects SET active = 0 WHERE id = ?",
                 (project_id,)
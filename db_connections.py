@@ -0,0 +1,130 @@
+"""
+Gestione connessioni SQLite persistenti
+Un'unica connessione di scrittura serializzata e un piccolo pool di lettura, in modalità WAL:
+le pagine della dashboard leggono mentre lo scheduler scrive, senza riaprire il database a ogni chiamata
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+DEFAULT_READERS = int(os.getenv('RANK_TRACKER_DB_READERS', '4'))
+DEFAULT_CACHE_MB = int(os.getenv('RANK_TRACKER_DB_CACHE_MB', '64'))
+DEFAULT_MMAP_MB = int(os.getenv('RANK_TRACKER_DB_MMAP_MB', '256'))
+
+# Statement preparati mantenuti in cache da ogni connessione (riusati tra chiamate)
+CACHED_STATEMENTS = 256
+
+
+class ConnectionManager:
+    """Connessione writer long-lived + pool di reader, con PRAGMA ottimizzati"""
+
+    def __init__(self, db_path: str,
+                 readers: int = DEFAULT_READERS,
+                 cache_mb: int = DEFAULT_CACHE_MB,
+                 mmap_mb: int = DEFAULT_MMAP_MB,
+                 busy_timeout_ms: int = 5000):
+        self.db_path = db_path
+        self.max_readers = max(1, readers)
+        self.cache_mb = cache_mb
+        self.mmap_mb = mmap_mb
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self._idle_readers: List[sqlite3.Connection] = []  # LIFO: la più recente resta calda
+        self._all_readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._reader_returned = threading.Condition(self._readers_lock)
+        self.reads = 0
+        self.writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,  # Ogni connessione è usata da un solo thread alla volta
+            cached_statements=CACHED_STATEMENTS
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")  # Sicuro in WAL, niente fsync a ogni commit
+        conn.execute(f"PRAGMA cache_size = -{self.cache_mb * 1024}")
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_mb * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Connessione di scrittura: una transazione alla volta, commit all'uscita o rollback su errore"""
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.row_factory = None
+                self.writes += 1
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Connessione di sola lettura dal pool (creata al bisogno fino a max_readers)"""
+        conn = self._checkout_reader()
+        try:
+            yield conn
+        finally:
+            conn.row_factory = None
+            if conn.in_transaction:
+                conn.rollback()
+            self.reads += 1
+            self._return_reader(conn)
+
+    def _checkout_reader(self) -> sqlite3.Connection:
+        with self._reader_returned:
+            while True:
+                if self._idle_readers:
+                    return self._idle_readers.pop()
+                if len(self._all_readers) < self.max_readers:
+                    conn = self._connect()
+                    self._all_readers.append(conn)
+                    return conn
+                # Pool esaurito: attende che un reader venga restituito (o che close() liberi il pool)
+                self._reader_returned.wait()
+
+    def _return_reader(self, conn: sqlite3.Connection):
+        with self._reader_returned:
+            if any(conn is pooled for pooled in self._all_readers):
+                self._idle_readers.append(conn)
+            else:
+                # Preso prima di un close(): non appartiene più al pool, va chiuso
+                conn.close()
+            self._reader_returned.notify()
+
+    def close(self):
+        """Chiude tutte le connessioni (vengono riaperte al prossimo utilizzo)"""
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+        # I reader in uso restano aperti fino alla restituzione, poi vengono chiusi invece che riusati
+        with self._reader_returned:
+            for conn in self._idle_readers:
+                conn.close()
+            self._idle_readers = []
+            self._all_readers = []
+            self._reader_returned.notify_all()
+
+    def stats(self) -> Dict:
+        return {
+            'db_path': self.db_path,
+            'readers_open': len(self._all_readers),
+            'readers_idle': len(self._idle_readers),
+            'max_readers': self.max_readers,
+            'reads': self.reads,
+            'writes': self.writes
+        }
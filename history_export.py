@@ -0,0 +1,383 @@
+"""
+Export colonnare dello storico per analisi
+Legge ranking_results e serp_features a blocchi di id e scrive file Parquet (o CSV gzip, anche
+come ripiego se pyarrow non è installato) partizionati per progetto e mese: <dir>/<tabella>/project_id=3/month=2024-05/part-*.parquet.
+Ogni export riparte dall'ultimo id esportato (watermark per destinazione) e la memoria resta limitata
+dal numero di righe in buffer. I file già scritti non vengono riscritti, tranne le partizioni riscritte
+da una ri-analisi (righe cancellate e reinserite con id nuovi, registrate in export_rewrites): queste
+vengono riesportate per intero e i loro file precedenti sostituiti, senza righe duplicate
+"""
+
+import csv
+import glob
+import gzip
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Dipendenza opzionale: senza pyarrow è disponibile solo il formato csv
+    pa = None
+    pq = None
+
+EXPORT_DIR = os.getenv('RANK_TRACKER_EXPORT_DIR', '')
+EXPORT_FORMAT = os.getenv('RANK_TRACKER_EXPORT_FORMAT', 'parquet')
+EXPORT_FORMATS = ('parquet', 'csv')
+
+# Righe lette per query, righe per row group e massimo di righe in memoria tra tutte le partizioni
+DEFAULT_BATCH_ROWS = 10000
+ROW_GROUP_ROWS = 100000
+MAX_BUFFERED_ROWS = 250000
+
+# File aperti contemporaneamente (il primo export di uno storico lungo tocca progetti x mesi partizioni)
+MAX_OPEN_FILES = 32
+
+# Tabella esportata -> (tabella con gli id del watermark, sorgente delle righe)
+EXPORT_SOURCES = {
+    'ranking_results': ('ranking_results', 'ranking_results'),
+    'serp_features': ('serp_feature_rows', 'serp_features'),
+}
+
+INTEGER_COLUMNS = {'id', 'project_id', 'position', 'run_id'}
+TIMESTAMP_COLUMNS = {'checked_at'}
+
+# Colonne già nel percorso della partizione (project_id=N): nei file Parquet andrebbero in conflitto
+# con il tipo dedotto dai lettori hive (pyarrow, pandas, DuckDB)
+PARTITION_COLUMNS = {'project_id'}
+
+
+def init_export_tables(conn):
+    """
+    Watermark degli export (ultimo id esportato per destinazione e tabella) e partizioni riscritte:
+    una riga per (progetto, mese), con id che avanza a ogni nuova riscrittura
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS export_state (
+            destination TEXT NOT NULL,
+            source TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            exported_at TIMESTAMP,
+            PRIMARY KEY (destination, source)
+        ) WITHOUT ROWID
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS export_rewrites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            UNIQUE (project_id, month)
+        )
+    """)
+
+
+def record_rewrites(conn, partitions: Iterable[Tuple[int, str]]):
+    """Segna (progetto, mese) come da riesportare: le righe della partizione hanno cambiato id"""
+    conn.executemany(
+        "INSERT OR REPLACE INTO export_rewrites (project_id, month) VALUES (?, ?)", set(partitions)
+    )
+
+
+def rewrites_key(name: str) -> str:
+    """Chiave in export_state dell'ultima riscrittura già riesportata per la tabella"""
+    return f"{name}:rewrites"
+
+
+def month_bounds(month: str) -> Tuple[str, str]:
+    """Intervallo [inizio, fine) di checked_at per un mese YYYY-MM"""
+    year, number = (int(part) for part in month.split('-'))
+    year, number = (year + 1, 1) if number == 12 else (year, number + 1)
+    return month, f"{year:04d}-{number:02d}"
+
+
+def partition_of(row: Tuple, project_index: int, checked_index: int) -> Tuple[int, str]:
+    """(progetto, mese YYYY-MM) di una riga"""
+    checked_at = row[checked_index] or ''
+    return row[project_index], checked_at[:7] or 'unknown'
+
+
+def _arrow_type(column: str):
+    if column in INTEGER_COLUMNS:
+        return pa.int64()
+    if column in TIMESTAMP_COLUMNS:
+        return pa.timestamp('us')
+    return pa.string()
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+class _ParquetPartitionFile:
+    """
+    File Parquet di una partizione: ogni flush è un row group, colonne stringa con dizionario.
+    Le colonne di partizione restano solo nel percorso
+    """
+
+    extension = 'parquet'
+
+    def __init__(self, path: str, columns: List[str]):
+        self.indexes = [i for i, column in enumerate(columns) if column not in PARTITION_COLUMNS]
+        self.columns = [columns[i] for i in self.indexes]
+        self.schema = pa.schema([(column, _arrow_type(column)) for column in self.columns])
+        self._writer = pq.ParquetWriter(path, self.schema, compression='zstd', use_dictionary=True)
+
+    def write(self, rows: List[Tuple]):
+        arrays = []
+        values_by_column = list(zip(*rows))
+        for i, column in enumerate(self.columns):
+            values = values_by_column[self.indexes[i]]
+            if column in TIMESTAMP_COLUMNS:
+                values = [_parse_timestamp(value) for value in values]
+            arrays.append(pa.array(values, type=self.schema.field(i).type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema), row_group_size=len(rows))
+
+    def close(self):
+        self._writer.close()
+
+
+class _CsvPartitionFile:
+    """Alternativa senza dipendenze: CSV gzip con intestazione"""
+
+    extension = 'csv.gz'
+
+    def __init__(self, path: str, columns: List[str]):
+        self._file = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows: List[Tuple]):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class HistoryExporter:
+    """Export incrementale e partizionato di ranking_results e serp_features"""
+
+    def __init__(self, db, out_dir: str = EXPORT_DIR, format: str = EXPORT_FORMAT,
+                 batch_rows: int = DEFAULT_BATCH_ROWS, row_group_rows: int = ROW_GROUP_ROWS,
+                 max_buffered_rows: int = MAX_BUFFERED_ROWS, max_open_files: int = MAX_OPEN_FILES):
+        if not out_dir:
+            raise ValueError("Directory di export non configurata (RANK_TRACKER_EXPORT_DIR)")
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Formato non supportato: {format} (usa {', '.join(EXPORT_FORMATS)})")
+        if format == 'parquet' and pa is None:
+            # L'export schedulato non deve impedire l'avvio dell'app: si ripiega sul CSV
+            print("⚠️ pyarrow non installato: export in formato csv (pip install pyarrow per il Parquet)")
+            format = 'csv'
+
+        self.db = db
+        self.out_dir = out_dir
+        self.destination = os.path.abspath(out_dir)
+        self.format = format
+        self.batch_rows = max(1, batch_rows)
+        self.row_group_rows = max(1, row_group_rows)
+        self.max_buffered_rows = max(self.row_group_rows, max_buffered_rows)
+        self.max_open_files = max(1, max_open_files)
+        self._file_class = _ParquetPartitionFile if format == 'parquet' else _CsvPartitionFile
+
+    def watermarks(self) -> Dict[str, int]:
+        """Ultimo id esportato per tabella verso questa destinazione"""
+        with self.db.connections.reader() as conn:
+            rows = conn.execute(
+                "SELECT source, value FROM export_state WHERE destination = ?", (self.destination,)
+            ).fetchall()
+        return {name: dict(rows).get(name, 0) for name in EXPORT_SOURCES}
+
+    def reset(self, tables: Iterable[str] = None):
+        """Azzera i watermark: il prossimo export riparte dall'inizio (i file esistenti vanno rimossi a mano)"""
+        with self.db.connections.writer() as conn:
+            for name in tables or EXPORT_SOURCES:
+                conn.executemany("DELETE FROM export_state WHERE destination = ? AND source = ?",
+                                 [(self.destination, name), (self.destination, rewrites_key(name))])
+
+    def run(self, tables: Iterable[str] = None) -> Dict:
+        """Esporta le righe nuove di ogni tabella; ritorna righe e file scritti per tabella"""
+        start = time.time()
+        report = {'files': 0, 'rows': 0}
+        for name in tables or EXPORT_SOURCES:
+            table_report = self.export_table(name)
+            report[name] = table_report['rows']
+            report['files'] += table_report['files']
+            report['rows'] += table_report['rows']
+        report['seconds'] = time.time() - start
+        return report
+
+    def export_table(self, name: str) -> Dict:
+        """
+        Esporta le righe con id tra il watermark e il massimo id attuale; le partizioni riscritte dopo
+        l'ultimo export vengono prima riesportate per intero. I watermark avanzano solo dopo che tutti
+        i file sono stati chiusi: un export interrotto viene ripetuto per intero
+        """
+        if name not in EXPORT_SOURCES:
+            raise ValueError(f"Tabella non esportabile: {name}")
+        id_table, source = EXPORT_SOURCES[name]
+        watermark = self.watermarks()[name]
+
+        with self.db.connections.reader() as conn:
+            rewrite_watermark = (conn.execute(
+                "SELECT value FROM export_state WHERE destination = ? AND source = ?",
+                (self.destination, rewrites_key(name))
+            ).fetchone() or (0,))[0]
+            # Le righe salvate durante l'export restano per il prossimo giro
+            upper = max(conn.execute(f"SELECT MAX(id) FROM {id_table}").fetchone()[0] or 0, watermark)
+            rewrite_upper = conn.execute("SELECT COALESCE(MAX(id), 0) FROM export_rewrites").fetchone()[0]
+            rebuild = set(conn.execute(
+                "SELECT project_id, month FROM export_rewrites WHERE id > ? AND id <= ?",
+                (rewrite_watermark, rewrite_upper)
+            ).fetchall())
+        if upper <= watermark and not rebuild:
+            return {'rows': 0, 'files': 0}
+
+        run = _ExportRun(self, name, watermark, rebuild)
+        try:
+            # Partizioni riscritte: tutte le righe fino a upper, in file che sostituiscono i precedenti
+            for project_id, month in sorted(rebuild):
+                start, end = month_bounds(month)
+                last = 0
+                while True:
+                    with self.db.connections.reader() as conn:
+                        cursor = conn.execute(f"""
+                            SELECT * FROM {source}
+                            WHERE project_id = ? AND checked_at >= ? AND checked_at < ? AND id > ? AND id <= ?
+                            ORDER BY id LIMIT ?
+                        """, (project_id, start, end, last, upper, self.batch_rows))
+                        columns = [d[0] for d in cursor.description]
+                        rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    run.add(columns, rows, rebuilding=True)
+                    last = rows[-1][columns.index('id')]
+
+            last = watermark
+            while last < upper:
+                with self.db.connections.reader() as conn:
+                    cursor = conn.execute(
+                        f"SELECT * FROM {source} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                        (last, upper, self.batch_rows)
+                    )
+                    columns = [d[0] for d in cursor.description]
+                    rows = cursor.fetchall()
+                if not rows:
+                    break
+                run.add(columns, rows)
+                last = rows[-1][columns.index('id')]
+            run.finish()
+        except BaseException:
+            run.abort()
+            raise
+
+        with self.db.connections.writer() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO export_state (destination, source, value, exported_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            """, [(self.destination, name, upper), (self.destination, rewrites_key(name), rewrite_upper)])
+        return {'rows': run.rows, 'files': len(run.paths), 'rewritten_partitions': len(rebuild)}
+
+
+class _ExportRun:
+    """Buffer per partizione e file aperti di un singolo export (file .tmp rinominati alla fine)"""
+
+    def __init__(self, exporter: HistoryExporter, table: str, watermark: int,
+                 rebuild: Set[Tuple[int, str]] = frozenset()):
+        self.exporter = exporter
+        self.table = table
+        # Partizioni riesportate per intero: i loro file attuali vengono rimossi a fine export
+        self.rebuild = rebuild
+        self.replaced = [path for key in rebuild for path in glob.glob(os.path.join(self._directory(key), 'part-*'))
+                         if not path.endswith('.tmp')]
+        # Il primo id del giro rende unici i nomi dei file tra un export e l'altro
+        self.prefix = f"part-{watermark + 1:012d}"
+        self.columns: List[str] = []
+        self.buffers: Dict[Tuple[int, str], List[Tuple]] = {}
+        self.buffered = 0
+        self.open_files: "OrderedDict[Tuple[int, str], object]" = OrderedDict()
+        self.sequence: Dict[Tuple[int, str], int] = {}
+        self.paths: List[str] = []
+        self.rows = 0
+
+    def add(self, columns: List[str], rows: List[Tuple], rebuilding: bool = False):
+        """Aggiunge righe ai buffer; quelle incrementali delle partizioni riesportate sono già incluse"""
+        self.columns = columns
+        project_index = columns.index('project_id')
+        checked_index = columns.index('checked_at')
+        added = 0
+        for row in rows:
+            key = partition_of(row, project_index, checked_index)
+            if not rebuilding and key in self.rebuild:
+                continue
+            self.buffers.setdefault(key, []).append(row)
+            added += 1
+        self.buffered += added
+        self.rows += added
+
+        for key in [key for key, buffer in self.buffers.items() if len(buffer) >= self.exporter.row_group_rows]:
+            self._flush(key)
+        # Oltre il limite di memoria si scrive la partizione più grande (row group più piccolo)
+        while self.buffered > self.exporter.max_buffered_rows:
+            self._flush(max(self.buffers, key=lambda key: len(self.buffers[key])))
+
+    def finish(self):
+        for key in list(self.buffers):
+            self._flush(key)
+        for key in list(self.open_files):
+            self._close(key)
+        for path in self.paths:
+            os.replace(path + '.tmp', path)
+        written = set(self.paths)
+        for path in self.replaced:
+            if path not in written:
+                os.remove(path)
+
+    def abort(self):
+        for partition_file in self.open_files.values():
+            try:
+                partition_file.close()
+            except Exception:
+                pass
+        self.open_files.clear()
+        for path in self.paths:
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+
+    def _flush(self, key: Tuple[int, str]):
+        rows = self.buffers.pop(key)
+        self.buffered -= len(rows)
+        self._file(key).write(rows)
+
+    def _file(self, key: Tuple[int, str]):
+        if key in self.open_files:
+            self.open_files.move_to_end(key)
+            return self.open_files[key]
+
+        if len(self.open_files) >= self.exporter.max_open_files:
+            self._close(next(iter(self.open_files)))
+
+        directory = self._directory(key)
+        os.makedirs(directory, exist_ok=True)
+        # Una partizione chiusa per limite di file aperti continua in un nuovo file
+        sequence = self.sequence.get(key, 0)
+        self.sequence[key] = sequence + 1
+        suffix = f"-{sequence}" if sequence else ''
+        file_class = self.exporter._file_class
+        path = os.path.join(directory, f"{self.prefix}{suffix}.{file_class.extension}")
+        self.paths.append(path)
+
+        partition_file = file_class(path + '.tmp', self.columns)
+        self.open_files[key] = partition_file
+        return partition_file
+
+    def _directory(self, key: Tuple[int, str]) -> str:
+        project_id, month = key
+        return os.path.join(self.exporter.out_dir, self.table, f"project_id={project_id}", f"month={month}")
+
+    def _close(self, key: Tuple[int, str]):
+        self.open_files.pop(key).close()
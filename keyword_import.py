@@ -0,0 +1,73 @@
+"""
+Import di keywords da file CSV/TXT
+Lettura in streaming (una riga alla volta) e normalizzazione: i file da 100k+ keywords vengono
+inseriti a blocchi senza caricarli interamente in memoria
+"""
+
+import csv
+import io
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, Optional, TextIO
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Oltre questa lunghezza la riga non è una keyword (es. file sbagliato)
+MAX_KEYWORD_LENGTH = 256
+
+# Intestazioni CSV riconosciute per la colonna delle keywords
+KEYWORD_COLUMNS = ('keyword', 'keywords', 'query', 'kw')
+
+
+def normalize_keyword(keyword: str) -> Optional[str]:
+    """Keyword in forma canonica (minuscola, spazi singoli) o None se non valida"""
+    if keyword is None:
+        return None
+    keyword = ' '.join(keyword.split()).lower()
+    if not keyword or len(keyword) > MAX_KEYWORD_LENGTH:
+        return None
+    return keyword
+
+
+def iter_keywords(lines: TextIO, filename: str = '') -> Iterator[str]:
+    """Keywords grezze di un file di testo: una per riga, o la colonna keyword di un CSV"""
+    if not filename.lower().endswith('.csv'):
+        for line in lines:
+            yield line.rstrip('\r\n')
+        return
+
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    column = 0
+    names = [name.strip().lower() for name in header]
+    matches = [i for i, name in enumerate(names) if name in KEYWORD_COLUMNS]
+    if matches:
+        column = matches[0]
+    elif header:
+        # Nessuna intestazione riconosciuta: anche la prima riga è una keyword
+        yield header[0]
+
+    for row in reader:
+        yield row[column] if len(row) > column else ''
+
+
+def iter_keyword_file(binary_file: BinaryIO, filename: str = '') -> Iterator[str]:
+    """Come iter_keywords per un file binario (upload o file aperto in 'rb'), con BOM UTF-8 gestito"""
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        yield from iter_keywords(text, filename)
+    finally:
+        # Il file resta di chi l'ha aperto
+        text.detach()
+
+
+def chunked(items: Iterable, size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List]:
+    """Blocchi di al più size elementi, senza materializzare l'intera sequenza"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Comandi di manutenzione da riga di comando
+
+Esempi:
+    python manage.py reanalyze --project 3 --workers 8
+    python manage.py reanalyze --all --only-outdated
+    python manage.py backfill-latest --project 3
+    python manage.py compact-history --raw-days 90
+    python manage.py import-keywords --project 3 keywords.csv
+    python manage.py export-history --out exports/
+"""
+
+import argparse
+import sys
+import time
+
+from database import Database
+from history_export import DEFAULT_BATCH_ROWS, EXPORT_DIR, EXPORT_FORMAT, EXPORT_FORMATS, EXPORT_SOURCES
+from keyword_import import DEFAULT_CHUNK_SIZE
+from retention import DAILY_RETENTION_DAYS, RAW_RETENTION_DAYS
+from serp_archive import DEFAULT_ARCHIVE_DIR
+
+
+def cmd_reanalyze(db: Database, args):
+    """Ri-analizza le SERP archiviate senza nuove richieste a Google"""
+    from reanalysis import ReanalysisEngine
+
+    engine = ReanalysisEngine(db, archive_dir=args.archive_dir, workers=args.workers)
+    if args.all:
+        reports = engine.run_all(since=args.since, only_outdated=args.only_outdated)
+    else:
+        reports = [engine.run(project_id, since=args.since, only_outdated=args.only_outdated)
+                   for project_id in args.project]
+
+    total_serps = sum(r['serps'] for r in reports)
+    total_seconds = sum(r['seconds'] for r in reports)
+    print(f"🏁 Ri-analisi completata: {total_serps} SERP in {total_seconds:.1f}s")
+
+
+def cmd_backfill_latest(db: Database, args):
+    """Ricostruisce latest_positions dallo storico di ranking_results"""
+    projects = args.project or [None]
+    total = sum(db.rebuild_latest_positions(project_id) for project_id in projects)
+    scope = ', '.join(str(p) for p in args.project) if args.project else 'tutti i progetti'
+    print(f"📌 latest_positions ricostruita ({scope}): {total} keywords")
+
+
+def cmd_compact_history(db: Database, args):
+    """Aggrega lo storico nei rollup e applica le finestre di retention"""
+    from retention import RetentionManager
+
+    report = RetentionManager(db, raw_days=args.raw_days, daily_days=args.daily_days).run()
+    print(f"🗄️ Storico compattato: {report['ranking_rows']} risultati e {report['feature_rows']} features "
+          f"aggregati ({report['days']} giorni, {report['weeks']} settimane), "
+          f"rimossi {report['pruned_results']} risultati, {report['pruned_features']} features "
+          f"e {report['pruned_daily']} rollup giornalieri in {report['seconds']:.1f}s")
+
+
+def cmd_import_keywords(db: Database, args):
+    """Importa keywords da file CSV/TXT in streaming, saltando i duplicati"""
+    from keyword_import import iter_keyword_file
+
+    if not db.get_project(args.project):
+        print(f"❌ Progetto {args.project} non trovato")
+        return 1
+
+    start = time.time()
+    with open(args.file, 'rb') as f:
+        report = db.import_keywords(args.project, iter_keyword_file(f, args.file), chunk_size=args.chunk_size)
+    seconds = time.time() - start
+
+    total = report['inserted'] + report['skipped'] + report['invalid']
+    print(f"🔑 Import completato: {report['inserted']} inserite, {report['skipped']} duplicate saltate, "
+          f"{report['invalid']} non valide ({total / max(seconds, 1e-6):.0f} keywords/s)")
+
+
+def cmd_export_history(db: Database, args):
+    """Esporta lo storico nuovo in file colonnari partizionati per progetto e mese"""
+    from history_export import HistoryExporter
+
+    exporter = HistoryExporter(db, out_dir=args.out, format=args.format, batch_rows=args.batch_rows)
+    if args.full:
+        exporter.reset(args.table)
+    report = exporter.run(args.table)
+    tables = ', '.join(f"{name}: {report[name]}" for name in (args.table or EXPORT_SOURCES))
+    print(f"📦 Export completato in {args.out}: {report['rows']} righe ({tables}) in {report['files']} file, "
+          f"{report['rows'] / max(report['seconds'], 1e-6):.0f} righe/s")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Manutenzione Crawl4AI Rank Tracker")
+    parser.add_argument('--db', default='rank_tracker.db', help="Percorso del database SQLite")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    reanalyze = subparsers.add_parser('reanalyze', help="Ri-analizza le SERP archiviate con il parser attuale")
+    target = reanalyze.add_mutually_exclusive_group(required=True)
+    target.add_argument('--project', type=int, action='append', help="ID progetto (ripetibile)")
+    target.add_argument('--all', action='store_true', help="Tutti i progetti attivi")
+    reanalyze.add_argument('--since', help="Solo check dalla data indicata (YYYY-MM-DD)")
+    reanalyze.add_argument('--workers', type=int, help="Numero di processi worker")
+    reanalyze.add_argument('--only-outdated', action='store_true',
+                           help="Salta le SERP già analizzate con la versione corrente del parser")
+    reanalyze.add_argument('--archive-dir', default=DEFAULT_ARCHIVE_DIR, help="Directory dell'archivio SERP")
+    reanalyze.set_defaults(func=cmd_reanalyze)
+
+    backfill = subparsers.add_parser('backfill-latest',
+                                     help="Ricostruisce le posizioni correnti/precedenti dallo storico")
+    backfill.add_argument('--project', type=int, action='append', help="ID progetto (default: tutti)")
+    backfill.set_defaults(func=cmd_backfill_latest)
+
+    compact = subparsers.add_parser('compact-history',
+                                    help="Aggrega lo storico in rollup giornalieri/settimanali e pulisce le righe grezze")
+    compact.add_argument('--raw-days', type=int, default=RAW_RETENTION_DAYS,
+                         help="Giorni di storico grezzo da mantenere (0 = tutti)")
+    compact.add_argument('--daily-days', type=int, default=DAILY_RETENTION_DAYS,
+                         help="Giorni di rollup giornalieri da mantenere (0 = tutti)")
+    compact.set_defaults(func=cmd_compact_history)
+
+    import_kw = subparsers.add_parser('import-keywords', help="Importa keywords da file CSV/TXT (streaming)")
+    import_kw.add_argument('--project', type=int, required=True, help="ID progetto")
+    import_kw.add_argument('file', help="File .txt (una keyword per riga) o .csv (colonna keyword o prima colonna)")
+    import_kw.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Keywords per transazione")
+    import_kw.set_defaults(func=cmd_import_keywords)
+
+    export = subparsers.add_parser('export-history',
+                                   help="Export incrementale dello storico in Parquet/CSV partizionati")
+    export.add_argument('--out', default=EXPORT_DIR or 'exports', help="Directory di destinazione")
+    export.add_argument('--format', choices=EXPORT_FORMATS, default=EXPORT_FORMAT,
+                        help="parquet (richiede pyarrow) o csv (gzip)")
+    export.add_argument('--table', choices=list(EXPORT_SOURCES), action='append',
+                        help="Tabella da esportare (ripetibile, default: tutte)")
+    export.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS, help="Righe lette per query")
+    export.add_argument('--full', action='store_true',
+                        help="Ignora il watermark e riesporta tutto lo storico")
+    export.set_defaults(func=cmd_export_history)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = Database(args.db)
+    return args.func(db, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Parsing SERP fuori dall'event loop
+Process pool limitato con API asincrona: l'analisi dell'HTML procede in parallelo ai fetch
+senza bloccare FastAPI e lo scheduler
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from serp_analyzer import SERPAnalyzer
+
+DEFAULT_PARSE_WORKERS = int(os.getenv('RANK_TRACKER_PARSE_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Campi di un risultato, nell'ordine usato dalla forma compatta
+RESULT_FIELDS = ('position', 'domain', 'url', 'title', 'snippet', 'result_type')
+
+# Analyzer riusato all'interno di ogni processo worker
+_worker_analyzer = None
+
+
+def compact_analysis(analysis: Dict) -> Dict[str, List[Tuple]]:
+    """Riduce l'analisi a tuple di campi fissi: più piccola da serializzare tra processi"""
+    return {
+        result_type: [tuple(result.get(field) for field in RESULT_FIELDS) for result in results]
+        for result_type, results in analysis.items()
+        if isinstance(results, list)
+    }
+
+
+def expand_analysis(compact: Dict[str, List[Tuple]]) -> Dict:
+    """Ricostruisce il formato standard di SERPAnalyzer.analyze_complete_serp"""
+    analysis = {
+        result_type: [dict(zip(RESULT_FIELDS, values)) for values in results]
+        for result_type, results in compact.items()
+    }
+    analysis['target_positions'] = {}
+    return analysis
+
+
+def _parse_serp(html: str, result_types: Optional[Tuple[str, ...]] = None) -> Dict[str, List[Tuple]]:
+    """Worker: estrae i tipi richiesti senza dominio target e restituisce la forma compatta"""
+    global _worker_analyzer
+
+    if _worker_analyzer is None:
+        _worker_analyzer = SERPAnalyzer()
+
+    return compact_analysis(_worker_analyzer.analyze_complete_serp(html, result_types=result_types))
+
+
+class ParseExecutor:
+    """Stadio di parsing con process pool limitato e submit asincrono"""
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.max_workers = DEFAULT_PARSE_WORKERS if max_workers is None else max_workers
+        # Oltre questo numero di HTML in coda i fetch attendono (memoria limitata)
+        self.max_pending = max_pending or max(1, self.max_workers) * 4
+        self._executor = None
+        self._semaphore = None
+        self.parsed = 0
+        self.pending = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def analyze(self, html: str, result_types: Iterable[str] = None) -> Dict:
+        """Analizza l'HTML in un processo separato (o inline se max_workers è 0)"""
+        if result_types is not None:
+            result_types = tuple(result_types)
+
+        if self.max_workers <= 0:
+            return expand_analysis(_parse_serp(html, result_types))
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+
+        async with self._semaphore:
+            self.pending += 1
+            try:
+                loop = asyncio.get_running_loop()
+                compact = await loop.run_in_executor(self._get_executor(), _parse_serp, html, result_types)
+            finally:
+                self.pending -= 1
+
+        self.parsed += 1
+        return expand_analysis(compact)
+
+    def shutdown(self):
+        """Chiude il process pool (viene ricreato al prossimo utilizzo)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._semaphore = None
+
+    def stats(self) -> Dict:
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'pending': self.pending,
+            'parsed': self.parsed
+        }
@@ -1,54 +1,47 @@
 import asyncio
-import random
 from urllib.parse import quote_plus
 from fake_useragent import UserAgent
-from crawl4ai import AsyncWebCrawler
 import re
 import time
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from localization import GoogleLocalization
-from serp_analyzer import SERPAnalyzer
+from serp_analyzer import SERPAnalyzer, PARSER_VERSION, filter_by_tracking_config, result_types_for_tracking
+from browser_pool import BrowserPool
+from rate_limiter import RateLimiter
+from crawler_lifecycle import CrawlerLifecycle
+from serp_coalescer import SERPFetchCoalescer
+from serp_archive import SERPArchive
+from parse_executor import ParseExecutor
 
 class RankTracker:
-    def __init__(self):
+    def __init__(self, pool_size: Optional[int] = None, archive: Optional[SERPArchive] = None):
         self.ua = UserAgent()
-        self.crawler = None
-        self.rate_limit_delay = 10  # secondi tra requests - conservativo per evitare CAPTCHA
         self.localizer = GoogleLocalization()
         self.serp_analyzer = SERPAnalyzer()
+        # Pool di contesti browser isolati (dimensione configurabile per deployment)
+        self.pool = BrowserPool(size=pool_size)
+        # Il pool resta caldo tra job diversi e si chiude solo dopo un periodo di inattività
+        self.lifecycle = CrawlerLifecycle(self.pool)
+        # Una sola SERP per URL localizzata, condivisa tra progetti e domini
+        self.coalescer = SERPFetchCoalescer()
+        # Archivio HTML grezzo: read-through davanti al crawler e base per le ri-analisi
+        self.archive = archive or SERPArchive()
+        # Parsing HTML in un process pool, per non bloccare l'event loop
+        self.parse_executor = ParseExecutor()
+        # Token bucket condivisi per localizzazione e identità di uscita
+        self.rate_limiter = RateLimiter()
         
+    @property
+    def crawler(self):
+        """Crawler corrente del primo contesto, per gli script che usano direttamente tracker.crawler"""
+        return self.pool.contexts[0].crawler if self.pool.contexts else None
+    
     async def init_crawler(self):
-        if not self.crawler:
-            # Browser mode avanzato per evitare detection
-            self.crawler = AsyncWebCrawler(
-                browser_type="chromium",
-                headless=True,
-                verbose=False,
-                # Configurazione browser realistica
-                viewport_width=1920,
-                viewport_height=1080,
-                # Simula comportamento umano
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                # Anti-detection features
-                accept_downloads=False,
-                override_navigator=True,
-                mask_fingerprint=True,
-                simulate_user=True,
-                magic=True  # Attiva tutte le feature anti-detection
-            )
-            print("🌐 Browser mode inizializzato con anti-detection")
+        await self.pool.start()
     
     async def close_crawler(self):
-        if self.crawler:
-            try:
-                await self.crawler.aclose()
-            except AttributeError:
-                # Versioni più recenti usano close() o non richiedono chiusura esplicita
-                try:
-                    await self.crawler.close()
-                except:
-                    pass
-            self.crawler = None
+        await self.lifecycle.shutdown()
+        self.parse_executor.shutdown()
     
     def build_google_url(self, keyword: str, localization_config: Dict) -> str:
         """Usa il nuovo sistema di localizzazione"""
@@ -62,65 +55,31 @@ class RankTracker:
     
     
     async def search_keyword_complete(self, keyword: str, domain: str, localization_config: Dict, 
-                                    tracking_config: Dict = None) -> Dict:
+                                    tracking_config: Dict = None, rate_limit_config: Dict = None,
+                                    cache_config: Dict = None) -> Dict:
         """Cerca una keyword e restituisce analisi completa SERP"""
         try:
-            await self.init_crawler()
-            
             url = self.build_google_url(keyword, localization_config)
+            # Solo i tipi di risultato abilitati dalla configurazione di tracking
+            result_types = result_types_for_tracking(tracking_config)
             
-            # Headers realistici per evitare detection
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'it-IT,it;q=0.8,en-US;q=0.5',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'none',
-                'Cache-Control': 'max-age=0'
-            }
+            # Crawl e parsing condivisi con gli altri progetti che chiedono la stessa SERP
+            fetch = await self.coalescer.fetch(
+                url, lambda: self._fetch_and_analyze(url, keyword, localization_config,
+                                                     rate_limit_config, cache_config, result_types)
+            )
             
-            # Crawl della SERP con comportamento umano
-            try:
-                # Simula navigazione umana
-                result = await self.crawler.arun(
-                    url=url,
-                    headers=headers,
-                    wait_for="body",
-                    delay_before_return_html=3,  # Più tempo per caricamento completo
-                    # Comportamenti umani
-                    page_timeout=30000,  # 30 secondi timeout
-                    magic=True,  # Anti-detection avanzato
-                    # Simula scroll per caricare contenuto lazy
-                    js_code=[
-                        "window.scrollTo(0, document.body.scrollHeight/3);",
-                        "await new Promise(resolve => setTimeout(resolve, 1000));",
-                        "window.scrollTo(0, document.body.scrollHeight/2);", 
-                        "await new Promise(resolve => setTimeout(resolve, 1000));",
-                        "window.scrollTo(0, 0);"
-                    ]
-                )
-            except Exception as e:
-                # Fallback senza comportamenti avanzati
-                try:
-                    result = await self.crawler.arun(
-                        url=url, 
-                        headers=headers,
-                        wait_for="body",
-                        delay_before_return_html=2
-                    )
-                except Exception as e2:
-                    print(f"❌ Crawling fallito: {e}, {e2}")
-                    return {'error': f"Crawling failed: {e2}"}
+            if 'error' in fetch:
+                return {'error': fetch['error']}
+            shared_analysis = fetch['analysis']
             
-            if not result.success:
-                return {'error': f"Crawling failed: {result.error_message}"}
+            # SERP condivisa analizzata per un progetto con meno tipi: completa dall'archivio
+            missing_types = [t for t in result_types if t not in shared_analysis]
+            if missing_types:
+                shared_analysis = await self._extend_analysis(shared_analysis, missing_types, fetch['content_hash'])
             
-            # Analisi completa SERP
-            serp_analysis = self.serp_analyzer.analyze_complete_serp(result.html, domain)
+            # Posizioni del dominio target (post-processing specifico del progetto)
+            serp_analysis = self.serp_analyzer.analyze_for_domain(shared_analysis, domain)
             
             # Filtra risultati in base alla configurazione di tracking
             if tracking_config:
@@ -130,71 +89,147 @@ class RankTracker:
             serp_analysis['metadata'] = {
                 'keyword': keyword,
                 'url': url,
-                'crawl_time': time.time(),
-                'tracking_config': tracking_config or {}
+                'crawl_time': fetch['fetched_at'],
+                'tracking_config': tracking_config or {},
+                'parser_version': PARSER_VERSION,
+                'source': fetch['source'],
+                'content_hash': fetch['content_hash'],
+                'archive_fetch_id': fetch['fetch_id']
             }
             
-            # Rate limiting aggressivo per evitare CAPTCHA
-            delay = self.rate_limit_delay + random.uniform(2, 8)
-            print(f"⏱️ Pausa {delay:.1f}s per evitare rate limiting...")
-            await asyncio.sleep(delay)
-            
             return serp_analysis
             
         except Exception as e:
             print(f"Errore durante ricerca completa '{keyword}': {str(e)}")
             return {'error': str(e)}
     
+    async def _fetch_and_analyze(self, url: str, keyword: str, localization_config: Dict,
+                                 rate_limit_config: Dict = None, cache_config: Dict = None,
+                                 result_types: Tuple[str, ...] = None) -> Dict:
+        """
+        Scarica la SERP (o la legge dall'archivio se fresca) e la analizza senza dominio target.
+        Ritorna {'analysis': risultati per tipo, 'fetched_at', 'source', 'content_hash', 'fetch_id'}:
+        i metadati del fetch e dell'archivio restano fuori dall'analisi, che contiene solo liste di risultati
+        """
+        # Read-through: SERP archiviata abbastanza recente secondo la policy del progetto.
+        # Indice SQLite e gzip dell'archivio girano in un thread, fuori dall'event loop
+        max_age_hours = (cache_config or {}).get('max_age_hours') or 0
+        archived = await asyncio.to_thread(self.archive.get_latest, url, max_age_hours * 3600)
+        if archived:
+            html = await asyncio.to_thread(self.archive.load_html, archived['content_hash'])
+            if html is not None:
+                return {
+                    'analysis': await self.parse_executor.analyze(html, result_types),
+                    'fetched_at': archived['fetched_at'],
+                    'source': 'archive',
+                    'content_hash': archived['content_hash'],
+                    'fetch_id': archived['id']
+                }
+        
+        # Headers realistici per evitare detection
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'it-IT,it;q=0.8,en-US;q=0.5',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'Sec-Fetch-Dest': 'document',
+            'Sec-Fetch-Mode': 'navigate',
+            'Sec-Fetch-Site': 'none',
+            'Cache-Control': 'max-age=0'
+        }
+        
+        # Crawl della SERP su un contesto del pool (mantenuto caldo dal lifecycle)
+        async with self.lifecycle.session() as pool:
+            # Attende il turno nel bucket della localizzazione per l'uscita scelta prima del checkout:
+            # un contesto preso in prestito non resta fermo mentre altre localizzazioni aspettano
+            egress_id = pool.next_egress()
+            await self.rate_limiter.acquire(localization_config, egress_id, rate_limit_config)
+            async with pool.checkout(egress_id) as browser:
+                result = await self._crawl_serp(browser.crawler, url, headers)
+                if result is None or not result.success:
+                    browser.record_failure()
+                else:
+                    browser.record_success()
+        
+        if result is None:
+            return {'error': "Crawling failed: nessuna risposta dal browser"}
+        
+        if not result.success:
+            return {'error': f"Crawling failed: {result.error_message}"}
+        
+        # Archivia l'HTML grezzo prima dell'analisi
+        try:
+            entry = await asyncio.to_thread(self.archive.store, keyword, localization_config, url, result.html)
+        except Exception as e:
+            print(f"⚠️ Archiviazione SERP fallita per '{keyword}': {e}")
+            entry = {'id': None, 'content_hash': None, 'fetched_at': time.time()}
+        
+        # Analisi SERP (solo i tipi richiesti)
+        return {
+            'analysis': await self.parse_executor.analyze(result.html, result_types),
+            'fetched_at': entry['fetched_at'],
+            'source': 'crawl',
+            'content_hash': entry['content_hash'],
+            'fetch_id': entry['id']
+        }
+    
+    async def _extend_analysis(self, analysis: Dict, result_types: List[str], content_hash: Optional[str]) -> Dict:
+        """Estrae tipi di risultato mancanti dall'HTML archiviato, senza nuovo crawl"""
+        html = await asyncio.to_thread(self.archive.load_html, content_hash) if content_hash else None
+        if html is None:
+            print(f"⚠️ HTML non disponibile per estrarre {', '.join(result_types)}")
+            return analysis
+        
+        extra = await self.parse_executor.analyze(html, result_types)
+        # Aggiorna l'analisi condivisa: i progetti successivi la trovano già completa
+        for result_type in result_types:
+            analysis[result_type] = extra.get(result_type, [])
+        return analysis
+    
+    async def _crawl_serp(self, crawler, url: str, headers: Dict):
+        """Scarica la SERP con comportamento umano, con fallback semplificato"""
+        try:
+            # Simula navigazione umana
+            return await crawler.arun(
+                url=url,
+                headers=headers,
+                wait_for="body",
+                delay_before_return_html=3,  # Più tempo per caricamento completo
+                # Comportamenti umani
+                page_timeout=30000,  # 30 secondi timeout
+                magic=True,  # Anti-detection avanzato
+                # Simula scroll per caricare contenuto lazy
+                js_code=[
+                    "window.scrollTo(0, document.body.scrollHeight/3);",
+                    "await new Promise(resolve => setTimeout(resolve, 1000));",
+                    "window.scrollTo(0, document.body.scrollHeight/2);", 
+                    "await new Promise(resolve => setTimeout(resolve, 1000));",
+                    "window.scrollTo(0, 0);"
+                ]
+            )
+        except Exception as e:
+            # Fallback senza comportamenti avanzati
+            try:
+                return await crawler.arun(
+                    url=url, 
+                    headers=headers,
+                    wait_for="body",
+                    delay_before_return_html=2
+                )
+            except Exception as e2:
+                print(f"❌ Crawling fallito: {e}, {e2}")
+                return None
+    
     def _filter_by_tracking_config(self, serp_analysis: Dict, tracking_config: Dict) -> Dict:
         """Filtra risultati SERP in base alla configurazione di tracking"""
-        tracking_mode = tracking_config.get('tracking_mode', 'ORGANIC_ONLY')
-        
-        if tracking_mode == 'ORGANIC_ONLY':
-            # Mantieni solo organici
-            return {
-                'organic': serp_analysis.get('organic', []),
-                'target_positions': {
-                    k: v for k, v in serp_analysis.get('target_positions', {}).items() 
-                    if k == 'organic'
-                }
-            }
-        elif tracking_mode == 'FULL_SERP':
-            # Mantieni tutto
-            return serp_analysis
-        else:  # CUSTOM
-            # Filtra in base alle impostazioni specifiche
-            filtered = {}
-            
-            # Organici sempre inclusi
-            filtered['organic'] = serp_analysis.get('organic', [])
-            
-            # Ads se abilitati
-            if tracking_config.get('track_ads', False):
-                filtered['ads'] = serp_analysis.get('ads', [])
-            
-            # Featured snippets se abilitati
-            if tracking_config.get('track_snippets', False):
-                filtered['featured_snippets'] = serp_analysis.get('featured_snippets', [])
-            
-            # Local pack se abilitato
-            if tracking_config.get('track_local', False):
-                filtered['local_pack'] = serp_analysis.get('local_pack', [])
-            
-            # Shopping se abilitato
-            if tracking_config.get('track_shopping', False):
-                filtered['shopping'] = serp_analysis.get('shopping', [])
-            
-            # Filtra target positions
-            filtered['target_positions'] = {
-                k: v for k, v in serp_analysis.get('target_positions', {}).items()
-                if k in filtered
-            }
-            
-            return filtered
+        return filter_by_tracking_config(serp_analysis, tracking_config)
     
     
     async def check_rankings_complete(self, domain: str, keywords: List[str], 
-                                     localization_config: Dict, tracking_config: Dict) -> Dict:
+                                     localization_config: Dict, tracking_config: Dict,
+                                     rate_limit_config: Dict = None, cache_config: Dict = None) -> Dict:
         """Controlla il ranking per multiple keywords con analisi completa SERP"""
         results = {}
         
@@ -212,69 +247,86 @@ class RankTracker:
         print(f"📍 Localizzazione: {loc_info}")
         print(f"📊 Tracking mode: {tracking_config.get('tracking_mode', 'ORGANIC_ONLY')}")
         
-        # Processa in batch per evitare sovraccarico
-        batch_size = 5  # Ridotto perché il nuovo metodo è più complesso
-        for i in range(0, len(keywords), batch_size):
-            batch = keywords[i:i+batch_size]
-            
-            print(f"\n📦 Elaborando batch {i//batch_size + 1}/{(len(keywords)-1)//batch_size + 1}")
-            
-            # Processa batch sequenzialmente per evitare rate limiting
-            for keyword in batch:
-                try:
-                    result = await self.search_keyword_complete(
-                        keyword=keyword,
-                        domain=clean_domain,
-                        localization_config=localization_config,
-                        tracking_config=tracking_config
-                    )
-                    
-                    results[keyword] = result
-                    
-                    # Log risultato
-                    if 'error' in result:
-                        print(f"❌ {keyword}: {result['error']}")
-                    else:
-                        # Estrai posizione organica per il log
-                        target_positions = result.get('target_positions', {})
-                        organic_pos = target_positions.get('organic', {}).get('position')
-                        
-                        if organic_pos:
-                            print(f"✅ {keyword}: posizione organica {organic_pos}")
-                            
-                            # Log altre posizioni se presenti
-                            other_positions = []
-                            for result_type, pos_info in target_positions.items():
-                                if result_type != 'organic':
-                                    other_positions.append(f"{result_type}: {pos_info.get('position')}")
-                            
-                            if other_positions:
-                                print(f"   📊 Altri: {', '.join(other_positions)}")
-                        else:
-                            print(f"❌ {keyword}: non trovato nei risultati organici")
-                            
-                            # Controlla se è presente in ads/local/snippets
-                            found_elsewhere = []
-                            for result_type, pos_info in target_positions.items():
-                                found_elsewhere.append(f"{result_type}: {pos_info.get('position')}")
-                            
-                            if found_elsewhere:
-                                print(f"   📍 Trovato in: {', '.join(found_elsewhere)}")
+        # Sessione sul pool condiviso: il browser non viene chiuso a fine check
+        async with self.lifecycle.session():
+            # Processa in batch per evitare sovraccarico
+            batch_size = 5 * self.pool.size  # 5 keywords per contesto browser
+            for i in range(0, len(keywords), batch_size):
+                batch = keywords[i:i+batch_size]
                 
-                except Exception as e:
-                    print(f"❌ Errore per keyword '{keyword}': {str(e)}")
-                    results[keyword] = {'error': str(e)}
-            
-            # Pausa tra batch per evitare rate limiting
-            if i + batch_size < len(keywords):
-                delay = 15 + random.uniform(5, 15)
-                print(f"⏱️ Pausa {delay:.1f}s prima del prossimo batch...")
-                await asyncio.sleep(delay)
+                print(f"\n📦 Elaborando batch {i//batch_size + 1}/{(len(keywords)-1)//batch_size + 1} "
+                      f"su {self.pool.size} contesti browser")
+                
+                # Le keywords del batch condividono i contesti del pool
+                batch_results = await asyncio.gather(*[
+                    self._check_keyword(keyword, clean_domain, localization_config, tracking_config,
+                                        rate_limit_config, cache_config)
+                    for keyword in batch
+                ])
+                results.update(zip(batch, batch_results))
         
-        await self.close_crawler()
+        wait_metrics = self.rate_limiter.metrics()
         print(f"\n🏁 Check completato per {len(keywords)} keywords!")
+        print(f"⏱️ Attesa rate limit totale: {wait_metrics['total_wait']:.1f}s "
+              f"(media {wait_metrics['avg_wait']:.1f}s per richiesta)")
         return results
     
+    async def check_keyword(self, keyword: str, domain: str, localization_config: Dict,
+                            tracking_config: Dict, rate_limit_config: Dict = None,
+                            cache_config: Dict = None) -> Dict:
+        """Controlla una singola keyword (usato dai worker della coda di crawl globale)"""
+        return await self._check_keyword(keyword, self._clean_domain_for_search(domain), localization_config,
+                                         tracking_config, rate_limit_config, cache_config)
+    
+    async def _check_keyword(self, keyword: str, domain: str, localization_config: Dict,
+                             tracking_config: Dict, rate_limit_config: Dict = None,
+                             cache_config: Dict = None) -> Dict:
+        """Esegue la ricerca di una singola keyword e ne logga l'esito"""
+        try:
+            result = await self.search_keyword_complete(
+                keyword=keyword,
+                domain=domain,
+                localization_config=localization_config,
+                tracking_config=tracking_config,
+                rate_limit_config=rate_limit_config,
+                cache_config=cache_config
+            )
+        except Exception as e:
+            print(f"❌ Errore per keyword '{keyword}': {str(e)}")
+            return {'error': str(e)}
+        
+        # Log risultato
+        if 'error' in result:
+            print(f"❌ {keyword}: {result['error']}")
+        else:
+            # Estrai posizione organica per il log
+            target_positions = result.get('target_positions', {})
+            organic_pos = target_positions.get('organic', {}).get('position')
+            
+            if organic_pos:
+                print(f"✅ {keyword}: posizione organica {organic_pos}")
+                
+                # Log altre posizioni se presenti
+                other_positions = []
+                for result_type, pos_info in target_positions.items():
+                    if result_type != 'organic':
+                        other_positions.append(f"{result_type}: {pos_info.get('position')}")
+                
+                if other_positions:
+                    print(f"   📊 Altri: {', '.join(other_positions)}")
+            else:
+                print(f"❌ {keyword}: non trovato nei risultati organici")
+                
+                # Controlla se è presente in ads/local/snippets
+                found_elsewhere = []
+                for result_type, pos_info in target_positions.items():
+                    found_elsewhere.append(f"{result_type}: {pos_info.get('position')}")
+                
+                if found_elsewhere:
+                    print(f"   📍 Trovato in: {', '.join(found_elsewhere)}")
+        
+        return result
+    
     def _clean_domain_for_search(self, domain: str) -> str:
         """Pulisce il dominio dal database per la ricerca"""
         if not domain:
@@ -0,0 +1,144 @@
+"""
+Rate limiting condiviso a token bucket per localizzazione di ricerca
+Un bucket per (country_code, language_code, identità di uscita, rate e burst del progetto):
+progetti con impostazioni diverse sulla stessa localizzazione hanno bucket distinti
+invece di sovrascriversi a vicenda la configurazione
+"""
+
+import asyncio
+import random
+import time
+from typing import Dict, Optional, Tuple
+
+BucketKey = Tuple[str, str, str, float, int]
+
+# Default conservativi: ~1 ricerca ogni 15 secondi per localizzazione
+DEFAULT_REQUESTS_PER_MINUTE = 4.0
+DEFAULT_BURST = 1
+DEFAULT_JITTER_SECONDS = 2.0
+
+
+class TokenBucket:
+    """Token bucket con prenotazione: ogni richiesta riserva un token e attende il suo turno"""
+
+    def __init__(self, requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 burst: int = DEFAULT_BURST):
+        self.configure(requests_per_minute, burst)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+
+    def configure(self, requests_per_minute: float, burst: int):
+        self.requests_per_minute = max(float(requests_per_minute), 0.01)
+        self.burst = max(int(burst), 1)
+
+    @property
+    def rate(self) -> float:
+        """Token generati al secondo"""
+        return self.requests_per_minute / 60.0
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def reserve(self, now: Optional[float] = None) -> float:
+        """Riserva un token e restituisce i secondi da attendere prima di usarlo"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Registro condiviso di token bucket con metriche dei tempi di attesa"""
+
+    def __init__(self, jitter_seconds: float = DEFAULT_JITTER_SECONDS):
+        self.jitter_seconds = jitter_seconds
+        self.buckets: Dict[BucketKey, TokenBucket] = {}
+        self.metrics_by_key: Dict[BucketKey, Dict] = {}
+
+    @staticmethod
+    def bucket_key(localization_config: Dict, egress_id: str = 'direct',
+                   rate_limit_config: Dict = None) -> BucketKey:
+        rate_limit_config = rate_limit_config or {}
+        return (
+            localization_config.get('country_code', 'IT'),
+            localization_config.get('language_code', 'it'),
+            egress_id or 'direct',
+            float(rate_limit_config.get('requests_per_minute') or DEFAULT_REQUESTS_PER_MINUTE),
+            int(rate_limit_config.get('burst') or DEFAULT_BURST)
+        )
+
+    def get_bucket(self, key: BucketKey) -> TokenBucket:
+        """Recupera (o crea) il bucket; rate e burst fanno parte della chiave e non cambiano"""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(key[3], key[4])
+            self.buckets[key] = bucket
+            self.metrics_by_key[key] = {
+                'requests': 0,
+                'waited_requests': 0,
+                'total_wait': 0.0,
+                'max_wait': 0.0
+            }
+
+        return bucket
+
+    async def acquire(self, localization_config: Dict, egress_id: str = 'direct',
+                      rate_limit_config: Dict = None) -> float:
+        """Attende il permesso per una richiesta e restituisce i secondi attesi"""
+        key = self.bucket_key(localization_config, egress_id, rate_limit_config)
+        bucket = self.get_bucket(key)
+
+        delay = bucket.reserve()
+        if delay > 0 and self.jitter_seconds:
+            # Piccola variazione casuale per non rendere regolare il pattern delle richieste
+            delay += random.uniform(0, self.jitter_seconds)
+
+        self._record_wait(key, delay)
+
+        if delay > 0:
+            print(f"⏱️ Rate limit {'/'.join(key[:3])}: attesa {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        return delay
+
+    def _record_wait(self, key: BucketKey, delay: float):
+        metrics = self.metrics_by_key[key]
+        metrics['requests'] += 1
+        if delay > 0:
+            metrics['waited_requests'] += 1
+            metrics['total_wait'] += delay
+            metrics['max_wait'] = max(metrics['max_wait'], delay)
+
+    def metrics(self) -> Dict:
+        """Metriche di attesa per bucket e totali"""
+        buckets = []
+        total_requests = 0
+        total_wait = 0.0
+
+        for key, metrics in self.metrics_by_key.items():
+            bucket = self.buckets[key]
+            total_requests += metrics['requests']
+            total_wait += metrics['total_wait']
+            buckets.append({
+                'country_code': key[0],
+                'language_code': key[1],
+                'egress': key[2],
+                'requests_per_minute': bucket.requests_per_minute,
+                'burst': bucket.burst,
+                'requests': metrics['requests'],
+                'waited_requests': metrics['waited_requests'],
+                'total_wait': round(metrics['total_wait'], 3),
+                'avg_wait': round(metrics['total_wait'] / max(metrics['requests'], 1), 3),
+                'max_wait': round(metrics['max_wait'], 3)
+            })
+
+        return {
+            'requests': total_requests,
+            'total_wait': round(total_wait, 3),
+            'avg_wait': round(total_wait / max(total_requests, 1), 3),
+            'buckets': buckets
+        }
@@ -0,0 +1,124 @@
+"""
+Ri-analisi offline delle SERP archiviate
+Riesegue SERPAnalyzer sull'HTML salvato in un process pool e riscrive i risultati con la nuova versione del parser
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from serp_analyzer import (SERPAnalyzer, PARSER_VERSION, filter_by_tracking_config, flatten_serp_features,
+                           result_types_for_tracking)
+from serp_archive import DEFAULT_ARCHIVE_DIR, read_blob
+
+# Analyzer riusato all'interno di ogni processo worker
+_worker_analyzer = None
+
+
+def _reanalyze_serp(task: Tuple) -> Optional[Dict]:
+    """Worker: legge l'HTML archiviato e ricalcola posizione e features (nessuna chiamata di rete)"""
+    global _worker_analyzer
+
+    archive_dir, keyword, content_hash, checks, domain, tracking_config = task
+    html = read_blob(archive_dir, content_hash)
+    if html is None:
+        return None
+
+    if _worker_analyzer is None:
+        _worker_analyzer = SERPAnalyzer()
+
+    analysis = _worker_analyzer.analyze_complete_serp(
+        html, domain, result_types=result_types_for_tracking(tracking_config)
+    )
+    analysis = filter_by_tracking_config(analysis, tracking_config)
+
+    return {
+        'keyword': keyword,
+        'content_hash': content_hash,
+        'checks': checks,
+        'position': analysis.get('target_positions', {}).get('organic', {}).get('position'),
+        'features': flatten_serp_features(analysis)
+    }
+
+
+class ReanalysisEngine:
+    """Riprocessa in parallelo lo storico archiviato di un progetto"""
+
+    def __init__(self, db, archive_dir: str = DEFAULT_ARCHIVE_DIR, workers: Optional[int] = None,
+                 chunk_size: int = 500):
+        self.db = db
+        self.archive_dir = str(archive_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def run(self, project_id: int, since: str = None, parser_version: str = PARSER_VERSION,
+            only_outdated: bool = False) -> Dict:
+        """Ri-analizza le SERP archiviate di un progetto e riscrive i risultati derivati"""
+        project = self.db.get_project(project_id)
+        if not project:
+            raise ValueError(f"Progetto {project_id} non trovato")
+
+        tracking_config = self.db.get_project_tracking_config(project_id)
+        targets = self.db.get_reanalysis_targets(project_id, since)
+
+        # Una sola analisi per SERP, anche se riusata da più check (archivio read-through)
+        checks_by_serp = {}
+        outdated = set()
+        for target in targets:
+            key = (target['keyword'], target['content_hash'])
+            checks_by_serp.setdefault(key, []).append((target['checked_at'], target['run_id']))
+            if target['parser_version'] != parser_version:
+                outdated.add(key)
+
+        if only_outdated:
+            checks_by_serp = {key: checks for key, checks in checks_by_serp.items() if key in outdated}
+
+        print(f"🔁 Ri-analisi progetto {project_id} ({project['domain']}): "
+              f"{len(checks_by_serp)} SERP archiviate, {self.workers} worker, parser v{parser_version}")
+
+        tasks = [
+            (self.archive_dir, keyword, content_hash, checks, project['domain'], tracking_config)
+            for (keyword, content_hash), checks in checks_by_serp.items()
+        ]
+
+        analyzed = 0
+        missing = 0
+        rows_written = 0
+        start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for i in range(0, len(tasks), self.chunk_size):
+                chunk = tasks[i:i + self.chunk_size]
+                chunksize = max(1, len(chunk) // (self.workers * 4))
+                results = list(pool.map(_reanalyze_serp, chunk, chunksize=chunksize))
+
+                rows = [r for r in results if r is not None]
+                missing += len(results) - len(rows)
+                analyzed += len(rows)
+                if rows:
+                    rows_written += self.db.replace_reanalyzed_results(project_id, rows, parser_version)
+
+        elapsed = time.perf_counter() - start
+        throughput = analyzed / elapsed if elapsed > 0 else 0.0
+
+        print(f"📈 {analyzed} SERP ri-analizzate in {elapsed:.1f}s ({throughput:.1f} SERP/s), "
+              f"{rows_written} righe riscritte, {missing} HTML non più in archivio")
+
+        return {
+            'project_id': project_id,
+            'parser_version': parser_version,
+            'serps': analyzed,
+            'missing': missing,
+            'rows_written': rows_written,
+            'seconds': round(elapsed, 3),
+            'serps_per_second': round(throughput, 2)
+        }
+
+    def run_all(self, since: str = None, parser_version: str = PARSER_VERSION,
+                only_outdated: bool = False) -> List[Dict]:
+        """Ri-analizza tutti i progetti attivi"""
+        return [
+            self.run(project['id'], since, parser_version, only_outdated)
+            for project in self.db.get_all_projects()
+        ]
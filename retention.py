@@ -0,0 +1,557 @@
+"""
+Retention dello storico con rollup automatici (raw -> giornaliero -> settimanale)
+Le righe grezze di ranking_results e serp_feature_rows vengono aggregate in modo incrementale
+(watermark sull'ultimo id elaborato) e rimosse dopo RANK_TRACKER_RAW_RETENTION_DAYS, solo se
+impostato (URL, titoli e snippet eliminati non si recuperano dai rollup); i rollup giornalieri
+restano RANK_TRACKER_DAILY_RETENTION_DAYS, quelli settimanali per sempre.
+"""
+
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+# 0 = nessun limite (default per lo storico grezzo: la pulizia va attivata esplicitamente)
+RAW_RETENTION_DAYS = int(os.getenv('RANK_TRACKER_RAW_RETENTION_DAYS', '0'))
+DAILY_RETENTION_DAYS = int(os.getenv('RANK_TRACKER_DAILY_RETENTION_DAYS', '730'))
+RETENTION_INTERVAL_HOURS = float(os.getenv('RANK_TRACKER_RETENTION_INTERVAL_HOURS', '6'))
+
+# Intervalli oltre i quali lo storico passa alla risoluzione successiva
+RAW_MAX_RANGE_DAYS = 31
+DAILY_MAX_RANGE_DAYS = 92
+
+# Righe elaborate/eliminate per transazione (il writer resta libero per i check in corso)
+ROLLUP_BATCH_ROWS = 50000
+PRUNE_BATCH_ROWS = 10000
+
+RESOLUTIONS = ('raw', 'daily', 'weekly')
+SUMMARY_GROUPS = ('day', 'keyword')
+
+# Espressione SQL del bucket di un timestamp (le settimane iniziano di lunedì)
+BUCKET_SQL = {
+    'daily': "date({column})",
+    'weekly': "date({column}, 'weekday 0', '-6 days')"
+}
+
+
+def init_rollup_tables(conn):
+    """Crea le tabelle dei rollup e lo stato dei watermark"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ranking_rollups (
+            project_id INTEGER NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            keyword_id INTEGER NOT NULL REFERENCES dict_keywords (id),
+            checks INTEGER NOT NULL,
+            found INTEGER NOT NULL,
+            best_position INTEGER,
+            worst_position INTEGER,
+            position_sum INTEGER,
+            PRIMARY KEY (project_id, resolution, bucket, keyword_id)
+        ) WITHOUT ROWID
+    """)
+
+    # Presenza per tipo di risultato: SERP in cui il tipo compare e SERP in cui compare il dominio target
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS feature_rollups (
+            project_id INTEGER NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            keyword_id INTEGER NOT NULL REFERENCES dict_keywords (id),
+            result_type TEXT NOT NULL,
+            serps INTEGER NOT NULL,
+            target_serps INTEGER NOT NULL,
+            best_position INTEGER,
+            PRIMARY KEY (project_id, resolution, bucket, keyword_id, result_type)
+        ) WITHOUT ROWID
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS retention_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+
+def bucket_of(day: date, resolution: str) -> date:
+    """Inizio del bucket (giorno o lunedì della settimana) che contiene il giorno"""
+    if resolution == 'weekly':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def choose_resolution(days: int, raw_days: int = RAW_RETENTION_DAYS,
+                      daily_days: int = DAILY_RETENTION_DAYS) -> str:
+    """La risoluzione più economica che copre l'intervallo richiesto"""
+    if days <= RAW_MAX_RANGE_DAYS and (not raw_days or days <= raw_days):
+        return 'raw'
+    if days <= DAILY_MAX_RANGE_DAYS and (not daily_days or days <= daily_days):
+        return 'daily'
+    return 'weekly'
+
+
+def _watermark(conn, name: str) -> int:
+    row = conn.execute("SELECT value FROM retention_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def _pending_cutoff(conn, table: str, resolution: str) -> Optional[str]:
+    """Primo bucket che contiene righe non ancora aggregate (da leggere dallo storico grezzo)"""
+    oldest = conn.execute(
+        f"SELECT MIN(checked_at) FROM {table} WHERE id > ?", (_watermark(conn, table),)
+    ).fetchone()[0]
+    if oldest is None:
+        return None
+    return bucket_of(date.fromisoformat(oldest[:10]), resolution).isoformat()
+
+
+def _history_source(conn, project_id: int, since: date, resolution: str,
+                    keywords: Optional[List[str]] = None) -> Tuple[str, List]:
+    """
+    Query delle righe (keyword, checked_at, checks, found, best_position, worst_position, position_sum)
+    per keyword e bucket. I bucket già aggregati vengono letti dai rollup, quelli con righe ancora
+    in attesa del job di retention sono calcolati al volo dallo storico grezzo.
+    """
+    since_bucket = bucket_of(since, resolution).isoformat()
+    cutoff = _pending_cutoff(conn, 'ranking_results', resolution)
+    bucket = BUCKET_SQL[resolution].format(column='checked_at')
+    keyword_filter = f" IN ({', '.join('?' * len(keywords))})" if keywords is not None else None
+
+    query = """
+        SELECT k.keyword AS keyword, r.bucket AS checked_at, r.checks AS checks, r.found AS found,
+               r.best_position AS best_position, r.worst_position AS worst_position,
+               r.position_sum AS position_sum
+        FROM ranking_rollups r
+        JOIN dict_keywords k ON k.id = r.keyword_id
+        WHERE r.project_id = ? AND r.resolution = ? AND r.bucket >= ?
+    """
+    params = [project_id, resolution, since_bucket]
+
+    if keywords is not None:
+        query += f" AND k.keyword{keyword_filter}"
+        params += keywords
+
+    if cutoff is not None:
+        query += f"""
+              AND r.bucket < ?
+            UNION ALL
+            SELECT keyword, {bucket}, COUNT(*), COUNT(position),
+                   MIN(position), MAX(position), SUM(position)
+            FROM ranking_results
+            WHERE project_id = ? AND checked_at >= ? {f"AND keyword{keyword_filter}" if keywords is not None else ""}
+            GROUP BY keyword, 2
+        """
+        params += [cutoff, project_id, max(cutoff, since_bucket)] + (keywords or [])
+
+    return query, params
+
+
+def rollup_history(conn, project_id: int, since: date, resolution: str, keywords: Optional[List[str]] = None,
+                   limit: Optional[int] = None, after: Optional[Tuple[str, str]] = None) -> List[Dict]:
+    """
+    Storico posizioni a risoluzione giornaliera o settimanale, in ordine (checked_at DESC, keyword).
+    after: chiave (checked_at, keyword) dell'ultima riga della pagina precedente.
+    """
+    source, params = _history_source(conn, project_id, since, resolution, keywords)
+    query = f"SELECT * FROM ({source})"
+
+    if after is not None:
+        query += " WHERE checked_at <= ? AND (checked_at < ? OR keyword > ?)"
+        params += [after[0], after[0], after[1]]
+
+    query += " ORDER BY checked_at DESC, keyword"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    return [{
+        'keyword': keyword,
+        'position': round(position_sum / found, 1) if found else None,
+        'checked_at': checked_at,
+        'best_position': best,
+        'worst_position': worst,
+        'checks': checks,
+        'found': found,
+        'resolution': resolution
+    } for keyword, checked_at, checks, found, best, worst, position_sum in conn.execute(query, params)]
+
+
+def history_summary(conn, project_id: int, since: date, resolution: str, group_by: str,
+                    keywords: Optional[List[str]] = None, limit: Optional[int] = None,
+                    after: Optional[str] = None) -> List[Dict]:
+    """
+    Storico aggregato in SQL: una riga per bucket (group_by='day', in ordine decrescente)
+    o una per keyword (group_by='keyword', in ordine alfabetico). after: chiave dell'ultima riga.
+    Le medie sono pesate sul numero di check in cui il dominio è stato trovato.
+    """
+    if group_by not in SUMMARY_GROUPS:
+        raise ValueError(f"Raggruppamento non valido: {group_by}")
+
+    source, params = _history_source(conn, project_id, since, resolution, keywords)
+
+    if group_by == 'day':
+        query = f"""
+            SELECT checked_at, COUNT(*), SUM(found > 0), SUM(checks), SUM(found),
+                   SUM(position_sum) * 1.0 / NULLIF(SUM(found), 0), MIN(best_position),
+                   SUM(found > 0 AND position_sum <= 3 * found), SUM(found > 0 AND position_sum <= 10 * found)
+            FROM ({source})
+            GROUP BY checked_at
+        """
+        if after is not None:
+            query += " HAVING checked_at < ?"
+            params.append(after)
+        query += " ORDER BY checked_at DESC"
+    else:
+        query = f"""
+            SELECT s.*, lp.position FROM (
+                SELECT keyword, SUM(checks) AS checks, SUM(found) AS found,
+                       SUM(position_sum) * 1.0 / NULLIF(SUM(found), 0) AS avg_position,
+                       MIN(best_position) AS best_position, MAX(worst_position) AS worst_position
+                FROM ({source})
+                GROUP BY keyword
+                {"HAVING keyword > ?" if after is not None else ""}
+            ) s
+            LEFT JOIN latest_positions lp ON lp.project_id = ? AND lp.keyword = s.keyword
+            ORDER BY s.keyword
+        """
+        params += ([after] if after is not None else []) + [project_id]
+
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    rows = conn.execute(query, params).fetchall()
+    if group_by == 'day':
+        return [{
+            'checked_at': checked_at,
+            'keywords': keyword_count,
+            'found_keywords': found_keywords,
+            'checks': checks,
+            'found': found,
+            'avg_position': round(avg, 1) if avg is not None else None,
+            'best_position': best,
+            'top3': top3,
+            'top10': top10,
+            'resolution': resolution
+        } for checked_at, keyword_count, found_keywords, checks, found, avg, best, top3, top10 in rows]
+
+    return [{
+        'keyword': keyword,
+        'checks': checks,
+        'found': found,
+        'avg_position': round(avg, 1) if avg is not None else None,
+        'best_position': best,
+        'worst_position': worst,
+        'current_position': current,
+        'resolution': resolution
+    } for keyword, checks, found, avg, best, worst, current in rows]
+
+
+def presence_history(conn, project_id: int, target_domain: str, since: date, resolution: str) -> List[Dict]:
+    """Presenza per tipo di risultato (stessa logica di rollup_history)"""
+    since_bucket = bucket_of(since, resolution).isoformat()
+    cutoff = _pending_cutoff(conn, 'serp_feature_rows', resolution)
+
+    query = """
+        SELECT k.keyword, r.bucket AS checked_at, r.result_type, r.serps, r.target_serps, r.best_position
+        FROM feature_rollups r
+        JOIN dict_keywords k ON k.id = r.keyword_id
+        WHERE r.project_id = ? AND r.resolution = ? AND r.bucket >= ?
+    """
+    params = [project_id, resolution, since_bucket]
+
+    if cutoff is not None:
+        target_ids = _target_domain_ids(conn, target_domain)
+        query += f"""
+              AND r.bucket < ?
+            UNION ALL
+            SELECT k.keyword, {BUCKET_SQL[resolution].format(column='f.checked_at')}, f.result_type,
+                   {_presence_columns(target_ids)}
+            FROM serp_feature_rows f
+            JOIN dict_keywords k ON k.id = f.keyword_id
+            WHERE f.project_id = ?
+              AND (f.run_id IN (SELECT id FROM check_runs WHERE project_id = ? AND
+                                (finished_at IS NULL OR finished_at >= ?))
+                   OR f.run_id IS NULL)
+              AND f.checked_at >= ?
+            GROUP BY f.keyword_id, 2, f.result_type
+        """
+        pending_since = max(cutoff, since_bucket)
+        params += [cutoff] + target_ids * 2 + [project_id, project_id, pending_since, pending_since]
+
+    query += " ORDER BY checked_at DESC, keyword, result_type"
+
+    return [{
+        'keyword': keyword,
+        'checked_at': checked_at,
+        'result_type': result_type,
+        'serps': serps,
+        'target_serps': target_serps,
+        'best_position': best,
+        'resolution': resolution
+    } for keyword, checked_at, result_type, serps, target_serps, best in conn.execute(query, params)]
+
+
+def _target_domain_ids(conn, domain: str) -> List[int]:
+    """Id del dominio target e dei suoi sottodomini nel dizionario dei domini"""
+    domain = (domain or '').lower().strip()
+    for prefix in ('https://', 'http://', 'www.'):
+        if domain.startswith(prefix):
+            domain = domain[len(prefix):]
+    domain = domain.split('/')[0]
+    if not domain:
+        return []
+    return [row[0] for row in conn.execute(
+        "SELECT id FROM dict_domains WHERE domain = ? OR domain = ? OR domain LIKE ?",
+        (domain, 'www.' + domain, '%.' + domain)
+    )]
+
+
+def _presence_columns(target_ids: List[int]) -> str:
+    """Colonne aggregate serps, target_serps, best_position (parametri: target_ids due volte)"""
+    if not target_ids:
+        return "COUNT(DISTINCT f.checked_at), 0, NULL"
+    placeholders = ', '.join('?' * len(target_ids))
+    return f"""COUNT(DISTINCT f.checked_at),
+               COUNT(DISTINCT CASE WHEN f.domain_id IN ({placeholders}) THEN f.checked_at END),
+               MIN(CASE WHEN f.domain_id IN ({placeholders}) THEN f.position END)"""
+
+
+class RetentionManager:
+    """Aggrega lo storico in rollup giornalieri/settimanali e applica le finestre di retention"""
+
+    def __init__(self, db, raw_days: int = RAW_RETENTION_DAYS, daily_days: int = DAILY_RETENTION_DAYS):
+        self.db = db
+        self.raw_days = raw_days
+        # I settimanali si ricalcolano dai giornalieri: servono almeno tutti i giorni ancora grezzi
+        self.daily_days = max(daily_days, raw_days + 7) if daily_days and raw_days else daily_days
+        self.last_report: Optional[Dict] = None
+
+    def run(self) -> Dict:
+        """Aggrega le righe nuove e poi elimina quelle fuori dalle finestre di retention"""
+        start = time.time()
+        report = {'ranking_rows': 0, 'feature_rows': 0, 'days': 0, 'weeks': 0}
+
+        while True:
+            batch = self.rollup_batch()
+            for key in report:
+                report[key] += batch[key]
+            if not batch['ranking_rows'] and not batch['feature_rows']:
+                break
+
+        report.update(self.prune())
+        report['seconds'] = round(time.time() - start, 3)
+        self.last_report = report
+
+        if report['pruned_results'] or report['pruned_features'] or report['days']:
+            print(f"🗄️ Retention: {report['days']} giorni aggregati, "
+                  f"{report['pruned_results']} risultati e {report['pruned_features']} features rimosse "
+                  f"in {report['seconds']:.1f}s")
+        return report
+
+    def rollup_batch(self, batch_rows: int = ROLLUP_BATCH_ROWS) -> Dict:
+        """Aggrega fino a batch_rows righe nuove per tabella in un'unica transazione"""
+        with self.db.connections.writer() as conn:
+            affected: Dict[int, set] = {}
+            counts = {}
+
+            for table in ('ranking_results', 'serp_feature_rows'):
+                watermark = _watermark(conn, table)
+                upper = conn.execute(
+                    f"SELECT MIN(MAX(id), ?) FROM {table} WHERE id > ?", (watermark + batch_rows, watermark)
+                ).fetchone()[0]
+                counts[table] = 0
+                if upper is None:
+                    continue
+
+                counts[table] = conn.execute(
+                    f"SELECT COUNT(*) FROM {table} WHERE id > ? AND id <= ?", (watermark, upper)
+                ).fetchone()[0]
+                for project_id, day in conn.execute(f"""
+                    SELECT DISTINCT project_id, substr(checked_at, 1, 10) FROM {table}
+                    WHERE id > ? AND id <= ?
+                """, (watermark, upper)):
+                    affected.setdefault(project_id, set()).add(date.fromisoformat(day))
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO retention_state (name, value) VALUES (?, ?)", (table, upper)
+                )
+
+            days = weeks = 0
+            for project_id, project_days in affected.items():
+                target_ids = self._project_target_ids(conn, project_id)
+                ordered = sorted(project_days)
+                for i in range(0, len(ordered), 200):
+                    self._rollup_days(conn, project_id, ordered[i:i + 200], target_ids)
+                project_weeks = {bucket_of(day, 'weekly') for day in project_days}
+                for week in sorted(project_weeks):
+                    self._rollup_week(conn, project_id, week)
+                days += len(project_days)
+                weeks += len(project_weeks)
+
+        return {
+            'ranking_rows': counts['ranking_results'],
+            'feature_rows': counts['serp_feature_rows'],
+            'days': days,
+            'weeks': weeks
+        }
+
+    def _project_target_ids(self, conn, project_id: int) -> List[int]:
+        row = conn.execute("SELECT domain FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return _target_domain_ids(conn, row[0]) if row else []
+
+    def _rollup_days(self, conn, project_id: int, days: List[date], target_ids: List[int]):
+        """Ricalcola dallo storico grezzo i rollup giornalieri di un gruppo di giorni (una query per tabella)"""
+        buckets = [day.isoformat() for day in days]
+        start, end = buckets[0], (days[-1] + timedelta(days=1)).isoformat()
+        in_days = ', '.join('?' * len(buckets))
+
+        conn.execute(f"""
+            INSERT OR IGNORE INTO dict_keywords (keyword)
+            SELECT DISTINCT keyword FROM ranking_results
+            WHERE project_id = ? AND checked_at >= ? AND checked_at < ? AND substr(checked_at, 1, 10) IN ({in_days})
+        """, [project_id, start, end] + buckets)
+        for table in ('ranking_rollups', 'feature_rollups'):
+            conn.execute(
+                f"DELETE FROM {table} WHERE project_id = ? AND resolution = 'daily' AND bucket IN ({in_days})",
+                [project_id] + buckets
+            )
+
+        conn.execute(f"""
+            INSERT INTO ranking_rollups
+            (project_id, resolution, bucket, keyword_id, checks, found, best_position, worst_position, position_sum)
+            SELECT r.project_id, 'daily', substr(r.checked_at, 1, 10), k.id, COUNT(*), COUNT(r.position),
+                   MIN(r.position), MAX(r.position), SUM(r.position)
+            FROM ranking_results r
+            JOIN dict_keywords k ON k.keyword = r.keyword
+            WHERE r.project_id = ? AND r.checked_at >= ? AND r.checked_at < ?
+              AND substr(r.checked_at, 1, 10) IN ({in_days})
+            GROUP BY 3, k.id
+        """, [project_id, start, end] + buckets)
+
+        # serp_feature_rows è indicizzata per run: si leggono solo i run attivi in quei giorni
+        run_ids = [row[0] for row in conn.execute("""
+            SELECT id FROM check_runs
+            WHERE project_id = ? AND started_at < ? AND (finished_at IS NULL OR finished_at >= ?)
+        """, (project_id, end, start))]
+        runs_filter = f"f.run_id IN ({', '.join('?' * len(run_ids))}) OR " if run_ids else ""
+
+        conn.execute(f"""
+            INSERT INTO feature_rollups
+            (project_id, resolution, bucket, keyword_id, result_type, serps, target_serps, best_position)
+            SELECT f.project_id, 'daily', substr(f.checked_at, 1, 10), f.keyword_id, f.result_type,
+                   {_presence_columns(target_ids)}
+            FROM serp_feature_rows f
+            WHERE f.project_id = ? AND ({runs_filter}f.run_id IS NULL)
+              AND f.checked_at >= ? AND f.checked_at < ? AND substr(f.checked_at, 1, 10) IN ({in_days})
+            GROUP BY 3, f.keyword_id, f.result_type
+        """, target_ids * 2 + [project_id] + run_ids + [start, end] + buckets)
+
+    def _rollup_week(self, conn, project_id: int, week: date):
+        """Ricalcola il rollup settimanale dai rollup giornalieri"""
+        start, end = week.isoformat(), (week + timedelta(days=7)).isoformat()
+
+        conn.execute(
+            "DELETE FROM ranking_rollups WHERE project_id = ? AND resolution = 'weekly' AND bucket = ?",
+            (project_id, start)
+        )
+        conn.execute("""
+            INSERT INTO ranking_rollups
+            (project_id, resolution, bucket, keyword_id, checks, found, best_position, worst_position, position_sum)
+            SELECT project_id, 'weekly', ?, keyword_id, SUM(checks), SUM(found),
+                   MIN(best_position), MAX(worst_position), SUM(position_sum)
+            FROM ranking_rollups
+            WHERE project_id = ? AND resolution = 'daily' AND bucket >= ? AND bucket < ?
+            GROUP BY keyword_id
+        """, (start, project_id, start, end))
+
+        conn.execute(
+            "DELETE FROM feature_rollups WHERE project_id = ? AND resolution = 'weekly' AND bucket = ?",
+            (project_id, start)
+        )
+        conn.execute("""
+            INSERT INTO feature_rollups
+            (project_id, resolution, bucket, keyword_id, result_type, serps, target_serps, best_position)
+            SELECT project_id, 'weekly', ?, keyword_id, result_type, SUM(serps), SUM(target_serps),
+                   MIN(best_position)
+            FROM feature_rollups
+            WHERE project_id = ? AND resolution = 'daily' AND bucket >= ? AND bucket < ?
+            GROUP BY keyword_id, result_type
+        """, (start, project_id, start, end))
+
+    def prune(self, batch_rows: int = PRUNE_BATCH_ROWS) -> Dict:
+        """Elimina righe grezze e rollup giornalieri più vecchi delle finestre di retention"""
+        report = {'pruned_results': 0, 'pruned_features': 0, 'pruned_daily': 0}
+        today = datetime.now(timezone.utc).date()
+
+        with self.db.connections.reader() as conn:
+            project_ids = [row[0] for row in conn.execute("SELECT id FROM projects")]
+
+        if self.raw_days:
+            cutoff = (today - timedelta(days=self.raw_days)).isoformat()
+            for project_id in project_ids:
+                report['pruned_results'] += self._delete_in_batches("""
+                    DELETE FROM ranking_results WHERE id IN (
+                        SELECT id FROM ranking_results
+                        WHERE project_id = ? AND checked_at < ? AND id <= ? LIMIT ?
+                    )
+                """, project_id, cutoff, 'ranking_results', batch_rows)
+                report['pruned_features'] += self._delete_in_batches("""
+                    DELETE FROM serp_feature_rows WHERE id IN (
+                        SELECT id FROM serp_feature_rows
+                        WHERE project_id = ?1
+                          AND (run_id IN (SELECT id FROM check_runs WHERE project_id = ?1 AND started_at < ?2)
+                               OR run_id IS NULL)
+                          AND checked_at < ?2 AND id <= ?3 LIMIT ?4
+                    )
+                """, project_id, cutoff, 'serp_feature_rows', batch_rows)
+
+            if report['pruned_features']:
+                self._delete_unused_dictionary_entries()
+
+        if self.daily_days:
+            cutoff = (today - timedelta(days=self.daily_days)).isoformat()
+            with self.db.connections.writer() as conn:
+                for table in ('ranking_rollups', 'feature_rollups'):
+                    report['pruned_daily'] += conn.execute(
+                        f"DELETE FROM {table} WHERE resolution = 'daily' AND bucket < ?", (cutoff,)
+                    ).rowcount
+
+        return report
+
+    def _delete_in_batches(self, query: str, project_id: int, cutoff: str, table: str, batch_rows: int) -> int:
+        """Esegue la DELETE a blocchi, ciascuno in una transazione; solo righe già aggregate"""
+        deleted = 0
+        while True:
+            with self.db.connections.writer() as conn:
+                watermark = _watermark(conn, table)
+                count = conn.execute(query, (project_id, cutoff, watermark, batch_rows)).rowcount
+            deleted += count
+            if count < batch_rows:
+                return deleted
+
+    def _delete_unused_dictionary_entries(self):
+        """Rimuove dai dizionari i valori non più referenziati da serp_feature_rows o dai rollup"""
+        with self.db.connections.writer() as conn:
+            for table, columns in (('dict_urls', ('url_id',)), ('dict_domains', ('domain_id',)),
+                                   ('dict_hashes', ('content_hash_id',)),
+                                   ('dict_texts', ('title_id', 'snippet_id'))):
+                used = ' UNION '.join(f"SELECT {column} FROM serp_feature_rows WHERE {column} IS NOT NULL"
+                                      for column in columns)
+                conn.execute(f"DELETE FROM {table} WHERE id NOT IN ({used})")
+
+            conn.execute("""
+                DELETE FROM dict_keywords WHERE id NOT IN (
+                    SELECT keyword_id FROM serp_feature_rows
+                    UNION SELECT keyword_id FROM ranking_rollups
+                    UNION SELECT keyword_id FROM feature_rollups
+                )
+            """)
+
+    def stats(self) -> Dict:
+        return {
+            'raw_days': self.raw_days,
+            'daily_days': self.daily_days,
+            'last_report': self.last_report
+        }
@@ -0,0 +1,98 @@
+"""
+Pianificazione degli orari di check dei progetti
+Ogni progetto ha una fase fissa nel proprio intervallo (sequenza di Weyl con il rapporto aureo sull'id):
+i progetti si distribuiscono in modo uniforme e uno nuovo cade nello spazio più ampio rimasto libero.
+Le scadenze sono salvate nel database, così un riavvio riprende dagli stessi orari; i check persi
+durante un fermo vengono recuperati sparsi in una finestra breve invece che tutti insieme.
+Le keywords possono avere un tier con frequenza propria: a ogni scadenza del progetto si controllano
+solo quelle scadute, e la scadenza successiva del progetto è la prima tra le sue keywords
+"""
+
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# Parte frazionaria del rapporto aureo: multipli successivi sono equidistribuiti in [0, 1)
+GOLDEN_RATIO_FRACTION = 0.6180339887498949
+
+# Jitter casuale come frazione dell'intervallo (es. 0.02 su 24 ore = +/- 29 minuti)
+SCHEDULE_JITTER = float(os.getenv('RANK_TRACKER_SCHEDULE_JITTER', '0.02'))
+
+# Finestra in cui recuperare i check scaduti durante un fermo
+CATCH_UP_MINUTES = float(os.getenv('RANK_TRACKER_SCHEDULE_CATCHUP_MINUTES', '30'))
+
+# Tier di frequenza delle keywords (ore tra due check); senza tier vale l'intervallo del progetto
+KEYWORD_TIERS = {
+    'hourly': 1,
+    'daily': 24,
+    'weekly': 168,
+}
+
+# Keywords in scadenza entro questi minuti vengono controllate insieme a quelle già scadute
+CLAIM_AHEAD_MINUTES = float(os.getenv('RANK_TRACKER_CLAIM_AHEAD_MINUTES', '5'))
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def format_timestamp(value: datetime) -> str:
+    """Formato dei timestamp SQLite (UTC, come CURRENT_TIMESTAMP)"""
+    return value.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.strptime(value[:19], TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def tier_hours(tier: Optional[str], project_hours: float) -> float:
+    """Ore tra due check di una keyword del tier indicato"""
+    if tier is None:
+        return project_hours
+    if tier not in KEYWORD_TIERS:
+        raise ValueError(f"Tier non valido: {tier} (usa {', '.join(KEYWORD_TIERS)})")
+    return KEYWORD_TIERS[tier]
+
+
+def phase_of(project_id: int) -> float:
+    """Fase del progetto nel suo intervallo, in [0, 1)"""
+    return (project_id * GOLDEN_RATIO_FRACTION) % 1.0
+
+
+def first_due(project_id: int, interval_hours: float, now: datetime = None,
+              jitter: float = SCHEDULE_JITTER, rng: random.Random = None) -> datetime:
+    """Prima scadenza di un progetto appena schedulato: la sua fase nell'intervallo, più il jitter"""
+    now = now or utc_now()
+    interval = timedelta(hours=interval_hours)
+    offset = phase_of(project_id) + (rng or random).uniform(-jitter, jitter)
+    # Mai prima di adesso e mai oltre un intervallo
+    return now + interval * min(max(offset, 0.0), 1.0)
+
+
+def next_due(due: datetime, interval_hours: float, now: datetime = None) -> datetime:
+    """Prima scadenza dopo adesso mantenendo la fase (i cicli saltati non vengono accumulati)"""
+    now = now or utc_now()
+    interval = timedelta(hours=interval_hours)
+    if due > now:
+        return due
+    missed = (now - due) // interval + 1
+    return due + interval * missed
+
+
+def resume_due(project_id: int, stored_due: Optional[datetime], interval_hours: float, now: datetime = None,
+               catch_up_minutes: float = CATCH_UP_MINUTES) -> Optional[datetime]:
+    """
+    Scadenza al riavvio: quella salvata se ancora futura; se scaduta durante il fermo, un recupero
+    entro catch_up_minutes (ogni progetto alla sua fase). None se non c'è stato salvato
+    """
+    if stored_due is None:
+        return None
+    now = now or utc_now()
+    if stored_due > now:
+        return stored_due
+    return now + timedelta(minutes=catch_up_minutes) * phase_of(project_id)
@@ -1,15 +1,35 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 import asyncio
-from datetime import datetime
+from datetime import datetime, timedelta
+import functools
 import logging
 
+from async_database import AsyncDatabase
+from crawl_budget import budget_day, next_window
+from crawl_queue import CrawlJob, CrawlQueue, PRIORITY_SCHEDULED
+from history_export import EXPORT_DIR, HistoryExporter
+from retention import RetentionManager, RETENTION_INTERVAL_HOURS
+from schedule_planner import (CATCH_UP_MINUTES, CLAIM_AHEAD_MINUTES, first_due, format_timestamp, next_due,
+                              parse_timestamp, phase_of, resume_due, utc_now)
+
 class RankScheduler:
-    def __init__(self, rank_tracker, database):
+    def __init__(self, rank_tracker, database, async_database: AsyncDatabase = None,
+                 crawl_queue: CrawlQueue = None):
         self.scheduler = AsyncIOScheduler()
         self.tracker = rank_tracker
         self.db = database
-        self.running_jobs = set()
+        # I job girano sull'event loop: le query passano dal thread pool del database
+        self.adb = async_database or AsyncDatabase(database)
+        # I job schedulati e i check manuali accodano soltanto: i worker della coda eseguono i crawl
+        self.queue = crawl_queue or CrawlQueue(rank_tracker)
+        self._enqueuing = set()
+        # Progetti con keywords rinviate per budget esaurito: non si riprova prima della nuova finestra
+        self._deferred_until = {}
+        self.retention = RetentionManager(database)
+        # Con RANK_TRACKER_EXPORT_DIR lo storico viene esportato prima di ogni pulizia
+        self.exporter = HistoryExporter(database) if EXPORT_DIR else None
         
         # Configura logging
         logging.getLogger('apscheduler').setLevel(logging.WARNING)
@@ -18,6 +38,7 @@ class RankScheduler:
         """Avvia lo scheduler"""
         if not self.scheduler.running:
             self.scheduler.start()
+            self.schedule_retention()
             print("Scheduler avviato")
     
     def stop(self):
@@ -26,26 +47,63 @@ class RankScheduler:
             self.scheduler.shutdown()
             print("Scheduler fermato")
     
-    def schedule_project(self, project_id: int, hours: int = 24):
-        """Schedula il controllo di un progetto"""
-        job_id = f"project_{project_id}"
+    def schedule_project(self, project_id: int, hours: int = 24, state: dict = None):
+        """
+        Schedula il controllo di un progetto. Riprende la scadenza salvata se l'intervallo non è
+        cambiato, altrimenti parte dalla fase del progetto nell'intervallo (progetti sfalsati)
+        """
+        if state is None:
+            state = self.db.get_schedule_state(project_id)
         
-        # Rimuovi job esistente se presente
-        if self.scheduler.get_job(job_id):
-            self.scheduler.remove_job(job_id)
+        now = utc_now()
+        due = None
+        if state and state['interval_hours'] == hours:
+            # Un check scaduto durante il fermo viene recuperato presto, ma la scadenza salvata
+            # non cambia: dopo il recupero il progetto torna alla sua fase
+            due = resume_due(project_id, parse_timestamp(state['next_due_at']), hours, now)
+        if due is None:
+            due = first_due(project_id, hours, now)
+            self.db.save_schedule_state(project_id, hours, format_timestamp(due))
         
-        # Aggiungi nuovo job
+        self._add_project_job(project_id, due)
+        print(f"Progetto {project_id} schedulato ogni {hours} ore (prossimo check {format_timestamp(due)} UTC)")
+    
+    def _add_project_job(self, project_id: int, due):
+        """Job singolo alla prossima scadenza: viene rischedulato a ogni esecuzione"""
         self.scheduler.add_job(
             func=self._run_project_check,
-            trigger=IntervalTrigger(hours=hours),
+            trigger=DateTrigger(run_date=due),
             args=[project_id],
-            id=job_id,
+            id=f"project_{project_id}",
             name=f"Rank Check Project {project_id}",
             replace_existing=True,
+            misfire_grace_time=None,  # Un check in ritardo si esegue comunque
             max_instances=1  # Evita sovrapposizioni
         )
+    
+    def schedule_retention(self, hours: float = RETENTION_INTERVAL_HOURS):
+        """Schedula rollup e pulizia dello storico (0 = disattivato)"""
+        if not hours:
+            return
         
-        print(f"Progetto {project_id} schedulato ogni {hours} ore")
+        self.scheduler.add_job(
+            func=self._run_retention,
+            trigger=IntervalTrigger(hours=hours),
+            id="retention",
+            name="History Retention",
+            replace_existing=True,
+            max_instances=1,
+            next_run_time=datetime.now()  # Primo passaggio subito dopo l'avvio
+        )
+    
+    async def _run_retention(self):
+        """Esegue export (se configurato) e retention in un thread, senza bloccare l'event loop"""
+        try:
+            if self.exporter:
+                await self.adb.run(self.exporter.run)
+            await self.adb.run(self.retention.run)
+        except Exception as e:
+            print(f"Errore durante retention storico: {str(e)}")
     
     def remove_project_schedule(self, project_id: int):
         """Rimuove lo schedule di un progetto"""
@@ -53,100 +111,185 @@ class RankScheduler:
         if self.scheduler.get_job(job_id):
             self.scheduler.remove_job(job_id)
             print(f"Schedule rimosso per progetto {project_id}")
+        self.db.delete_schedule_state(project_id)
     
     async def _run_project_check(self, project_id: int):
-        """Esegue il controllo di un progetto"""
-        if project_id in self.running_jobs:
-            print(f"Progetto {project_id} già in esecuzione, skip...")
-            return
-        
+        """Accoda le keywords scadute di un progetto e pianifica il controllo successivo"""
         try:
-            self.running_jobs.add(project_id)
-            print(f"Inizio check automatico progetto {project_id} - {datetime.now()}")
-            
-            # Recupera dati progetto
-            project = self.db.get_project(project_id)
-            if not project or not project['active']:
-                print(f"Progetto {project_id} non trovato o inattivo")
-                return
-            
-            keywords = self.db.get_keywords(project_id)
-            if not keywords:
-                print(f"Nessuna keyword trovata per progetto {project_id}")
-                return
-            
-            keyword_list = [kw['keyword'] for kw in keywords]
-            
-            print(f"Controllo {len(keyword_list)} keywords per {project['domain']}")
-            
-            # Esegui il controllo con il nuovo sistema modulare
-            localization_config = self.db.get_project_localization(project_id)
-            tracking_config = self.db.get_project_tracking_config(project_id)
-            
-            results = await self.tracker.check_rankings_complete(
-                domain=project['domain'], 
-                keywords=keyword_list, 
-                localization_config=localization_config,
-                tracking_config=tracking_config
-            )
-            
-            # Salva risultati modulari
-            self._save_modular_results(project_id, results)
-            
-            # Statistiche
-            found_count, avg_position = self._calculate_stats(results)
-            
-            print(f"✅ Check completato per progetto {project_id}:")
-            print(f"  - Keywords trovate: {found_count}/{len(keyword_list)}")
-            print(f"  - Posizione media: {avg_position:.1f}")
-            print(f"  - Tracking mode: {tracking_config.get('tracking_mode', 'ORGANIC_ONLY')}")
-            
+            state = await self.adb.get_schedule_state(project_id)
+            await self.enqueue_project(project_id, trigger='scheduled', priority=PRIORITY_SCHEDULED,
+                                       due_only=True, anchor=state['next_due_at'] if state else None)
         except Exception as e:
             print(f"Errore durante check progetto {project_id}: {str(e)}")
-            
         finally:
-            self.running_jobs.discard(project_id)
+            await self._reschedule_project(project_id)
     
-    def _save_modular_results(self, project_id: int, results: dict):
-        """Salva i risultati modulari nel database"""
-        for keyword, result_data in results.items():
-            if 'error' in result_data:
-                continue
-            
-            # Salva risultati organici nel vecchio formato per compatibilità
-            organic_position = None
-            target_positions = result_data.get('target_positions', {})
-            if 'organic' in target_positions:
-                organic_position = target_positions['organic'].get('position')
-            
-            # Salva nel vecchio formato
-            self.db.save_result(project_id, keyword, organic_position)
-            
-            # Salva tutte le SERP features
-            all_features = []
-            for result_type, results_list in result_data.items():
-                if result_type in ['metadata', 'target_positions']:
-                    continue
-                
-                if isinstance(results_list, list):
-                    for result in results_list:
-                        all_features.append({
-                            'result_type': result_type,
-                            'position': result.get('position'),
-                            'domain': result.get('domain'),
-                            'url': result.get('url'),
-                            'title': result.get('title'),
-                            'snippet': result.get('snippet')
-                        })
+    async def _reschedule_project(self, project_id: int):
+        """
+        Salva l'esecuzione e programma la scadenza successiva: la prossima del progetto (stessa fase
+        della precedente) o, se prima, quella della prima keyword di un tier più frequente
+        """
+        state = await self.adb.get_schedule_state(project_id)
+        if not state:
+            return  # Schedule rimosso nel frattempo
+        
+        now = utc_now()
+        due = next_due(parse_timestamp(state['next_due_at']), state['interval_hours'], now)
+        keyword_due = parse_timestamp(await self.adb.get_next_keyword_due(project_id))
+        if keyword_due:
+            # Keywords già scadute (progetto ancora in coda) si riprovano dopo la finestra di anticipo
+            due = min(due, max(keyword_due, now + timedelta(minutes=CLAIM_AHEAD_MINUTES)))
+        deferred_until = self._deferred_until.pop(project_id, None)
+        if deferred_until and deferred_until > now:
+            # Budget esaurito: le keywords rimaste in scadenza ripartono con il budget del giorno dopo
+            due = max(due, deferred_until)
+        await self.adb.save_schedule_state(project_id, state['interval_hours'], format_timestamp(due),
+                                           last_run_at=format_timestamp(now))
+        self._add_project_job(project_id, due)
+    
+    def is_queued(self, project_id: int) -> bool:
+        """True se il progetto ha già un job in coda o in fase di accodamento"""
+        return self.queue.get_job(project_id) is not None or project_id in self._enqueuing
+    
+    async def enqueue_project(self, project_id: int, trigger: str = 'scheduled',
+                              priority: int = PRIORITY_SCHEDULED, due_only: bool = False,
+                              anchor: str = None) -> CrawlJob:
+        """
+        Apre un check run e accoda le keywords del progetto nella coda globale: tutte, o con due_only
+        solo quelle scadute secondo il loro tier (anchor = scadenza del progetto per le keywords nuove).
+        Se il progetto è già in coda il job esistente viene solo promosso alla priorità richiesta.
+        Ogni keyword accodata consuma il budget giornaliero: i check schedulati accodano quelle che ci
+        stanno e rinviano le altre, quelli manuali sollevano BudgetExceeded se non ci stanno tutte
+        """
+        queued = self.queue.get_job(project_id)
+        if queued or project_id in self._enqueuing:
+            if self.queue.promote(project_id, priority):
+                print(f"Progetto {project_id} già in coda, promosso a priorità {priority}")
+            else:
+                print(f"Progetto {project_id} già in esecuzione, skip...")
+            return queued
+        
+        # Un solo accodamento per progetto anche tra le query che seguono
+        self._enqueuing.add(project_id)
+        try:
+            return await self._enqueue_project(project_id, trigger, priority, due_only, anchor)
+        finally:
+            self._enqueuing.discard(project_id)
+    
+    async def _enqueue_project(self, project_id: int, trigger: str, priority: int, due_only: bool,
+                               anchor: str = None) -> CrawlJob:
+        print(f"Accodamento check {trigger} progetto {project_id} - {datetime.now()}")
+        
+        # Recupera dati progetto
+        project = await self.adb.get_project(project_id)
+        if not project or not project['active']:
+            print(f"Progetto {project_id} non trovato o inattivo")
+            return None
+        
+        localization_config, tracking_config, rate_limit_config, cache_config = await asyncio.gather(
+            self.adb.get_project_localization(project_id),
+            self.adb.get_project_tracking_config(project_id),
+            self.adb.get_project_rate_limit_config(project_id),
+            self.adb.get_project_cache_config(project_id)
+        )
+        
+        day = budget_day()
+        # Fetch riservati e keywords assegnate finora: restituiti se l'accodamento fallisce a metà
+        reserved = 0
+        keyword_list = []
+        run_id = None
+        try:
+            if due_only:
+                until = format_timestamp(utc_now() + timedelta(minutes=CLAIM_AHEAD_MINUTES))
+                due_count = await self.adb.count_due_keywords(project_id, until)
+                reserved = granted = await self.adb.reserve_crawl_budget(project_id, due_count, day=day)
+                if granted:
+                    keyword_list = await self.adb.claim_due_keywords(project_id, project['schedule_hours'], until,
+                                                                     anchor, limit=granted)
+                await self.adb.release_crawl_budget(project_id, granted - len(keyword_list), day=day)
+                reserved = len(keyword_list)
+                if granted < due_count:
+                    # Ogni progetto alla sua fase nella finestra di recupero, non tutti a mezzanotte
+                    self._deferred_until[project_id] = (
+                        next_window() + timedelta(minutes=CATCH_UP_MINUTES) * phase_of(project_id))
+                    print(f"Budget giornaliero esaurito per progetto {project_id}: "
+                          f"{due_count - granted} keywords rinviate al {format_timestamp(self._deferred_until[project_id])}")
+            else:
+                keyword_list = [kw['keyword'] for kw in await self.adb.get_keywords(project_id)]
+                await self.adb.reserve_crawl_budget(project_id, len(keyword_list), all_or_nothing=True, day=day)
+                reserved = len(keyword_list)
+            if not keyword_list:
+                print(f"Nessuna keyword da controllare per progetto {project_id}")
+                return None
             
-            if all_features:
-                self.db.save_serp_features_batch(project_id, keyword, all_features)
+            run_id = await self.adb.start_check_run(project_id, len(keyword_list), trigger=trigger)
+            job = CrawlJob(
+                project_id=project_id,
+                domain=project['domain'],
+                keywords=keyword_list,
+                localization_config=localization_config,
+                tracking_config=tracking_config,
+                rate_limit_config=rate_limit_config,
+                cache_config=cache_config,
+                priority=priority,
+                run_id=run_id,
+                on_complete=self._on_check_complete,
+                on_abort=functools.partial(self._on_check_aborted, day=day, claimed=due_only)
+            )
+            await self.queue.submit(job)
+        except Exception as e:
+            await self._undo_enqueue(project_id, day, reserved, keyword_list if due_only else [], run_id, e)
+            raise
         
-        # Aggiorna last_check del progetto
+        print(f"Accodate {len(keyword_list)} keywords per {project['domain']} (priorità {priority})")
+        return job
+    
+    async def _undo_enqueue(self, project_id: int, day: str, reserved: int, claimed: list, run_id: int,
+                            error: Exception):
+        """Accodamento fallito: restituisce il budget riservato, le keywords assegnate e chiude il run"""
         try:
-            self.db.save_results_batch(project_id, {})  # Trigger per aggiornare last_check
-        except:
-            pass
+            if reserved:
+                await self.adb.release_crawl_budget(project_id, reserved, day=day)
+            if claimed:
+                await self.adb.reset_keywords_due(project_id, claimed)
+            if run_id is not None:
+                await self.adb.finish_check_run(run_id, 'failed', str(error))
+        except Exception as e:
+            print(f"❌ Errore annullando l'accodamento del progetto {project_id}: {str(e)}")
+    
+    async def _on_check_complete(self, job: CrawlJob):
+        """Salva i risultati di un job completato dalla coda"""
+        results = job.ordered_results()
+        try:
+            await self._save_modular_results(job.project_id, results, job.run_id)
+        except Exception as e:
+            await self.adb.finish_check_run(job.run_id, 'failed', str(e))
+            raise
+        
+        # Statistiche
+        found_count, avg_position = self._calculate_stats(results)
+        
+        print(f"✅ Check completato per progetto {job.project_id}:")
+        print(f"  - Keywords trovate: {found_count}/{len(job.keywords)}")
+        print(f"  - Posizione media: {avg_position:.1f}")
+        print(f"  - Tracking mode: {job.tracking_config.get('tracking_mode', 'ORGANIC_ONLY')}")
+    
+    async def _on_check_aborted(self, job: CrawlJob, day: str, claimed: bool):
+        """
+        Chiude un job scartato dalla coda (arresto): run 'aborted', budget restituito per le keywords
+        mai avviate e, se erano state assegnate dai tier, keywords di nuovo in scadenza
+        """
+        await self.adb.finish_check_run(job.run_id, 'aborted', "Check interrotto dall'arresto dello scheduler")
+        await self.adb.release_crawl_budget(job.project_id, len(job.pending), day=day)
+        if claimed:
+            # Nessun risultato viene salvato: anche le keywords già controllate vanno ripetute
+            await self.adb.reset_keywords_due(job.project_id, job.keywords)
+        print(f"⚠️ Check progetto {job.project_id} interrotto: {len(job.results)}/{len(job.keywords)} "
+              f"keywords controllate, {len(job.pending)} fetch restituiti al budget")
+    
+    async def _save_modular_results(self, project_id: int, results: dict, run_id: int = None):
+        """Salva i risultati modulari nel database (un'unica transazione, chiude il run e aggiorna last_check)"""
+        return await self.adb.save_check_run(project_id, results, run_id)
     
     def _calculate_stats(self, results: dict) -> tuple:
         """Calcola statistiche dai risultati modulari"""
@@ -180,10 +323,16 @@ class RankScheduler:
         ]
     
     def load_existing_schedules(self):
-        """Carica gli schedule esistenti dal database all'avvio"""
+        """Carica gli schedule esistenti dal database all'avvio, riprendendo le scadenze salvate"""
+        # Run rimasti 'running' da un processo terminato durante un check
+        stale = self.db.abort_stale_runs()
+        if stale:
+            print(f"⚠️ {stale} check run interrotti dal riavvio chiusi come 'aborted'")
+        
         projects = self.db.get_all_projects()
+        states = self.db.get_schedule_states()
         for project in projects:
             if project['active']:
-                self.schedule_project(project['id'], project['schedule_hours'])
+                self.schedule_project(project['id'], project['schedule_hours'], states.get(project['id'], {}))
         
         print(f"Caricati {len(projects)} schedule dal database")
\ No newline at end of file
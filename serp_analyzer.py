@@ -3,31 +3,73 @@ Modulo per analisi completa SERP con tutti i tipi di risultati
 """
 
 import re
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from serp_extractor import AnchorIndex, SERPDocument, SERPDocumentParser
+
+# Versione delle regole di estrazione: va incrementata a ogni modifica che cambia i risultati
+PARSER_VERSION = "3"
+
+# Token "dominio" nel testo di un blocco (stessa regola dei pattern regex)
+DOMAIN_TOKEN_PATTERN = re.compile(r'(?:https?://)?([^/\s<>"]+\.[a-z]{2,})', re.IGNORECASE)
+
+# Tipi di risultato standard, nell'ordine di analisi
+RESULT_TYPES = ('organic', 'ads', 'featured_snippets', 'local_pack', 'shopping')
+
+# Estrattori registrati per engine e tipo di risultato: funzione(analyzer, page) -> lista risultati
+EXTRACTORS: Dict[str, Dict[str, Callable]] = {'dom': {}, 'regex': {}}
+
+
+def register_extractor(result_type: str, engine: str = 'dom'):
+    """Decoratore che registra (o sostituisce) l'estrattore di un tipo di risultato"""
+    def decorator(func: Callable) -> Callable:
+        EXTRACTORS.setdefault(engine, {})[result_type] = func
+        return func
+    return decorator
+
+
+class SERPPage:
+    """HTML di una SERP: tokenizzazione e indice dei link calcolati al primo utilizzo"""
+    
+    def __init__(self, html: str):
+        self.html = html
+        self._document: Optional[SERPDocument] = None
+    
+    @property
+    def document(self) -> SERPDocument:
+        if self._document is None:
+            self._document = SERPDocumentParser.parse(self.html)
+        return self._document
+    
+    @property
+    def anchor_index(self) -> AnchorIndex:
+        return self.document.anchor_index
+
 
 class SERPAnalyzer:
     """Analizzatore completo per tutti i tipi di risultati SERP"""
     
-    def __init__(self):
-        pass
+    def __init__(self, engine: str = 'dom'):
+        # 'dom': tokenizzazione single-pass; 'regex': pattern originali sull'intero documento
+        self.engine = engine
     
-    def analyze_complete_serp(self, html: str, target_domain: str = None) -> Dict:
-        """Analizza completamente una SERP per tutti i tipi di risultati"""
-        results = {
-            'organic': [],
-            'ads': [],
-            'featured_snippets': [],
-            'local_pack': [],
-            'shopping': [],
-            'target_positions': {}
-        }
-        
-        # Analizza ogni tipo di risultato
-        results['organic'] = self._extract_organic_results(html)
-        results['ads'] = self._extract_ads(html)
-        results['featured_snippets'] = self._extract_featured_snippets(html)
-        results['local_pack'] = self._extract_local_pack(html)
-        results['shopping'] = self._extract_shopping_results(html)
+    def analyze_complete_serp(self, html: str, target_domain: str = None,
+                              result_types: Iterable[str] = None) -> Dict:
+        """
+        Analizza la SERP eseguendo solo gli estrattori richiesti (default: tutti quelli registrati).
+        Le posizioni del dominio target vengono calcolate solo sui tipi estratti.
+        """
+        extractors = EXTRACTORS[self.engine]
+        if result_types is None:
+            result_types = list(extractors)
+        
+        unknown = [t for t in result_types if t not in extractors]
+        if unknown:
+            raise ValueError(f"Tipi di risultato non supportati dall'engine '{self.engine}': {unknown}")
+        
+        page = SERPPage(html)
+        results = {result_type: extractors[result_type](self, page) for result_type in result_types}
+        results['target_positions'] = {}
         
         # Se specificato, trova le posizioni del dominio target
         if target_domain:
@@ -35,9 +77,138 @@ class SERPAnalyzer:
         
         return results
     
-    def _extract_organic_results(self, html: str) -> List[Dict]:
+    def analyze_for_domain(self, analysis: Dict, target_domain: str) -> Dict:
+        """
+        Calcola le posizioni di un dominio su un'analisi SERP già eseguita (condivisibile tra progetti).
+        Vengono copiati solo i tipi di risultato (liste), non eventuali altri campi dell'analisi
+        """
+        results = {k: v for k, v in analysis.items() if isinstance(v, list)}
+        results['target_positions'] = self._find_target_positions(results, target_domain) if target_domain else {}
+        return results
+    
+    def _document_organic(self, document: SERPDocument) -> List[Dict]:
+        """Risultati organici: cite in ordine di documento, con fallback su blocchi .g e link h3"""
+        organic_domains = []
+        organic_blocks = {}
+        
+        # Pattern principale: cite (più affidabile per ordine)
+        for text, block in document.organic_cites:
+            domain = self._clean_domain(text.split()[0])
+            if domain and self._is_valid_organic_domain(domain) and domain not in organic_blocks:
+                organic_domains.append(domain)
+                organic_blocks[domain] = block
+        
+        # Backup: primo link di ogni container organico, poi link dentro h3
+        if not organic_domains:
+            candidates = [
+                (next((a for a in block.anchors if a.url.startswith('http')), None), block)
+                for block in document.organic_blocks
+            ]
+            if not any(anchor for anchor, _ in candidates):
+                candidates = [(a, None) for a in document.anchors if a.in_heading and a.url.startswith('http')]
+            
+            for anchor, block in candidates:
+                if anchor is None:
+                    continue
+                domain = self._extract_domain_from_url(anchor.url)
+                domain = self._clean_domain(domain) if domain else None
+                if domain and self._is_valid_organic_domain(domain) and domain not in organic_blocks:
+                    organic_domains.append(domain)
+                    organic_blocks[domain] = block
+        
+        organic_results = []
+        for i, domain in enumerate(organic_domains, 1):
+            block = organic_blocks[domain]
+            anchor = None
+            if block is not None:
+                anchor = next((a for a in block.anchors if domain in a.url.lower()), None)
+            if anchor is None:
+                anchor = document.first_anchor_for(domain)
+            
+            title = self._clean_text(''.join(anchor.heading)) if anchor else ''
+            if not title and block is not None and block.headings:
+                title = self._clean_text(block.headings[0])
+            
+            organic_results.append({
+                'position': i,
+                'domain': domain,
+                'url': anchor.url if anchor and anchor.url.startswith('http') else f'https://{domain}',
+                'title': title,
+                'snippet': self._clean_text(' '.join(block.description)) if block is not None else '',
+                'result_type': 'organic'
+            })
+        
+        return organic_results
+    
+    def _document_links(self, blocks: List, result_type: str) -> List[Dict]:
+        """Ads e shopping: primo link con dominio di ogni blocco"""
+        results = []
+        found_urls = set()
+        
+        for block in blocks:
+            for anchor in block.anchors:
+                domain = self._extract_domain_from_url(anchor.url)
+                if not domain:
+                    continue
+                if anchor.url not in found_urls:
+                    results.append({
+                        'position': len(results) + 1,
+                        'domain': domain,
+                        'url': anchor.url,
+                        'title': self._clean_text(''.join(anchor.text)),
+                        'snippet': '',
+                        'result_type': result_type
+                    })
+                    found_urls.add(anchor.url)
+                break
+        
+        return results
+    
+    def _document_domains(self, document: SERPDocument, block_kind: str, result_type: str) -> List[Dict]:
+        """Featured snippets e local pack: un dominio per blocco (cite, link o testo)"""
+        results = []
+        found_domains = set()
+        
+        for block in document.blocks[block_kind]:
+            domain = None
+            for cite in block.cites:
+                domain = self._clean_domain(cite.split()[0])
+                if domain:
+                    break
+            
+            if not domain and not block.requires_cite:
+                for anchor in block.anchors:
+                    candidate = self._extract_domain_from_url(anchor.url) if anchor.url.startswith('http') else None
+                    candidate = self._clean_domain(candidate) if candidate else None
+                    if candidate and self._is_valid_organic_domain(candidate):
+                        domain = candidate
+                        break
+            
+            if not domain and not block.requires_cite:
+                match = DOMAIN_TOKEN_PATTERN.search(''.join(block.text))
+                if match:
+                    domain = self._clean_domain(match.group(1))
+            
+            if domain and domain not in found_domains:
+                anchor = document.first_anchor_for(domain)
+                results.append({
+                    # Featured snippets sono posizione 0
+                    'position': 0 if result_type == 'featured_snippet' else len(results) + 1,
+                    'domain': domain,
+                    'url': anchor.url if anchor and anchor.url.startswith('http') else f'https://{domain}',
+                    'title': self._clean_text(''.join(anchor.heading)) if anchor else '',
+                    'snippet': '',
+                    'result_type': result_type
+                })
+                found_domains.add(domain)
+        
+        return results
+    
+    def _extract_organic_results(self, html: str, index: AnchorIndex = None) -> List[Dict]:
         """Estrae risultati organici ordinati per posizione"""
         organic_results = []
+        if index is None:
+            index = SERPDocumentParser.parse(html).anchor_index
         
         # Pattern migliorati per risultati organici
         patterns = [
@@ -67,7 +238,7 @@ class SERPAnalyzer:
                         organic_domains.append(domain)
                         
                         # Cerca contesto per URL e titolo
-                        context = self._find_result_context(html, domain)
+                        context = self._find_result_context(index, domain)
                         organic_details[domain] = context
             else:
                 matches = re.findall(pattern, html, re.IGNORECASE | re.DOTALL)
@@ -75,7 +246,7 @@ class SERPAnalyzer:
                     domain = self._clean_domain(match)
                     if domain and self._is_valid_organic_domain(domain) and domain not in organic_domains:
                         organic_domains.append(domain)
-                        organic_details[domain] = self._find_result_context(html, domain)
+                        organic_details[domain] = self._find_result_context(index, domain)
             
             if organic_domains:  # Se troviamo risultati, usiamo questi
                 break
@@ -130,9 +301,11 @@ class SERPAnalyzer:
         
         return ads_results
     
-    def _extract_featured_snippets(self, html: str) -> List[Dict]:
+    def _extract_featured_snippets(self, html: str, index: AnchorIndex = None) -> List[Dict]:
         """Estrae featured snippets e knowledge panels"""
         snippets = []
+        if index is None:
+            index = SERPDocumentParser.parse(html).anchor_index
         
         # Pattern per featured snippets
         snippet_patterns = [
@@ -151,7 +324,7 @@ class SERPAnalyzer:
             for match in matches:
                 domain = self._clean_domain(match)
                 if domain and domain not in found_domains:
-                    context = self._find_result_context(html, domain)
+                    context = self._find_result_context(index, domain)
                     snippets.append({
                         'position': 0,  # Featured snippets sono posizione 0
                         'domain': domain,
@@ -164,9 +337,11 @@ class SERPAnalyzer:
         
         return snippets
     
-    def _extract_local_pack(self, html: str) -> List[Dict]:
+    def _extract_local_pack(self, html: str, index: AnchorIndex = None) -> List[Dict]:
         """Estrae risultati del local pack / Google Maps"""
         local_results = []
+        if index is None:
+            index = SERPDocumentParser.parse(html).anchor_index
         
         # Pattern per local pack
         local_patterns = [
@@ -182,7 +357,7 @@ class SERPAnalyzer:
             for match in matches:
                 domain = self._clean_domain(match)
                 if domain and domain not in found_domains:
-                    context = self._find_result_context(html, domain)
+                    context = self._find_result_context(index, domain)
                     local_results.append({
                         'position': position,
                         'domain': domain,
@@ -285,21 +460,19 @@ class SERPAnalyzer:
         
         return False
     
-    def _find_result_context(self, html: str, domain: str) -> Dict:
-        """Trova contesto (URL, titolo, snippet) per un dominio"""
+    def _find_result_context(self, index: AnchorIndex, domain: str) -> Dict:
+        """Trova contesto (URL, titolo, snippet) per un dominio tramite l'indice dei link"""
         context = {'url': '', 'title': '', 'snippet': ''}
         
-        # Cerca URL completa
-        url_pattern = rf'href="(https?://[^"]*{re.escape(domain)}[^"]*)"'
-        url_match = re.search(url_pattern, html, re.IGNORECASE)
-        if url_match:
-            context['url'] = url_match.group(1)
+        anchor = index.first(domain)
+        if anchor is None:
+            return context
         
-        # Cerca titolo (di solito in h3 vicino al link)
-        title_pattern = rf'<h3[^>]*>.*?<a[^>]*href="[^"]*{re.escape(domain)}[^"]*"[^>]*>([^<]+)</a>'
-        title_match = re.search(title_pattern, html, re.IGNORECASE | re.DOTALL)
-        if title_match:
-            context['title'] = self._clean_text(title_match.group(1))
+        context['url'] = anchor.url
+        # Titolo: h3 che contiene il link (o contenuto nel link)
+        context['title'] = self._clean_text(index.title_for(domain))
+        if anchor.block is not None:
+            context['snippet'] = self._clean_text(' '.join(anchor.block.description))
         
         return context
     
@@ -351,4 +524,148 @@ class SERPAnalyzer:
         text = re.sub(r'<[^>]+>', '', text)
         # Normalizza whitespace
         text = re.sub(r'\s+', ' ', text)
-        return text.strip()
\ No newline at end of file
+        return text.strip()
+
+
+# Engine 'dom': un solo attraversamento del documento condiviso da tutti gli estrattori
+@register_extractor('organic')
+def _dom_organic(analyzer: SERPAnalyzer, page: SERPPage) -> List[Dict]:
+    # Fallback sui pattern regex se la struttura della pagina non è riconosciuta
+    return (analyzer._document_organic(page.document)
+            or analyzer._extract_organic_results(page.html, page.anchor_index))
+
+
+@register_extractor('ads')
+def _dom_ads(analyzer: SERPAnalyzer, page: SERPPage) -> List[Dict]:
+    return analyzer._document_links(page.document.blocks['ads'], 'ads')
+
+
+@register_extractor('featured_snippets')
+def _dom_featured_snippets(analyzer: SERPAnalyzer, page: SERPPage) -> List[Dict]:
+    return analyzer._document_domains(page.document, 'featured_snippets', 'featured_snippet')
+
+
+@register_extractor('local_pack')
+def _dom_local_pack(analyzer: SERPAnalyzer, page: SERPPage) -> List[Dict]:
+    return analyzer._document_domains(page.document, 'local_pack', 'local_pack')
+
+
+@register_extractor('shopping')
+def _dom_shopping(analyzer: SERPAnalyzer, page: SERPPage) -> List[Dict]:
+    return analyzer._document_links(page.document.blocks['shopping'], 'shopping')
+
+
+# Engine 'regex': pattern originali; l'indice dei link viene costruito solo se serve
+@register_extractor('organic', engine='regex')
+def _regex_organic(analyzer: SERPAnalyzer, page: SERPPage) -> List[Dict]:
+    return analyzer._extract_organic_results(page.html, page.anchor_index)
+
+
+@register_extractor('ads', engine='regex')
+def _regex_ads(analyzer: SERPAnalyzer, page: SERPPage) -> List[Dict]:
+    return analyzer._extract_ads(page.html)
+
+
+@register_extractor('featured_snippets', engine='regex')
+def _regex_featured_snippets(analyzer: SERPAnalyzer, page: SERPPage) -> List[Dict]:
+    return analyzer._extract_featured_snippets(page.html, page.anchor_index)
+
+
+@register_extractor('local_pack', engine='regex')
+def _regex_local_pack(analyzer: SERPAnalyzer, page: SERPPage) -> List[Dict]:
+    return analyzer._extract_local_pack(page.html, page.anchor_index)
+
+
+@register_extractor('shopping', engine='regex')
+def _regex_shopping(analyzer: SERPAnalyzer, page: SERPPage) -> List[Dict]:
+    return analyzer._extract_shopping_results(page.html)
+
+
+def result_types_for_tracking(tracking_config: Optional[Dict]) -> Tuple[str, ...]:
+    """Tipi di risultato da estrarre per una configurazione di tracking (stesse regole del filtro)"""
+    if not tracking_config:
+        return RESULT_TYPES
+    
+    tracking_mode = tracking_config.get('tracking_mode', 'ORGANIC_ONLY')
+    if tracking_mode == 'ORGANIC_ONLY':
+        return ('organic',)
+    if tracking_mode == 'FULL_SERP':
+        return RESULT_TYPES
+    
+    # CUSTOM: organici sempre inclusi
+    flags = {
+        'ads': 'track_ads',
+        'featured_snippets': 'track_snippets',
+        'local_pack': 'track_local',
+        'shopping': 'track_shopping'
+    }
+    return ('organic',) + tuple(t for t, flag in flags.items() if tracking_config.get(flag, False))
+
+
+def filter_by_tracking_config(serp_analysis: Dict, tracking_config: Dict) -> Dict:
+    """Filtra risultati SERP in base alla configurazione di tracking"""
+    tracking_mode = tracking_config.get('tracking_mode', 'ORGANIC_ONLY')
+    
+    if tracking_mode == 'ORGANIC_ONLY':
+        # Mantieni solo organici
+        return {
+            'organic': serp_analysis.get('organic', []),
+            'target_positions': {
+                k: v for k, v in serp_analysis.get('target_positions', {}).items() 
+                if k == 'organic'
+            }
+        }
+    elif tracking_mode == 'FULL_SERP':
+        # Mantieni tutto
+        return serp_analysis
+    else:  # CUSTOM
+        # Filtra in base alle impostazioni specifiche
+        filtered = {}
+        
+        # Organici sempre inclusi
+        filtered['organic'] = serp_analysis.get('organic', [])
+        
+        # Ads se abilitati
+        if tracking_config.get('track_ads', False):
+            filtered['ads'] = serp_analysis.get('ads', [])
+        
+        # Featured snippets se abilitati
+        if tracking_config.get('track_snippets', False):
+            filtered['featured_snippets'] = serp_analysis.get('featured_snippets', [])
+        
+        # Local pack se abilitato
+        if tracking_config.get('track_local', False):
+            filtered['local_pack'] = serp_analysis.get('local_pack', [])
+        
+        # Shopping se abilitato
+        if tracking_config.get('track_shopping', False):
+            filtered['shopping'] = serp_analysis.get('shopping', [])
+        
+        # Filtra target positions
+        filtered['target_positions'] = {
+            k: v for k, v in serp_analysis.get('target_positions', {}).items()
+            if k in filtered
+        }
+        
+        return filtered
+
+
+def flatten_serp_features(serp_analysis: Dict) -> List[Dict]:
+    """Converte un'analisi SERP nelle righe da salvare in serp_features"""
+    features = []
+    for result_type, results_list in serp_analysis.items():
+        if result_type in ['metadata', 'target_positions']:
+            continue
+        
+        if isinstance(results_list, list):
+            for result in results_list:
+                features.append({
+                    'result_type': result_type,
+                    'position': result.get('position'),
+                    'domain': result.get('domain'),
+                    'url': result.get('url'),
+                    'title': result.get('title'),
+                    'snippet': result.get('snippet')
+                })
+    
+    return features
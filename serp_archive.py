@@ -0,0 +1,259 @@
+"""
+Archivio su disco dell'HTML grezzo delle SERP
+Contenuto compresso e deduplicato per hash, indicizzato per (keyword, localizzazione, fetched_at)
+"""
+
+import gzip
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_ARCHIVE_DIR = os.getenv('RANK_TRACKER_ARCHIVE_DIR', 'serp_archive')
+DEFAULT_MAX_AGE_DAYS = float(os.getenv('RANK_TRACKER_ARCHIVE_MAX_DAYS', '90'))
+DEFAULT_MAX_SIZE_MB = float(os.getenv('RANK_TRACKER_ARCHIVE_MAX_MB', '2048'))
+
+
+def locale_key(localization_config: Dict) -> str:
+    """Chiave compatta della localizzazione, es. IT/it/roma/CR"""
+    parts = [
+        localization_config.get('country_code', 'IT'),
+        localization_config.get('language_code', 'it'),
+        localization_config.get('city_code') or '-',
+        'CR' if localization_config.get('content_restriction', True) else '-'
+    ]
+    return '/'.join(parts)
+
+
+def blob_path(archive_dir, content_hash: str) -> Path:
+    """Percorso del blob compresso per un hash di contenuto"""
+    return Path(archive_dir) / 'blobs' / content_hash[:2] / f"{content_hash}.html.gz"
+
+
+def read_blob(archive_dir, content_hash: str) -> Optional[str]:
+    """Legge e decomprime un blob (utilizzabile anche dai worker di un process pool)"""
+    try:
+        return gzip.decompress(blob_path(archive_dir, content_hash).read_bytes()).decode('utf-8')
+    except FileNotFoundError:
+        return None
+
+
+class SERPArchive:
+    """Archivio content-addressed con eviction per età e dimensione"""
+
+    def __init__(self,
+                 archive_dir: str = DEFAULT_ARCHIVE_DIR,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                 max_size_mb: float = DEFAULT_MAX_SIZE_MB,
+                 evict_every: int = 200):
+        self.archive_dir = Path(archive_dir)
+        self.blob_dir = self.archive_dir / 'blobs'
+        self.index_path = str(self.archive_dir / 'index.db')
+        self.max_age_days = max_age_days
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.evict_every = evict_every
+        self._stores_since_evict = 0
+        self.init_index()
+
+    @contextmanager
+    def _connect(self):
+        """Connessione all'indice in una transazione: commit (o rollback) e chiusura all'uscita"""
+        conn = sqlite3.connect(self.index_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def init_index(self):
+        """Crea directory e indice dell'archivio"""
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS serp_blobs (
+                    content_hash TEXT PRIMARY KEY,
+                    size_bytes INTEGER,
+                    compressed_bytes INTEGER,
+                    created_at REAL
+                )
+            """)
+
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS serp_fetches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    keyword TEXT NOT NULL,
+                    locale TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    FOREIGN KEY (content_hash) REFERENCES serp_blobs (content_hash)
+                )
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_serp_fetches_keyword_locale
+                ON serp_fetches (keyword, locale, fetched_at)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_serp_fetches_url
+                ON serp_fetches (url, fetched_at)
+            """)
+
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_serp_fetches_hash
+                ON serp_fetches (content_hash)
+            """)
+
+    def _blob_path(self, content_hash: str) -> Path:
+        return blob_path(self.archive_dir, content_hash)
+
+    def store(self, keyword: str, localization_config: Dict, url: str, html: str,
+              fetched_at: Optional[float] = None) -> Dict:
+        """Archivia l'HTML di una SERP; il contenuto identico viene salvato una sola volta"""
+        fetched_at = fetched_at or time.time()
+        raw = html.encode('utf-8')
+        content_hash = hashlib.sha256(raw).hexdigest()
+
+        with self._connect() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM serp_blobs WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+
+            if not exists:
+                path = self._blob_path(content_hash)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                compressed = gzip.compress(raw, compresslevel=6)
+                tmp_path = path.with_suffix('.tmp')
+                tmp_path.write_bytes(compressed)
+                os.replace(tmp_path, path)
+                conn.execute(
+                    "INSERT INTO serp_blobs (content_hash, size_bytes, compressed_bytes, created_at) VALUES (?, ?, ?, ?)",
+                    (content_hash, len(raw), len(compressed), fetched_at)
+                )
+
+            cursor = conn.execute(
+                "INSERT INTO serp_fetches (keyword, locale, url, content_hash, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (keyword, locale_key(localization_config), url, content_hash, fetched_at)
+            )
+            fetch_id = cursor.lastrowid
+
+        self._stores_since_evict += 1
+        if self.evict_every and self._stores_since_evict >= self.evict_every:
+            self.evict()
+
+        return {'id': fetch_id, 'content_hash': content_hash, 'fetched_at': fetched_at}
+
+    def get_latest(self, url: str, max_age_seconds: float) -> Optional[Dict]:
+        """Ultima SERP archiviata per la URL, se più recente di max_age_seconds"""
+        if not max_age_seconds or max_age_seconds <= 0:
+            return None
+
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("""
+                SELECT * FROM serp_fetches
+                WHERE url = ? AND fetched_at >= ?
+                ORDER BY fetched_at DESC
+                LIMIT 1
+            """, (url, time.time() - max_age_seconds)).fetchone()
+            return dict(row) if row else None
+
+    def load_html(self, content_hash: str) -> Optional[str]:
+        """Legge e decomprime l'HTML archiviato"""
+        return read_blob(self.archive_dir, content_hash)
+
+    def get_fetches(self, keyword: str = None, localization_config: Dict = None,
+                    since: Optional[float] = None) -> List[Dict]:
+        """Elenca i fetch archiviati, filtrati per keyword, localizzazione e data"""
+        return list(self.iter_fetches(keyword, localization_config, since))
+
+    def iter_fetches(self, keyword: str = None, localization_config: Dict = None,
+                     since: Optional[float] = None) -> Iterator[Dict]:
+        query = "SELECT * FROM serp_fetches WHERE 1 = 1"
+        params = []
+
+        if keyword:
+            query += " AND keyword = ?"
+            params.append(keyword)
+
+        if localization_config:
+            query += " AND locale = ?"
+            params.append(locale_key(localization_config))
+
+        if since:
+            query += " AND fetched_at >= ?"
+            params.append(since)
+
+        query += " ORDER BY fetched_at"
+
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            for row in conn.execute(query, params):
+                yield dict(row)
+
+    def evict(self) -> Dict:
+        """Rimuove i fetch troppo vecchi e, se serve, i più vecchi fino a rientrare nella dimensione massima"""
+        self._stores_since_evict = 0
+        removed_fetches = 0
+
+        with self._connect() as conn:
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed_fetches += conn.execute(
+                    "DELETE FROM serp_fetches WHERE fetched_at < ?", (cutoff,)
+                ).rowcount
+
+            removed_blobs = self._delete_orphan_blobs(conn)
+
+            if self.max_size_bytes:
+                total = conn.execute("SELECT COALESCE(SUM(compressed_bytes), 0) FROM serp_blobs").fetchone()[0]
+                while total > self.max_size_bytes:
+                    # Elimina il giorno di fetch più vecchio rimasto
+                    oldest = conn.execute("SELECT MIN(fetched_at) FROM serp_fetches").fetchone()[0]
+                    if oldest is None:
+                        break
+                    removed_fetches += conn.execute(
+                        "DELETE FROM serp_fetches WHERE fetched_at < ?", (oldest + 86400,)
+                    ).rowcount
+                    removed_blobs += self._delete_orphan_blobs(conn)
+                    total = conn.execute("SELECT COALESCE(SUM(compressed_bytes), 0) FROM serp_blobs").fetchone()[0]
+
+        if removed_fetches or removed_blobs:
+            print(f"🧹 Archivio SERP: rimossi {removed_fetches} fetch e {removed_blobs} blob")
+
+        return {'removed_fetches': removed_fetches, 'removed_blobs': removed_blobs}
+
+    def _delete_orphan_blobs(self, conn) -> int:
+        orphans = [row[0] for row in conn.execute("""
+            SELECT b.content_hash FROM serp_blobs b
+            WHERE NOT EXISTS (SELECT 1 FROM serp_fetches f WHERE f.content_hash = b.content_hash)
+        """)]
+
+        for content_hash in orphans:
+            try:
+                self._blob_path(content_hash).unlink()
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM serp_blobs WHERE content_hash = ?", (content_hash,))
+
+        return len(orphans)
+
+    def stats(self) -> Dict:
+        with self._connect() as conn:
+            fetches = conn.execute("SELECT COUNT(*) FROM serp_fetches").fetchone()[0]
+            blobs, size, compressed = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), COALESCE(SUM(compressed_bytes), 0) FROM serp_blobs"
+            ).fetchone()
+
+        return {
+            'fetches': fetches,
+            'blobs': blobs,
+            'size_bytes': size,
+            'compressed_bytes': compressed,
+            'max_size_bytes': self.max_size_bytes,
+            'max_age_days': self.max_age_days
+        }
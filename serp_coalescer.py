@@ -0,0 +1,97 @@
+"""
+Deduplicazione dei fetch SERP tra progetti
+Richieste identiche (stessa URL Google localizzata) condividono un solo crawl e un solo parsing
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from schedule_planner import KEYWORD_TIERS
+from volatility import MIN_INTERVAL_HOURS
+
+# Tetto della finestra: metà dell'intervallo di check più breve (tier hourly, intervallo adattivo minimo).
+# Con una finestra più lunga il check successivo della stessa keyword verrebbe servito dalla cache
+MAX_FRESHNESS_SECONDS = min(MIN_INTERVAL_HOURS, *KEYWORD_TIERS.values()) * 3600 / 2
+
+# Finestra di freschezza (secondi) entro cui una SERP già analizzata viene riutilizzata
+DEFAULT_FRESHNESS_SECONDS = min(float(os.getenv('RANK_TRACKER_SERP_FRESHNESS', '900')), MAX_FRESHNESS_SECONDS)
+
+
+class SERPFetchCoalescer:
+    """Unisce i fetch in corso e riusa quelli recenti, con chiave la URL Google"""
+
+    def __init__(self, freshness_seconds: Optional[float] = None, max_entries: int = 5000):
+        if freshness_seconds is None:
+            freshness_seconds = DEFAULT_FRESHNESS_SECONDS
+        self.freshness_seconds = min(freshness_seconds, MAX_FRESHNESS_SECONDS)
+        self.max_entries = max_entries
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.fetches = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def get_fresh(self, key: str) -> Optional[Dict]:
+        """Restituisce l'analisi in cache se ancora entro la finestra di freschezza"""
+        entry = self._cache.get(key)
+        if not entry:
+            return None
+
+        fetched_at, analysis = entry
+        if time.time() - fetched_at > self.freshness_seconds:
+            del self._cache[key]
+            return None
+
+        return analysis
+
+    def _store(self, key: str, analysis: Dict):
+        self._cache[key] = (time.time(), analysis)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def fetch(self, key: str, fetch_func: Callable[[], Awaitable[Dict]]) -> Dict:
+        """
+        Esegue fetch_func una sola volta per chiave: le richieste concorrenti attendono lo stesso
+        risultato, quelle successive lo riusano finché è fresco. Gli errori non vengono messi in cache.
+        """
+        cached = self.get_fresh(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.fetches += 1
+        try:
+            try:
+                analysis = await fetch_func()
+            except Exception as e:
+                analysis = {'error': str(e)}
+
+            if 'error' not in analysis and self.freshness_seconds > 0:
+                self._store(key, analysis)
+            future.set_result(analysis)
+            return analysis
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict:
+        return {
+            'fetches': self.fetches,
+            'coalesced': self.coalesced,
+            'cache_hits': self.cache_hits,
+            'cached_serps': len(self._cache),
+            'inflight': len(self._inflight),
+            'freshness_seconds': self.freshness_seconds
+        }
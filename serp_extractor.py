@@ -0,0 +1,315 @@
+"""
+Tokenizzazione single-pass dell'HTML SERP
+Un solo attraversamento del documento classifica i blocchi di risultato (organici, ads, featured
+snippets, local pack, shopping) e raccoglie link, titoli, cite e snippet di ciascuno
+"""
+
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+# Classi/attributi che identificano i blocchi di risultato
+ORGANIC_CLASSES = {'g', 'tF2Cxc', 'MjjYud'}
+ADS_CLASSES = {'ads', 'uEierd', 'mnr-c', 'v0rgu'}
+ADS_IDS = {'tads', 'tadsb', 'bottomads'}
+ADS_MARKERS = ('sponsorizzato', 'sponsored', 'annuncio')
+SHOPPING_CLASSES = {'pla-unit', 'sh-dlr'}
+SNIPPET_CLASSES = {'kno-rdesc', 'IZ6rdc', 'xpdopen', 'g9WsWb', 'Z0LcW', 'XcVN5d'}
+LOCAL_CLASSES = {'rllt__details', 'VkpGBb', 'dbg0pd'}
+DESCRIPTION_CLASSES = {'VwiC3b', 'IsZvec'}
+
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+             'param', 'source', 'track', 'wbr'}
+IGNORED_TAGS = {'script', 'style', 'noscript'}
+
+# Testo raccolto al massimo per blocco (serve solo a trovare un dominio)
+MAX_BLOCK_TEXT = 2000
+
+
+def normalize_host(url: str) -> Optional[str]:
+    """Host di un link assoluto, minuscolo e senza www (i redirect /url?q= di Google vengono risolti)"""
+    if not url or not url[:4].lower() == 'http':
+        return None
+
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+
+    host = (parts.hostname or '').lower()
+    if parts.path == '/url' and 'google.' in host:
+        target = parse_qs(parts.query).get('q') or parse_qs(parts.query).get('url')
+        if target and target[0] != url:
+            return normalize_host(target[0])
+
+    if host.startswith('www.'):
+        host = host[4:]
+    return host if '.' in host else None
+
+
+class SERPAnchor:
+    """Link trovato nel documento, con testo, titolo h3 e blocco organico che lo contiene"""
+    __slots__ = ('url', 'text', 'heading', 'in_heading', 'block')
+
+    def __init__(self, url: str, in_heading: bool = False, block: Optional['SERPBlock'] = None):
+        self.url = url
+        self.text = []
+        self.heading = []
+        self.in_heading = in_heading
+        self.block = block
+
+
+class SERPBlock:
+    """Blocco di risultato classificato durante l'attraversamento"""
+    __slots__ = ('kind', 'anchors', 'cites', 'headings', 'description', 'text', 'requires_cite')
+
+    def __init__(self, kind: str, requires_cite: bool = False):
+        self.kind = kind
+        self.anchors: List[SERPAnchor] = []
+        self.cites: List[str] = []
+        self.headings: List[str] = []
+        self.description = []
+        self.text = []
+        self.requires_cite = requires_cite
+
+    def text_length(self) -> int:
+        return sum(len(t) for t in self.text)
+
+
+class AnchorIndex:
+    """Indice host normalizzato -> link in ordine di documento, costruito una volta per SERP"""
+
+    def __init__(self, anchors: Iterable[SERPAnchor]):
+        self._by_host: Dict[str, List[SERPAnchor]] = {}
+        for anchor in anchors:
+            host = normalize_host(anchor.url)
+            if not host:
+                continue
+            # Registra anche i domini padre: blog.example.com risponde a example.com
+            labels = host.split('.')
+            for i in range(len(labels) - 1):
+                self._by_host.setdefault('.'.join(labels[i:]), []).append(anchor)
+
+    def anchors_for(self, domain: str) -> List[SERPAnchor]:
+        """Link del dominio (o di un suo sottodominio) in ordine di documento"""
+        domain = domain.lower()
+        if domain.startswith('www.'):
+            domain = domain[4:]
+        return self._by_host.get(domain, [])
+
+    def first(self, domain: str) -> Optional[SERPAnchor]:
+        anchors = self.anchors_for(domain)
+        return anchors[0] if anchors else None
+
+    def title_for(self, domain: str) -> str:
+        """Testo del primo titolo h3 associato a un link del dominio"""
+        for anchor in self.anchors_for(domain):
+            if anchor.heading:
+                return ''.join(anchor.heading)
+        return ''
+
+    def __len__(self) -> int:
+        return len(self._by_host)
+
+
+class SERPDocument:
+    """Risultato della tokenizzazione: blocchi e link in ordine di documento"""
+
+    def __init__(self):
+        self.anchors: List[SERPAnchor] = []
+        self.organic_cites: List[tuple] = []  # (testo cite, blocco organico o None)
+        self.organic_blocks: List[SERPBlock] = []
+        self.blocks: Dict[str, List[SERPBlock]] = {
+            'ads': [], 'shopping': [], 'featured_snippets': [], 'local_pack': []
+        }
+        self._anchor_index: Optional[AnchorIndex] = None
+
+    @property
+    def anchor_index(self) -> AnchorIndex:
+        if self._anchor_index is None:
+            self._anchor_index = AnchorIndex(self.anchors)
+        return self._anchor_index
+
+    def first_anchor_for(self, domain: str) -> Optional[SERPAnchor]:
+        """Primo link assoluto verso il dominio o un suo sottodominio"""
+        return self.anchor_index.first(domain)
+
+
+def _classify(tag: str, attrs: Dict[str, str]) -> List[SERPBlock]:
+    """Restituisce i blocchi aperti da un elemento (può essere più di uno)"""
+    opened = []
+    classes = set((attrs.get('class') or '').split())
+
+    if tag == 'div':
+        if classes & ORGANIC_CLASSES:
+            opened.append(SERPBlock('organic'))
+        if classes & SHOPPING_CLASSES or 'data-shopping' in attrs:
+            opened.append(SERPBlock('shopping'))
+        elif classes & ADS_CLASSES or attrs.get('id') in ADS_IDS or 'data-text-ad' in attrs:
+            opened.append(SERPBlock('ads'))
+        if classes & SNIPPET_CLASSES:
+            opened.append(SERPBlock('featured_snippets'))
+        elif 'data-attrid' in attrs:
+            opened.append(SERPBlock('featured_snippets', requires_cite=True))
+        if classes & LOCAL_CLASSES:
+            opened.append(SERPBlock('local_pack'))
+        elif 'data-local-attribute' in attrs:
+            opened.append(SERPBlock('local_pack', requires_cite=True))
+    elif tag == 'span':
+        attr_text = ' '.join(f"{k} {v or ''}" for k, v in attrs.items()).lower()
+        if any(marker in attr_text for marker in ADS_MARKERS):
+            opened.append(SERPBlock('ads'))
+
+    return opened
+
+
+class SERPDocumentParser(HTMLParser):
+    """Tokenizer streaming che costruisce un SERPDocument in un solo passaggio"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.document = SERPDocument()
+        # Stack degli elementi aperti: (tag, blocchi aperti da quell'elemento, flag)
+        self._stack: List[tuple] = []
+        self._organic: List[SERPBlock] = []
+        self._special: List[SERPBlock] = []
+        self._anchors: List[SERPAnchor] = []
+        self._heading_depth = 0
+        self._cite = None  # [testo iniziale, blocco organico, testo chiuso?]
+        self._description_depth = 0
+        self._ignored_depth = 0
+
+    @classmethod
+    def parse(cls, html: str) -> SERPDocument:
+        parser = cls()
+        parser.feed(html)
+        parser.close()
+        return parser.document
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+
+        attrs = dict(attrs)
+        flags = set()
+
+        if tag in IGNORED_TAGS:
+            self._ignored_depth += 1
+            flags.add('ignored')
+
+        blocks = _classify(tag, attrs)
+        for block in blocks:
+            if block.kind == 'organic':
+                self._organic.append(block)
+                self.document.organic_blocks.append(block)
+            else:
+                self._special.append(block)
+
+        # Il testo della cite si ferma al primo tag figlio
+        if self._cite is not None:
+            self._cite[2] = True
+
+        if tag == 'a':
+            href = attrs.get('href') or ''
+            anchor = SERPAnchor(href, in_heading=self._heading_depth > 0,
+                                block=self._organic[-1] if self._organic else None)
+            self._anchors.append(anchor)
+            self.document.anchors.append(anchor)
+            for block in self._open_blocks():
+                block.anchors.append(anchor)
+            flags.add('anchor')
+        elif tag == 'h3':
+            self._heading_depth += 1
+            flags.add('heading')
+            for block in self._open_blocks():
+                block.headings.append('')
+        elif tag == 'cite' and 'class' in attrs and self._cite is None:
+            self._cite = ['', self._organic[-1] if self._organic else None, False]
+            flags.add('cite')
+
+        classes = set((attrs.get('class') or '').split())
+        if classes & DESCRIPTION_CLASSES:
+            self._description_depth += 1
+            flags.add('description')
+
+        self._stack.append((tag, blocks, flags))
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+
+        # Chiude fino all'elemento corrispondente (HTML non sempre bilanciato)
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                while len(self._stack) > index:
+                    self._close_element(*self._stack.pop())
+                return
+
+    def _close_element(self, tag, blocks, flags):
+        if 'ignored' in flags:
+            self._ignored_depth -= 1
+        if 'anchor' in flags and self._anchors:
+            self._anchors.pop()
+        if 'heading' in flags:
+            self._heading_depth -= 1
+        if 'description' in flags:
+            self._description_depth -= 1
+        if 'cite' in flags and self._cite is not None:
+            text, organic_block, _ = self._cite
+            self._cite = None
+            self._finish_cite(text, organic_block)
+
+        for block in blocks:
+            if block.kind == 'organic':
+                self._organic.remove(block)
+            else:
+                self._special.remove(block)
+                if not block.requires_cite or block.cites:
+                    self.document.blocks[block.kind].append(block)
+
+    def _finish_cite(self, text: str, organic_block: Optional[SERPBlock]):
+        text = text.strip()
+        if not text:
+            return
+        for block in self._special:
+            block.cites.append(text)
+        # Le cite dentro ads e shopping non sono risultati organici
+        if not any(block.kind in ('ads', 'shopping') for block in self._special):
+            self.document.organic_cites.append((text, organic_block))
+        if organic_block is not None:
+            organic_block.cites.append(text)
+
+    def _open_blocks(self):
+        if self._organic:
+            yield self._organic[-1]
+        yield from self._special
+
+    def handle_data(self, data):
+        if self._ignored_depth:
+            return
+
+        if self._cite is not None and not self._cite[2]:
+            self._cite[0] += data
+
+        for anchor in self._anchors:
+            anchor.text.append(data)
+            if self._heading_depth:
+                anchor.heading.append(data)
+
+        if self._heading_depth:
+            for block in self._open_blocks():
+                if block.headings:
+                    block.headings[-1] += data
+
+        if self._description_depth and self._organic:
+            self._organic[-1].description.append(data)
+
+        for block in self._special:
+            if block.text_length() < MAX_BLOCK_TEXT:
+                block.text.append(data)
+
+    def close(self):
+        super().close()
+        # Chiude gli elementi rimasti aperti a fine documento
+        while self._stack:
+            self._close_element(*self._stack.pop())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test della facciata asincrona del database
+"""
+
+import asyncio
+import sys
+import time
+import pytest
+from async_database import AsyncDatabase
+
+
+def test_same_surface_as_database(db):
+    """Ogni metodo di Database è disponibile come coroutine con lo stesso risultato"""
+    print("🧪 TEST ASYNC DATABASE - STESSI METODI")
+
+    adb = AsyncDatabase(db)
+
+    async def run():
+        project_id = await adb.create_project(name="Test", domain="isacco.it")
+        await adb.add_keywords(project_id, ["divise", "abbigliamento"])
+        project, keywords = await asyncio.gather(adb.get_project(project_id), adb.get_keywords(project_id))
+        return project_id, project, keywords
+
+    try:
+        project_id, project, keywords = asyncio.run(run())
+        assert project == db.get_project(project_id)
+        assert keywords == db.get_keywords(project_id) and len(keywords) == 2
+        # Attributi non richiamabili passano invariati
+        assert adb.db_path == db.db_path and adb.connections is db.connections
+        assert adb.stats()['calls'] == 4
+        try:
+            adb.metodo_inesistente
+            assert False, "attributo inesistente accettato"
+        except AttributeError:
+            pass
+    finally:
+        adb.shutdown()
+
+
+def test_event_loop_not_blocked(db):
+    """Una query lenta non blocca le altre coroutine sull'event loop"""
+    print("🧪 TEST ASYNC DATABASE - EVENT LOOP LIBERO")
+
+    adb = AsyncDatabase(db)
+
+    def slow_query():
+        with db.connections.reader() as conn:
+            conn.execute("""
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000000)
+                SELECT SUM(i) FROM n
+            """).fetchone()
+
+    async def run():
+        ticks = []
+
+        async def ticker():
+            while len(ticks) < 1000:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.005)
+
+        tick_task = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        await adb.run(slow_query)
+        elapsed = time.perf_counter() - start
+        tick_task.cancel()
+        gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+        return elapsed, max(gaps)
+
+    try:
+        elapsed, max_gap = asyncio.run(run())
+        print(f"Query: {elapsed * 1000:.0f}ms, pausa massima dell'event loop: {max_gap * 1000:.0f}ms")
+        assert max_gap < elapsed / 2
+    finally:
+        adb.shutdown()
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
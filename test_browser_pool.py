@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test del pool di contesti browser (senza avviare Chromium)
+"""
+
+import asyncio
+from browser_pool import BrowserPool
+from crawler_lifecycle import CrawlerLifecycle
+
+
+class FakeCrawler:
+    """Crawler finto che registra solo la chiusura"""
+    created = 0
+
+    def __init__(self, egress=None):
+        FakeCrawler.created += 1
+        self.egress = egress
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_pool_checkout_is_fair():
+    """I contesti vengono assegnati in ordine di arrivo e mai a due richiedenti insieme"""
+    print("🧪 TEST BROWSER POOL - CHECKOUT")
+
+    async def run():
+        pool = BrowserPool(size=2, crawler_factory=FakeCrawler, egress_list=[])
+        in_use = set()
+        order = []
+
+        async def job(n):
+            async with pool.checkout() as browser:
+                assert browser.context_id not in in_use
+                in_use.add(browser.context_id)
+                order.append(n)
+                await asyncio.sleep(0.01)
+                browser.record_success()
+                in_use.discard(browser.context_id)
+
+        await asyncio.gather(*[job(n) for n in range(6)])
+        stats = pool.stats()
+        await pool.close()
+        return order, stats
+
+    order, stats = asyncio.run(run())
+    print(f"Ordine di servizio: {order}")
+    assert order == list(range(6))
+    assert stats['available'] == 2
+    assert sum(c['pages'] for c in stats['contexts']) == 6
+
+
+def test_pool_recycles_unhealthy_context():
+    """Un contesto con troppi errori consecutivi viene ricreato al checkout"""
+    print("🧪 TEST BROWSER POOL - HEALTH CHECK")
+
+    async def run():
+        pool = BrowserPool(size=1, crawler_factory=FakeCrawler, egress_list=['http://proxy1:8080'],
+                           max_consecutive_failures=2)
+        async with pool.checkout() as browser:
+            first_crawler = browser.crawler
+            browser.record_failure()
+            browser.record_failure()
+
+        async with pool.checkout() as browser:
+            second_crawler = browser.crawler
+            egress = browser.egress_id
+        await pool.close()
+        return first_crawler, second_crawler, egress
+
+    first_crawler, second_crawler, egress = asyncio.run(run())
+    assert first_crawler is not second_crawler
+    assert first_crawler.closed
+    assert egress == 'http://proxy1:8080'
+
+
+def test_pool_recycles_after_max_pages():
+    """Un contesto viene riciclato dopo il numero massimo di pagine"""
+    print("🧪 TEST BROWSER POOL - MAX PAGES")
+
+    async def run():
+        pool = BrowserPool(size=1, crawler_factory=FakeCrawler, egress_list=[], max_pages_per_context=2)
+        crawlers = []
+        for _ in range(3):
+            async with pool.checkout() as browser:
+                crawlers.append(browser.crawler)
+                browser.record_success()
+        await pool.close()
+        return crawlers
+
+    crawlers = asyncio.run(run())
+    assert crawlers[0] is crawlers[1]
+    assert crawlers[2] is not crawlers[0]
+
+
+def test_checkout_by_egress():
+    """Il checkout per uscita restituisce un contesto di quell'uscita; senza uscita si ruota"""
+    print("🧪 TEST BROWSER POOL - CHECKOUT PER USCITA")
+
+    proxies = ['http://proxy1:8080', 'http://proxy2:8080']
+
+    async def run():
+        pool = BrowserPool(size=3, crawler_factory=FakeCrawler, egress_list=proxies)
+        async with pool.checkout(proxies[1]) as browser:
+            chosen = browser.egress_id
+        rotated = [pool.next_egress() for _ in range(3)]
+        stats = pool.stats()
+        await pool.close()
+        return chosen, rotated, stats
+
+    chosen, rotated, stats = asyncio.run(run())
+    assert chosen == proxies[1]
+    assert rotated == [proxies[0], proxies[1], proxies[0]]
+    assert stats['available'] == 3
+
+
+def test_lifecycle_keeps_browser_warm_between_jobs():
+    """Job sovrapposti condividono il pool, che si chiude solo dopo l'idle timeout"""
+    print("🧪 TEST CRAWLER LIFECYCLE")
+
+    async def run():
+        pool = BrowserPool(size=1, crawler_factory=FakeCrawler, egress_list=[])
+        lifecycle = CrawlerLifecycle(pool, idle_timeout=0.05)
+
+        async with lifecycle.session():
+            async with lifecycle.session():
+                pass
+            # Il secondo job è finito ma il primo è ancora in corso
+            assert pool.started
+
+        # Nessun utilizzatore: il pool resta caldo fino al timeout
+        assert pool.started
+        async with lifecycle.session():
+            pass
+        warm_launches = lifecycle.launches
+
+        await asyncio.sleep(0.1)
+        return warm_launches, pool.started
+
+    warm_launches, still_started = asyncio.run(run())
+    assert warm_launches == 1
+    assert not still_started
+
+
+if __name__ == "__main__":
+    test_pool_checkout_is_fair()
+    test_pool_recycles_unhealthy_context()
+    test_pool_recycles_after_max_pages()
+    test_checkout_by_egress()
+    test_lifecycle_keeps_browser_warm_between_jobs()
+    print("🎉 TUTTI I TEST PASSATI!")
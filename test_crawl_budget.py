@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test del budget giornaliero dei fetch (quote per progetto e globale, rinvii, persistenza)
+"""
+
+import asyncio
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+from crawl_budget import BudgetExceeded, budget_day, next_window, reserve, release, init_budget_tables
+from database import Database
+from schedule_planner import format_timestamp, utc_now
+from scheduler import RankScheduler
+
+DAY = '2024-05-13'
+
+
+def test_project_and_global_quotas():
+    """Concessioni parziali fino alla quota più stretta, rinvii contati, quota globale condivisa"""
+    print("🧪 TEST BUDGET - QUOTE")
+
+    conn = sqlite3.connect(':memory:')
+    init_budget_tables(conn)
+    assert reserve(conn, DAY, 1, 40, project_quota=50, global_quota=100) == 40
+    assert reserve(conn, DAY, 1, 40, project_quota=50, global_quota=100) == 10
+    # Il progetto 2 non ha quota propria ma condivide il budget globale
+    assert reserve(conn, DAY, 2, 80, project_quota=0, global_quota=100) == 50
+    assert reserve(conn, DAY, 2, 5, project_quota=0, global_quota=100) == 0
+
+    # Fetch riservati e non usati tornano disponibili
+    release(conn, DAY, 2, 20)
+    assert reserve(conn, DAY, 2, 30, project_quota=0, global_quota=100) == 20
+
+    try:
+        reserve(conn, DAY, 1, 1, project_quota=50, global_quota=0, all_or_nothing=True)
+        assert False, "Check manuale oltre la quota accettato"
+    except BudgetExceeded as e:
+        assert e.remaining == 0
+
+    rows = {row[0]: row[1:] for row in conn.execute(
+        "SELECT project_id, fetches, deferred FROM crawl_budget_usage WHERE day = ?", (DAY,))}
+    print(f"Contatori: {rows}")
+    assert rows == {0: (100, 30 + 30 + 5 + 10), 1: (50, 30), 2: (50, 30 + 5 + 10)}
+
+    # Giorno nuovo, budget nuovo; senza quote nessun limite
+    assert reserve(conn, '2024-05-14', 1, 40, project_quota=50, global_quota=100) == 40
+    assert reserve(conn, DAY, 3, 10 ** 6, project_quota=0, global_quota=0) == 10 ** 6
+
+    now = datetime(2024, 5, 13, 23, 59, tzinfo=timezone.utc)
+    assert budget_day(now) == DAY and next_window(now) == datetime(2024, 5, 14, tzinfo=timezone.utc)
+
+
+def test_budget_survives_restart(db):
+    """I contatori sono nel database: un riavvio non azzera il consumo del giorno"""
+    print("🧪 TEST BUDGET - PERSISTENZA")
+
+    project_id = db.create_project(name="Test", domain="isacco.it", daily_fetch_quota=30)
+    assert db.get_project(project_id)['daily_fetch_quota'] == 30
+    assert db.reserve_crawl_budget(project_id, 25) == 25
+    db.close()
+
+    restarted = Database(db.db_path)
+    assert restarted.reserve_crawl_budget(project_id, 25) == 5
+    try:
+        restarted.reserve_crawl_budget(project_id, 1, all_or_nothing=True)
+        assert False, "Check manuale oltre la quota accettato"
+    except BudgetExceeded:
+        pass
+
+    usage = restarted.get_crawl_budget()
+    print(f"Consumo: {usage}")
+    assert usage['day'] == budget_day()
+    assert usage['projects'][project_id] == {'fetches': 30, 'deferred': 20, 'quota': 30}
+    restarted.close()
+
+
+def test_claim_respects_granted_budget(db):
+    """Con il budget esaurito le keywords in scadenza restano tali per il giorno dopo"""
+    print("🧪 TEST BUDGET - KEYWORDS RINVIATE")
+
+    project_id = db.create_project(name="Test", domain="isacco.it", daily_fetch_quota=3)
+    db.add_keywords(project_id, [f"divise {i}" for i in range(5)])
+    until = '2024-05-13 09:00:00'
+
+    due = db.count_due_keywords(project_id, until)
+    granted = db.reserve_crawl_budget(project_id, due, day=DAY)
+    claimed = db.claim_due_keywords(project_id, 24, until, anchor=until, limit=granted)
+    assert (due, granted, claimed) == (5, 3, ["divise 0", "divise 1", "divise 2"])
+    assert db.count_due_keywords(project_id, until) == 2
+
+    # Il giorno dopo le rinviate vengono accodate per prime
+    assert db.reserve_crawl_budget(project_id, 2, day='2024-05-14') == 2
+    assert db.claim_due_keywords(project_id, 24, until, limit=2) == ["divise 3", "divise 4"]
+
+
+def test_failed_enqueue_releases_reservation(db):
+    """Un errore tra la prenotazione del budget e l'accodamento non consuma il budget del giorno"""
+    print("🧪 TEST BUDGET - ACCODAMENTO FALLITO")
+
+    project_id = db.create_project(name="Test", domain="isacco.it", daily_fetch_quota=10)
+    db.add_keywords(project_id, ["divise", "camici", "grembiuli"])
+
+    def broken_start_check_run(*args, **kwargs):
+        raise RuntimeError("database non disponibile")
+
+    db.start_check_run = broken_start_check_run
+    scheduler = RankScheduler(SimpleNamespace(), db)
+
+    async def enqueue(**kwargs):
+        try:
+            await scheduler.enqueue_project(project_id, **kwargs)
+            assert False, "Accodamento riuscito nonostante l'errore"
+        except RuntimeError:
+            pass
+
+    asyncio.run(enqueue(trigger='manual'))
+    asyncio.run(enqueue(due_only=True))
+    scheduler.adb.shutdown()
+
+    usage = db.get_crawl_budget()
+    print(f"Consumo: {usage}")
+    assert usage['projects'][project_id]['fetches'] == 0
+    # Le keywords assegnate dal check schedulato tornano in scadenza
+    assert db.count_due_keywords(project_id, format_timestamp(utc_now())) == 3
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Test della coda di crawl globale (priorità, fairness tra progetti, concorrenza massima)
+"""
+
+import asyncio
+import sys
+import pytest
+from crawl_queue import CrawlJob, CrawlQueue, PRIORITY_MANUAL, PRIORITY_SCHEDULED
+from schedule_planner import format_timestamp, utc_now
+from scheduler import RankScheduler
+
+
+class FakeLifecycle:
+    def __init__(self):
+        self.refcount = 0
+        self.acquired = 0
+
+    async def acquire(self):
+        self.refcount += 1
+        self.acquired += 1
+
+    async def release(self):
+        self.refcount -= 1
+
+
+class FakeTracker:
+    """Registra l'ordine delle keywords controllate e il massimo di richieste contemporanee"""
+
+    def __init__(self):
+        self.lifecycle = FakeLifecycle()
+        self.order = []
+        self.running = 0
+        self.max_running = 0
+
+    async def check_keyword(self, keyword, domain, localization_config, tracking_config,
+                            rate_limit_config=None, cache_config=None):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(0.001)
+            if keyword == 'errore':
+                raise RuntimeError("Crawling failed")
+            self.order.append((domain, keyword))
+            return {'target_positions': {'organic': {'position': len(self.order)}}}
+        finally:
+            self.running -= 1
+
+
+def _job(project_id, keywords, priority=PRIORITY_SCHEDULED, completed=None):
+    async def on_complete(job):
+        if completed is not None:
+            completed.append(job.project_id)
+
+    return CrawlJob(project_id=project_id, domain=f"sito{project_id}.it", keywords=keywords,
+                    localization_config={}, tracking_config={}, priority=priority, on_complete=on_complete)
+
+
+def test_small_projects_are_not_starved():
+    """Un progetto piccolo accodato dopo uno grande termina dopo pochi turni, con concorrenza limitata"""
+    print("🧪 TEST CODA CRAWL - FAIRNESS")
+
+    tracker = FakeTracker()
+    completed = []
+
+    async def run():
+        queue = CrawlQueue(tracker, concurrency=3)
+        big = await queue.submit(_job(1, [f"kw {i}" for i in range(60)], completed=completed))
+        small = await queue.submit(_job(2, ["divise", "camici", "errore"], completed=completed))
+        small_results = await small
+        checked_when_small_done = len(tracker.order)
+        big_results = await big
+        stats = queue.stats()
+        await queue.close()
+        return small_results, big_results, checked_when_small_done, stats
+
+    small_results, big_results, checked, stats = asyncio.run(run())
+    print(f"Keywords controllate al termine del progetto piccolo: {checked}, statistiche: {stats}")
+    assert completed == [2, 1]
+    assert checked <= 8
+    assert list(small_results) == ["divise", "camici", "errore"]
+    assert small_results["errore"] == {'error': "Crawling failed"}
+    assert list(big_results) == [f"kw {i}" for i in range(60)]
+    assert tracker.max_running == 3
+    assert stats['completed_items'] == 63 and stats['queued'] == 0 and stats['jobs'] == []
+    # Il pool browser resta acquisito una sola volta finché la coda ha lavoro
+    assert tracker.lifecycle.acquired == 1 and tracker.lifecycle.refcount == 0
+
+
+def test_manual_checks_go_first():
+    """I check manuali (o promossi) passano davanti alle keywords schedulate rimanenti"""
+    print("🧪 TEST CODA CRAWL - PRIORITÀ")
+
+    tracker = FakeTracker()
+
+    async def run():
+        queue = CrawlQueue(tracker, concurrency=1)
+        scheduled = await queue.submit(_job(1, [f"kw {i}" for i in range(20)]))
+        other = await queue.submit(_job(2, [f"altra {i}" for i in range(20)]))
+        await asyncio.sleep(0.01)
+        manual = await queue.submit(_job(3, ["urgente 1", "urgente 2"], priority=PRIORITY_MANUAL))
+        assert queue.promote(2, PRIORITY_MANUAL) and not queue.promote(2, PRIORITY_SCHEDULED)
+        try:
+            await queue.submit(_job(3, ["doppio"]))
+            assert False, "Job duplicato accettato"
+        except ValueError:
+            pass
+        await asyncio.gather(scheduled, other, manual)
+        await queue.close()
+
+    asyncio.run(run())
+    order = [keyword for _, keyword in tracker.order]
+    first_manual = order.index("urgente 1")
+    tail = order[first_manual:]
+    print(f"Ordine dopo il check manuale: {tail[:8]}")
+    # Dopo l'arrivo dei job manuali: a turno progetto 3 e progetto 2 promosso, poi il resto del progetto 1
+    assert tail[:4] == ["urgente 1", tail[1], "urgente 2", tail[3]]
+    assert all(k.startswith("altra") for k in (tail[1], tail[3]))
+    remaining_project_2 = [k for k in tail if k.startswith("altra")]
+    last_project_2 = tail.index(remaining_project_2[-1])
+    assert all(k.startswith("kw") for k in tail[last_project_2 + 1:])
+
+
+class BlockedTracker(FakeTracker):
+    """Tracker i cui crawl non terminano mai (arresto durante un check)"""
+
+    async def check_keyword(self, keyword, domain, localization_config, tracking_config,
+                            rate_limit_config=None, cache_config=None):
+        self.order.append((domain, keyword))
+        await asyncio.Event().wait()
+
+
+def test_close_aborts_unfinished_checks(db):
+    """Alla chiusura i check in corso vengono chiusi come aborted e restituiscono il budget"""
+    print("🧪 TEST CODA CRAWL - CHIUSURA CON CHECK IN CORSO")
+
+    project_id = db.create_project(name="Test", domain="isacco.it", daily_fetch_quota=10)
+    db.add_keywords(project_id, ["divise", "camici", "grembiuli", "casacche"])
+    tracker = BlockedTracker()
+
+    async def run():
+        scheduler = RankScheduler(tracker, db, crawl_queue=CrawlQueue(tracker, concurrency=1))
+        job = await scheduler.enqueue_project(project_id, due_only=True)
+        await asyncio.sleep(0.01)
+        assert job.in_flight == 1 and len(job.pending) == 3
+        await scheduler.queue.close()
+        scheduler.adb.shutdown()
+        return job
+
+    job = asyncio.run(run())
+    run = db.get_check_runs(project_id, limit=1)[0]
+    print(f"Run: {run['status']} ({run['error_message']}), budget: {db.get_crawl_budget()['projects']}")
+    assert run['id'] == job.run_id and run['status'] == 'aborted' and run['finished_at']
+    assert job.done.cancelled()
+    # Solo la keyword già avviata resta nel budget; tutte tornano in scadenza
+    assert db.get_crawl_budget()['projects'][project_id]['fetches'] == 1
+    assert db.count_due_keywords(project_id, format_timestamp(utc_now())) == 4
+
+    # Run rimasti 'running' da un processo terminato: chiusi all'avvio
+    stale = db.start_check_run(project_id, 4)
+    assert db.abort_stale_runs() == 1
+    assert db.get_check_runs(project_id, limit=1)[0]['id'] == stale
+    assert db.get_check_runs(project_id, limit=1)[0]['status'] == 'aborted'
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Test delle connessioni SQLite persistenti (writer + pool di reader in WAL)
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import pytest
+from database import Database, UPSERT_LATEST_POSITION
+
+
+def test_connections_are_reused_in_wal_mode(tmp_path):
+    """Le chiamate riusano le stesse connessioni, già configurate in WAL"""
+    print("🧪 TEST CONNESSIONI - RIUSO E WAL")
+
+    db = Database(os.path.join(tmp_path, 'test.db'), readers=2)
+    project_id = db.create_project(name="Test", domain="example.com")
+    db.add_keywords(project_id, ["divise", "abbigliamento"])
+
+    with db.connections.reader() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        first_reader = conn
+
+    for _ in range(5):
+        assert db.get_project(project_id)['domain'] == "example.com"
+        assert len(db.get_keywords(project_id)) == 2
+
+    with db.connections.reader() as conn:
+        assert conn is first_reader
+        # row_factory impostato dai metodi non resta sulla connessione del pool
+        assert conn.row_factory is None
+
+    stats = db.connections.stats()
+    print(f"Statistiche: {stats}")
+    assert stats['readers_open'] == 1
+    db.close()
+
+
+def test_close_with_reader_checked_out(tmp_path):
+    """Un reader in uso durante close() viene chiuso alla restituzione, non rimesso nel pool"""
+    print("🧪 TEST CONNESSIONI - CLOSE CON READER IN USO")
+
+    db = Database(os.path.join(tmp_path, 'test.db'), readers=1)
+    project_id = db.create_project(name="Test", domain="example.com")
+
+    with db.connections.reader() as held:
+        db.close()
+        # Il reader preso prima di close() resta utilizzabile fino alla fine del blocco
+        assert held.execute("SELECT COUNT(*) FROM projects").fetchone()[0] == 1
+        # close() libera il pool: un nuovo reader non aspetta quello in uso
+        assert db.get_project(project_id)['domain'] == "example.com"
+
+    with db.connections.reader() as conn:
+        assert conn is not held
+        assert conn.execute("SELECT 1").fetchone()[0] == 1
+    try:
+        held.execute("SELECT 1")
+        assert False, "Il reader restituito dopo close() doveva essere chiuso"
+    except sqlite3.ProgrammingError:
+        pass
+
+    stats = db.connections.stats()
+    print(f"Statistiche: {stats}")
+    assert stats['readers_open'] == 1 and stats['readers_idle'] == 1
+    db.close()
+
+
+def test_reads_do_not_wait_for_open_write(db):
+    """In WAL le letture procedono mentre una transazione di scrittura è aperta"""
+    print("🧪 TEST CONNESSIONI - LETTURE DURANTE SCRITTURA")
+
+    project_id = db.create_project(name="Test", domain="example.com")
+    write_open = threading.Event()
+    read_done = threading.Event()
+
+    def long_write():
+        with db.connections.writer() as conn:
+            conn.execute("INSERT INTO keywords (project_id, keyword) VALUES (?, ?)", (project_id, "nuova"))
+            write_open.set()
+            assert read_done.wait(5), "la lettura è rimasta bloccata dalla scrittura"
+
+    writer = threading.Thread(target=long_write)
+    writer.start()
+    assert write_open.wait(5)
+
+    # La scrittura non è ancora committata: il reader vede lo snapshot precedente
+    assert db.get_keywords(project_id) == []
+    read_done.set()
+    writer.join()
+
+    assert [k['keyword'] for k in db.get_keywords(project_id)] == ["nuova"]
+
+
+def test_failed_write_is_rolled_back(db):
+    """Un errore dentro writer() annulla la transazione e la connessione resta utilizzabile"""
+    print("🧪 TEST CONNESSIONI - ROLLBACK")
+
+    project_id = db.create_project(name="Test", domain="example.com")
+
+    try:
+        with db.connections.writer() as conn:
+            conn.execute("INSERT INTO keywords (project_id, keyword) VALUES (?, ?)", (project_id, "persa"))
+            raise RuntimeError("errore simulato")
+    except RuntimeError:
+        pass
+
+    db.add_keywords(project_id, ["salvata"])
+    assert [k['keyword'] for k in db.get_keywords(project_id)] == ["salvata"]
+
+
+def test_check_run_saved_in_one_transaction(db):
+    """Un intero check viene salvato con un solo commit e un solo timestamp"""
+    print("🧪 TEST SALVATAGGIO CHECK RUN")
+
+    project_id = db.create_project(name="Test", domain="isacco.it")
+    results = {
+        "divise": {
+            'organic': [{'position': 1, 'domain': 'competitor.it'}, {'position': 2, 'domain': 'isacco.it'}],
+            'ads': [{'position': 1, 'domain': 'isacco.it', 'url': 'https://isacco.it/ad'}],
+            'target_positions': {'organic': {'position': 2}},
+            'metadata': {'content_hash': 'abc', 'parser_version': '3'}
+        },
+        "camici": {'organic': [], 'target_positions': {}, 'metadata': {}},
+        "errore": {'error': 'Crawling failed'}
+    }
+
+    writes_before = db.connections.writes
+    summary = db.save_check_run(project_id, results)
+    print(f"Riepilogo: {summary}")
+
+    assert db.connections.writes - writes_before == 1
+    assert summary['results'] == 2 and summary['features'] == 3 and summary['errors'] == 1
+
+    latest = {r['keyword']: r['position'] for r in db.get_latest_results(project_id)}
+    assert latest == {"divise": 2, "camici": None}
+
+    features = db.get_serp_features(project_id)
+    assert {f['checked_at'] for f in features} == {summary['checked_at']}
+    assert {f['content_hash'] for f in features} == {'abc'}
+    assert db.get_project(project_id)['last_check'] == summary['checked_at']
+
+
+def test_latest_positions_match_history(db):
+    """latest_positions (aggiornata a ogni scrittura) coincide con il ricalcolo dallo storico"""
+    print("🧪 TEST POSIZIONI CORRENTI MATERIALIZZATE")
+
+    project_id = db.create_project(name="Test", domain="isacco.it")
+
+    history = [
+        ("divise", 5, '2024-01-01 10:00:00'),
+        ("divise", 3, '2024-01-02 10:00:00'),
+        ("divise", None, '2024-01-03 10:00:00'),
+        ("camici", 8, '2024-01-02 10:00:00'),
+        ("divise", 4, '2024-01-01 12:00:00'),  # Arriva fuori ordine: non tocca la corrente
+    ]
+    with db.connections.writer() as conn:
+        for keyword, position, checked_at in history:
+            conn.execute(
+                "INSERT INTO ranking_results (project_id, keyword, position, checked_at) VALUES (?, ?, ?, ?)",
+                (project_id, keyword, position, checked_at)
+            )
+            conn.execute(UPSERT_LATEST_POSITION, (project_id, keyword, position, checked_at))
+
+    incremental = db.get_latest_results(project_id)
+    assert incremental == [
+        {'keyword': 'camici', 'position': 8, 'checked_at': '2024-01-02 10:00:00', 'previous_position': None},
+        {'keyword': 'divise', 'position': None, 'checked_at': '2024-01-03 10:00:00', 'previous_position': 3},
+    ]
+
+    assert db.rebuild_latest_positions(project_id) == 2
+    assert db.get_latest_results(project_id) == incremental
+
+    db.save_results_batch(project_id, {"divise": 2})
+    latest = {r['keyword']: r for r in db.get_latest_results(project_id)}
+    assert latest['divise']['position'] == 2 and latest['divise']['previous_position'] is None
+
+
+def test_latest_serp_results_by_run(db):
+    """La dashboard carica l'ultimo run completo, anche con keyword salvate in momenti diversi"""
+    print("🧪 TEST CHECK RUN")
+
+    project_id = db.create_project(name="Test", domain="isacco.it")
+
+    def result(domain):
+        return {'organic': [{'position': 1, 'domain': domain}], 'target_positions': {}, 'metadata': {}}
+
+    first = db.save_check_run(project_id, {"divise": result("a.it"), "camici": result("b.it")})
+
+    run_id = db.start_check_run(project_id, keywords_total=2, trigger='manual')
+    # Un run ancora in corso non sostituisce l'ultimo completato
+    assert db.get_latest_run(project_id)['id'] == first['run_id']
+
+    # Riga legacy con timestamp successivo: non deve interferire con il raggruppamento per run
+    db.save_serp_features_batch(project_id, "legacy", [{'result_type': 'organic', 'position': 1, 'domain': 'z.it'}])
+
+    second = db.save_check_run(project_id, {"divise": result("c.it"), "camici": result("d.it")}, run_id)
+    assert second['run_id'] == run_id
+
+    latest = db.get_latest_serp_results(project_id)
+    assert sorted(r['domain'] for r in latest['organic']) == ['c.it', 'd.it']
+
+    runs = db.get_check_runs(project_id)
+    assert [r['id'] for r in runs] == [run_id, first['run_id']]
+    assert runs[0]['status'] == 'completed' and runs[0]['trigger'] == 'manual'
+    assert runs[0]['keywords_checked'] == 2 and runs[0]['keywords_total'] == 2
+
+    failed = db.start_check_run(project_id, 2)
+    db.finish_check_run(failed, 'failed', 'browser non disponibile')
+    assert db.get_check_runs(project_id, limit=1)[0]['status'] == 'failed'
+    assert db.get_latest_run(project_id)['id'] == run_id
+
+
+def test_latest_serp_results_across_partial_runs(db):
+    """Run di tier diversi: ogni keyword mostra l'ultimo run che l'ha controllata"""
+    print("🧪 TEST CHECK RUN PARZIALI")
+
+    project_id = db.create_project(name="Test", domain="isacco.it")
+
+    def result(domain):
+        return {'organic': [{'position': 1, 'domain': domain}], 'target_positions': {}, 'metadata': {}}
+
+    # Run giornaliero con tutte le keywords, poi un run orario con la sola keyword del tier hourly
+    daily = db.save_check_run(project_id, {"divise": result("a.it"), "camici": result("b.it")})
+    hourly = db.save_check_run(project_id, {"divise": result("c.it")})
+    assert hourly['run_id'] > daily['run_id']
+
+    latest = db.get_latest_serp_results(project_id)
+    by_keyword = {r['keyword']: (r['domain'], r['run_id']) for r in latest['organic']}
+    print(f"Ultimi risultati: {by_keyword}")
+    assert by_keyword == {"divise": ("c.it", hourly['run_id']), "camici": ("b.it", daily['run_id'])}
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
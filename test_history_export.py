@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Test dell'export colonnare incrementale (partizioni per progetto/mese, watermark, file aperti limitati)
+"""
+
+import csv
+import glob
+import gzip
+import os
+import sys
+import pytest
+import history_export
+from history_export import HistoryExporter
+import manage
+
+
+@pytest.fixture
+def projects(db, project_id, save_check):
+    """Due progetti con risultati e features su due mesi"""
+    projects = [project_id, db.create_project(name="Altro", domain="altro.it")]
+    for project in projects:
+        for month in ('2024-04', '2024-05'):
+            results = {f"kw {i}": i + 1 for i in range(5)}
+            results['kw 0'] = {'target_positions': {'organic': {'position': 1}}, 'organic': [
+                {'position': 1, 'domain': 'isacco.it', 'url': 'https://isacco.it/'}
+            ]}
+            save_check(project, f"{month}-15 10:00:00", results)
+    return projects
+
+
+@pytest.fixture
+def out_dir(tmp_path):
+    return os.path.join(tmp_path, 'exports')
+
+
+def _read_rows(out_dir: str, table: str):
+    rows = []
+    for path in sorted(glob.glob(os.path.join(out_dir, table, '*', '*', '*.csv.gz'))):
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            rows += [dict(row, partition=os.path.relpath(os.path.dirname(path), out_dir)) for row in csv.DictReader(f)]
+    return rows
+
+
+def test_partitioned_incremental_export(db, projects, out_dir):
+    """Ogni riga esportata una sola volta, nella partizione del suo progetto e mese"""
+    print("🧪 TEST EXPORT STORICO - PARTIZIONI E WATERMARK")
+
+    exporter = HistoryExporter(db, out_dir=out_dir, format='csv', batch_rows=3, max_open_files=1)
+
+    report = exporter.run()
+    print(f"Report: {report}")
+    assert report['ranking_results'] == 20 and report['serp_features'] == 4
+
+    rows = _read_rows(out_dir, 'ranking_results')
+    assert sorted(int(row['id']) for row in rows) == list(range(1, 21))
+    assert all(row['partition'] == os.path.join('ranking_results', f"project_id={row['project_id']}",
+                                                f"month={row['checked_at'][:7]}") for row in rows)
+    features = _read_rows(out_dir, 'serp_features')
+    assert {row['domain'] for row in features} == {'isacco.it'} and len(features) == 4
+    assert not glob.glob(os.path.join(out_dir, '**', '*.tmp'), recursive=True)
+
+    # Nessuna riga nuova: niente file; righe nuove: solo quelle, in nuovi file
+    assert exporter.run()['rows'] == 0
+    db.save_results_batch(projects[0], {"kw nuova": 3})
+    assert exporter.run()['ranking_results'] == 1
+    assert len(_read_rows(out_dir, 'ranking_results')) == 21
+    assert exporter.watermarks() == {'ranking_results': 21, 'serp_features': 4}
+
+
+def test_reanalyzed_partitions_are_replaced(db, projects, out_dir):
+    """Righe riscritte da una ri-analisi (id nuovi) sostituiscono quelle esportate, senza duplicati"""
+    print("🧪 TEST EXPORT STORICO - PARTIZIONI RI-ANALIZZATE")
+
+    exporter = HistoryExporter(db, out_dir=out_dir, format='csv', batch_rows=3)
+    exporter.run()
+
+    # La SERP di "kw 0" del primo progetto viene ri-analizzata in entrambi i mesi
+    with db.connections.writer() as conn:
+        conn.execute("INSERT INTO dict_hashes (content_hash) VALUES ('abc')")
+        conn.execute("UPDATE ranking_results SET content_hash = 'abc' WHERE project_id = ? AND keyword = 'kw 0'",
+                     (projects[0],))
+        conn.execute("""
+            UPDATE serp_feature_rows SET content_hash_id = (SELECT id FROM dict_hashes WHERE content_hash = 'abc')
+            WHERE project_id = ?
+        """, (projects[0],))
+    db.replace_reanalyzed_results(projects[0], [{
+        'keyword': 'kw 0', 'content_hash': 'abc', 'position': 9,
+        'checks': [('2024-04-15 10:00:00', None), ('2024-05-15 10:00:00', None)],
+        'features': [{'result_type': 'organic', 'position': 1, 'domain': 'nuovo.it'}]
+    }], parser_version='2')
+
+    report = exporter.run()
+    print(f"Report dopo la ri-analisi: {report}")
+    rows = _read_rows(out_dir, 'ranking_results')
+    assert len(rows) == 20
+    assert sorted(row['position'] for row in rows if row['keyword'] == 'kw 0'
+                  and row['project_id'] == str(projects[0])) == ['9', '9']
+    features = _read_rows(out_dir, 'serp_features')
+    assert len(features) == 4
+    assert sorted(row['domain'] for row in features) == ['isacco.it', 'isacco.it', 'nuovo.it', 'nuovo.it']
+    assert not glob.glob(os.path.join(out_dir, '**', '*.tmp'), recursive=True)
+
+    # Già riesportate: nessun nuovo file
+    assert exporter.run()['rows'] == 0
+
+
+def test_failed_export_keeps_watermark(db, projects, out_dir):
+    """Un export interrotto non lascia file parziali e non avanza il watermark"""
+    print("🧪 TEST EXPORT STORICO - INTERRUZIONE")
+
+    exporter = HistoryExporter(db, out_dir=out_dir, format='csv', batch_rows=4)
+
+    class Broken(Exception):
+        pass
+
+    def broken_flush(self, key):
+        raise Broken()
+
+    from history_export import _ExportRun
+    original = _ExportRun._flush
+    _ExportRun._flush = broken_flush
+    try:
+        exporter.run(['ranking_results'])
+        assert False, "L'export doveva fallire"
+    except Broken:
+        pass
+    finally:
+        _ExportRun._flush = original
+
+    assert exporter.watermarks()['ranking_results'] == 0
+    assert not glob.glob(os.path.join(out_dir, '**', '*.*'), recursive=True)
+    assert exporter.run(['ranking_results'])['rows'] == 20
+
+    try:
+        HistoryExporter(db, out_dir=out_dir, format='xlsx')
+        assert False, "Formato non valido accettato"
+    except ValueError:
+        pass
+
+
+def test_parquet_export(db, projects, out_dir):
+    """Con pyarrow: file Parquet partizionati, leggibili per colonna, e incrementali"""
+    print("🧪 TEST EXPORT STORICO - PARQUET")
+    ds = pytest.importorskip('pyarrow.dataset')
+
+    assert manage.main(['--db', db.db_path, 'export-history', '--out', out_dir]) is None
+
+    dataset = ds.dataset(os.path.join(out_dir, 'ranking_results'), format='parquet', partitioning='hive')
+    table = dataset.to_table(columns=['keyword', 'position'], filter=ds.field('month') == '2024-05')
+    assert table.num_rows == 10 and table.column_names == ['keyword', 'position']
+    features = ds.dataset(os.path.join(out_dir, 'serp_features'), format='parquet', partitioning='hive').to_table()
+    assert features.num_rows == 4 and set(features.column('domain').to_pylist()) == {'isacco.it'}
+    assert str(features.schema.field('checked_at').type) == 'timestamp[us]'
+    assert sorted(set(features.column('project_id').to_pylist())) == projects  # dal percorso della partizione
+
+    # Solo le righe nuove, in un nuovo file della partizione
+    db.save_results_batch(projects[0], {"kw nuova": 3})
+    assert HistoryExporter(db, out_dir=out_dir, format='parquet').run()['ranking_results'] == 1
+    ids = ds.dataset(os.path.join(out_dir, 'ranking_results'), format='parquet', partitioning='hive').to_table(
+        columns=['id']).column('id').to_pylist()
+    assert sorted(ids) == list(range(1, 22))
+
+
+def test_parquet_falls_back_to_csv_without_pyarrow(db, projects, out_dir):
+    """Senza pyarrow l'exporter (anche quello dello scheduler) ripiega sul CSV invece di fallire"""
+    print("🧪 TEST EXPORT STORICO - RIPIEGO CSV")
+
+    pa = history_export.pa
+    history_export.pa = None
+    try:
+        exporter = HistoryExporter(db, out_dir=out_dir, format='parquet')
+    finally:
+        history_export.pa = pa
+    assert exporter.format == 'csv'
+    assert exporter.run()['ranking_results'] == 20
+    assert len(_read_rows(out_dir, 'ranking_results')) == 20
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
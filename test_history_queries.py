@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test di paginazione keyset e aggregazioni SQL dello storico
+"""
+
+import sys
+from datetime import datetime, timedelta, timezone
+import pytest
+
+
+def _checked_at(days_ago: int) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days_ago)).strftime('%Y-%m-%d 10:00:00')
+
+
+def _save_days(save_check, project_id: int, positions):
+    """positions: {keyword: [posizione per ogni giorno, dal più vecchio]}, un check al giorno"""
+    days = len(next(iter(positions.values())))
+    for i in range(days):
+        save_check(project_id, _checked_at(days - i), {kw: values[i] for kw, values in positions.items()})
+
+
+def _all_pages(fetch):
+    items, cursor, pages = [], None, 0
+    while True:
+        page = fetch(cursor)
+        items += page['items']
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            return items, pages
+
+
+def test_keyset_pages_cover_history_once(db, project_id, save_check):
+    """Le pagine restituiscono ogni riga una sola volta, nello stesso ordine della query completa"""
+    print("🧪 TEST STORICO - PAGINAZIONE")
+
+    _save_days(save_check, project_id, {f"kw {i}": [i + 1, i + 2, None] for i in range(7)})
+
+    for resolution in ('raw', 'daily'):
+        full = db.get_results_history(project_id, days=10, resolution=resolution)
+        paged, pages = _all_pages(
+            lambda cursor: db.get_results_page(project_id, days=10, resolution=resolution, limit=4, cursor=cursor)
+        )
+        assert paged == full and len(full) == 21 and pages == 6
+
+    features = [{'result_type': 'organic', 'position': p, 'domain': f'd{p}.it', 'url': f'https://d{p}.it/'} for p in range(1, 6)]
+    for _ in range(2):
+        db.save_serp_features_batch(project_id, "kw 0", features)
+    paged, _ = _all_pages(lambda cursor: db.get_serp_features_page(project_id, limit=3, cursor=cursor))
+    assert paged == db.get_serp_features(project_id) and len(paged) == 10
+
+    # Ogni pagina legge dall'indice a partire dal cursore, senza ordinare tutte le righe del progetto
+    with db.connections.reader() as conn:
+        plan = conn.execute("""
+            EXPLAIN QUERY PLAN SELECT * FROM serp_features
+            WHERE project_id = ? AND checked_at <= ? AND (checked_at < ? OR id > ?)
+            ORDER BY checked_at DESC, id LIMIT 4
+        """, (project_id, paged[2]['checked_at'], paged[2]['checked_at'], paged[2]['id'])).fetchall()
+    assert any('idx_feature_rows_project_date (project_id=? AND checked_at<?)' in row[-1] for row in plan)
+    assert not any('TEMP B-TREE' in row[-1] for row in plan)
+
+    try:
+        db.get_results_page(project_id, cursor="non-valido")
+        assert False, "cursore non valido accettato"
+    except ValueError:
+        pass
+
+
+def test_sql_summaries(db, project_id, save_check):
+    """Aggregati per giorno e per keyword calcolati in SQL"""
+    print("🧪 TEST STORICO - AGGREGATI")
+
+    _save_days(save_check, project_id, {
+        "divise": [2, 4, None],
+        "camici": [12, 8, 9],
+    })
+
+    by_day = db.get_history_summary(project_id, days=10, group_by='day')['items']
+    print(f"Per giorno: {by_day}")
+    assert [(d['keywords'], d['found_keywords'], d['avg_position'], d['top3'], d['top10']) for d in by_day] == [
+        (2, 1, 9.0, 0, 1),
+        (2, 2, 6.0, 0, 2),
+        (2, 2, 7.0, 1, 1),
+    ]
+
+    by_keyword = db.get_history_summary(project_id, days=10, group_by='keyword', limit=1)
+    assert by_keyword['items'][0] == {
+        'keyword': 'camici', 'checks': 3, 'found': 3, 'avg_position': 9.7, 'best_position': 8,
+        'worst_position': 12, 'current_position': 9, 'resolution': 'daily'
+    }
+    second = db.get_history_summary(project_id, days=10, group_by='keyword', cursor=by_keyword['next_cursor'])
+    assert [k['keyword'] for k in second['items']] == ['divise'] and second['next_cursor'] is None
+
+    # Filtro keywords: le migliori per posizione corrente
+    assert db.get_top_keywords(project_id, 1) == ['camici']
+    rows = db.get_results_history(project_id, days=10, keywords=db.get_top_keywords(project_id, 1))
+    assert {row['keyword'] for row in rows} == {'camici'} and len(rows) == 3
+    assert db.get_results_history(project_id, days=10, keywords=[]) == []
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
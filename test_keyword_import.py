@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test dell'import in streaming delle keywords (normalizzazione, duplicati, indice unico)
+"""
+
+import io
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+import pytest
+from database import Database
+from keyword_import import iter_keyword_file, normalize_keyword
+from retention import RetentionManager
+import manage
+
+
+def test_normalize_and_parse_files():
+    """TXT una keyword per riga; CSV con colonna keyword o prima colonna; BOM UTF-8 ignorato"""
+    print("🧪 TEST IMPORT KEYWORDS - FORMATI")
+
+    assert normalize_keyword("  Divise   da  LAVORO ") == "divise da lavoro"
+    assert normalize_keyword("x" * 300) is None
+
+    txt = "\ufeffdivise\r\nabbigliamento\n".encode('utf-8')
+    assert list(iter_keyword_file(io.BytesIO(txt), 'kw.txt')) == ["divise", "abbigliamento"]
+
+    csv_with_header = b"volume,Keyword\n100,divise\n50,\"scarpe, antinfortunistiche\"\n"
+    assert list(iter_keyword_file(io.BytesIO(csv_with_header), 'kw.csv')) == [
+        "divise", "scarpe, antinfortunistiche"
+    ]
+
+    csv_without_header = b"divise,100\ncamici,20\n"
+    assert list(iter_keyword_file(io.BytesIO(csv_without_header), 'KW.CSV')) == ["divise", "camici"]
+
+
+def test_import_skips_duplicates_across_chunks(db, project_id):
+    """I duplicati nel file e quelli già presenti nel progetto vengono saltati e contati"""
+    print("🧪 TEST IMPORT KEYWORDS - DUPLICATI")
+
+    other_id = db.create_project(name="Altro", domain="altro.it")
+
+    assert db.add_keywords(project_id, ["divise", "", "Camici"]) == {'inserted': 2, 'skipped': 0, 'invalid': 0}
+    report = db.import_keywords(project_id, ["DIVISE", "grembiuli", "camici ", "grembiuli", "x" * 300],
+                                chunk_size=2)
+    print(f"Report: {report}")
+    assert report == {'inserted': 1, 'skipped': 3, 'invalid': 1}
+    assert [kw['keyword'] for kw in db.get_keywords(project_id)] == ["camici", "divise", "grembiuli"]
+
+    # Lo stesso testo in un altro progetto non è un duplicato
+    assert db.add_keywords(other_id, ["divise"])['inserted'] == 1
+
+
+def test_existing_duplicates_removed_by_migration(tmp_path):
+    """All'avvio i duplicati esistenti vengono rimossi prima di creare l'indice unico"""
+    print("🧪 TEST IMPORT KEYWORDS - MIGRAZIONE")
+
+    db_path = os.path.join(tmp_path, 'legacy.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE keywords (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER, keyword TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.executemany("INSERT INTO keywords (project_id, keyword) VALUES (?, ?)",
+                         [(1, "divise"), (1, "divise"), (1, "camici"), (2, "divise")])
+
+    db = Database(db_path)
+    assert [kw['id'] for kw in db.get_keywords(1)] == [3, 1]
+    assert len(db.get_keywords(2)) == 1
+    db.close()
+
+
+def test_existing_keywords_normalized_by_migration(tmp_path):
+    """Le keywords salvate prima della normalizzazione vengono unite con storico e rollup"""
+    print("🧪 TEST IMPORT KEYWORDS - NORMALIZZAZIONE ESISTENTI")
+
+    db_path = os.path.join(tmp_path, 'test.db')
+    db = Database(db_path)
+    project_id = db.create_project(name="Test", domain="isacco.it")
+    # Database migrato con il primo indice unico, che confrontava le keywords così come salvate
+    with db.connections.writer() as conn:
+        conn.execute("DROP INDEX idx_keywords_project_normalized")
+        conn.execute("CREATE UNIQUE INDEX idx_keywords_project_keyword ON keywords (project_id, keyword)")
+        conn.executemany("INSERT INTO keywords (project_id, keyword) VALUES (?, ?)",
+                         [(project_id, "Scarpe Nike"), (project_id, "scarpe  nike"), (project_id, "divise")])
+    day = (datetime.now(timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%d')
+    for keyword, position, checked_at in (("Scarpe Nike", 4, f'{day} 09:00:00'), ("scarpe  nike", 6, f'{day} 10:00:00')):
+        run = db.save_check_run(project_id, {keyword: {
+            'target_positions': {'organic': {'position': position}},
+            'organic': [{'position': position, 'domain': 'isacco.it', 'url': 'https://isacco.it/'}]
+        }})
+        with db.connections.writer() as conn:
+            for table in ('ranking_results', 'serp_feature_rows'):
+                conn.execute(f"UPDATE {table} SET checked_at = ? WHERE run_id = ?", (checked_at, run['run_id']))
+            conn.execute("UPDATE check_runs SET started_at = ?, finished_at = ? WHERE id = ?",
+                         (checked_at, checked_at, run['run_id']))
+    RetentionManager(db, raw_days=0).run()
+    db.close()
+
+    db = Database(db_path)
+    assert [(kw['id'], kw['keyword']) for kw in db.get_keywords(project_id)] == [(3, "divise"), (1, "scarpe nike")]
+    assert db.add_keywords(project_id, ["Scarpe  NIKE"])['inserted'] == 0
+    with db.connections.reader() as conn:
+        results = conn.execute("SELECT DISTINCT keyword FROM ranking_results").fetchall()
+        features = conn.execute("SELECT DISTINCT keyword FROM serp_features").fetchall()
+        latest = conn.execute("SELECT keyword, position, previous_position FROM latest_positions").fetchall()
+        rollups = conn.execute("""
+            SELECT k.keyword, r.resolution, r.checks, r.best_position, r.worst_position, r.position_sum
+            FROM ranking_rollups r JOIN dict_keywords k ON k.id = r.keyword_id ORDER BY r.resolution
+        """).fetchall()
+        presence = conn.execute("SELECT resolution, serps, target_serps FROM feature_rollups ORDER BY resolution").fetchall()
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(keywords)")}
+    assert results == [("scarpe nike",)] and features == [("scarpe nike",)]
+    assert latest == [("scarpe nike", 6, 4)]
+    assert rollups == [("scarpe nike", 'daily', 2, 4, 6, 10), ("scarpe nike", 'weekly', 2, 4, 6, 10)]
+    assert presence == [('daily', 2, 2), ('weekly', 2, 2)]
+    assert 'idx_keywords_project_normalized' in indexes and 'idx_keywords_project_keyword' not in indexes
+    db.close()
+
+
+def test_cli_streams_large_file(tmp_path):
+    """Il comando import-keywords importa 100k righe a blocchi"""
+    print("🧪 TEST IMPORT KEYWORDS - CLI 100K")
+
+    db_path = os.path.join(tmp_path, 'test.db')
+    path = os.path.join(tmp_path, 'keywords.csv')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("keyword,volume\n")
+        for i in range(100000):
+            f.write(f"keyword {i % 90000},10\n")
+
+    db = Database(db_path)
+    project_id = db.create_project(name="Test", domain="isacco.it")
+    db.close()
+
+    start = time.time()
+    manage.main(['--db', db_path, 'import-keywords', '--project', str(project_id), path])
+    print(f"Import 100k righe: {time.time() - start:.2f}s")
+
+    db = Database(db_path)
+    assert len(db.get_keywords(project_id)) == 90000
+    db.close()
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test dei tier di frequenza per keyword (keywords scadute, fase mantenuta, budget di crawl)
+"""
+
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+import pytest
+from database import Database
+from schedule_planner import format_timestamp
+
+START = datetime(2024, 5, 13, 9, 0, tzinfo=timezone.utc)
+
+
+def _at(hours: float) -> str:
+    return format_timestamp(START + timedelta(hours=hours))
+
+
+@pytest.fixture
+def tiered_project(db, project_id):
+    """Progetto giornaliero: 2 keywords orarie, 30 settimanali, 1 col tier di default"""
+    db.add_keywords(project_id, ["divise", "camici"] + [f"coda lunga {i}" for i in range(30)] + ["grembiuli"])
+    db.set_keyword_tier(project_id, ["Divise", "camici"], 'hourly')
+    db.set_keyword_tier(project_id, [f"coda lunga {i}" for i in range(30)], 'weekly')
+    return project_id
+
+
+def test_only_due_keywords_are_claimed(db, tiered_project):
+    """Ogni scadenza restituisce solo le keywords del tier in scadenza"""
+    print("🧪 TEST TIER KEYWORDS - SCADENZE")
+
+    project_id = tiered_project
+    assert db.get_keyword_tiers(project_id) == {'default': 1, 'hourly': 2, 'weekly': 30}
+
+    # Primo check: tutte le keywords, poi ognuna alla sua frequenza
+    assert len(db.claim_due_keywords(project_id, 24, _at(0), anchor=_at(0))) == 33
+    assert db.claim_due_keywords(project_id, 24, _at(0.5)) == []
+    assert db.get_next_keyword_due(project_id) == _at(1)
+    assert sorted(db.claim_due_keywords(project_id, 24, _at(1))) == ["camici", "divise"]
+    assert sorted(db.claim_due_keywords(project_id, 24, _at(24))) == ["camici", "divise", "grembiuli"]
+
+    # Fermo di 3 ore: un solo recupero, poi di nuovo allo scoccare dell'ora
+    assert sorted(db.claim_due_keywords(project_id, 24, _at(27.2))) == ["camici", "divise"]
+    assert db.get_next_keyword_due(project_id) == _at(28)
+
+    try:
+        db.set_keyword_tier(project_id, ["divise"], 'minutely')
+        assert False, "Tier non valido accettato"
+    except ValueError:
+        pass
+
+    # Cambio di tier: la keyword torna in scadenza subito
+    assert db.set_keyword_tier(project_id, ["coda lunga 0"], None) == 1
+    assert db.claim_due_keywords(project_id, 24, _at(27.5)) == ["coda lunga 0"]
+
+
+def test_weekly_check_counts_follow_tiers(db, tiered_project):
+    """In una settimana ogni keyword viene controllata alla frequenza del suo tier"""
+    print("🧪 TEST TIER KEYWORDS - BUDGET")
+
+    project_id = tiered_project
+    checks = sum(len(db.claim_due_keywords(project_id, 24, _at(hour), anchor=_at(0))) for hour in range(24 * 7))
+    hourly_for_all = 33 * 24 * 7
+    print(f"Check in una settimana: {checks} con i tier, {hourly_for_all} con tutte le keywords ogni ora")
+    # 2 keywords ogni ora, 1 ogni giorno, 30 una volta
+    assert checks == 2 * 24 * 7 + 1 * 7 + 30
+
+
+def test_tier_columns_added_to_existing_database(tmp_path):
+    """I database creati prima dei tier ricevono le nuove colonne e l'indice all'avvio"""
+    print("🧪 TEST TIER KEYWORDS - MIGRAZIONE")
+
+    db_path = os.path.join(tmp_path, 'legacy.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE keywords (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER, keyword TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("INSERT INTO keywords (project_id, keyword) VALUES (1, 'divise')")
+
+    db = Database(db_path)
+    with db.connections.reader() as conn:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(keywords)")]
+        plan = conn.execute("""
+            EXPLAIN QUERY PLAN SELECT MIN(next_check_at) FROM keywords
+            WHERE project_id = 1 AND next_check_at IS NOT NULL
+        """).fetchall()
+    assert 'tier' in columns and 'next_check_at' in columns
+    assert any('idx_keywords_due' in row[-1] for row in plan)
+    assert db.claim_due_keywords(1, 24, _at(0)) == ['divise']
+    db.close()
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
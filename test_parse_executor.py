@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Test del parsing SERP nel process pool
+"""
+
+import asyncio
+from parse_executor import ParseExecutor, compact_analysis, expand_analysis
+from serp_analyzer import SERPAnalyzer
+
+SERP_HTML = """
+<html><body>
+<div class="g"><h3><a href="https://www.competitor.it/divise">Divise Competitor</a></h3>
+<cite class="tjvcx">https://www.competitor.it</cite></div>
+<div class="g"><h3><a href="https://www.isacco.it/abbigliamento">Isacco Abbigliamento</a></h3>
+<cite class="tjvcx">https://www.isacco.it</cite></div>
+</body></html>
+"""
+
+
+def test_compact_roundtrip():
+    """La forma compatta ricostruisce esattamente l'output dell'analyzer"""
+    print("🧪 TEST PARSE EXECUTOR - FORMA COMPATTA")
+
+    analysis = SERPAnalyzer().analyze_complete_serp(SERP_HTML)
+    assert expand_analysis(compact_analysis(analysis)) == analysis
+
+
+def test_process_pool_matches_inline_parsing():
+    """Il parsing nel process pool produce lo stesso risultato del parsing inline"""
+    print("🧪 TEST PARSE EXECUTOR - PROCESS POOL")
+
+    executor = ParseExecutor(max_workers=2)
+
+    async def run():
+        return await asyncio.gather(*[executor.analyze(SERP_HTML) for _ in range(4)])
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        executor.shutdown()
+
+    expected = SERPAnalyzer().analyze_complete_serp(SERP_HTML)
+    assert all(result == expected for result in results)
+    assert [r['domain'] for r in results[0]['organic']] == ['competitor.it', 'isacco.it']
+    assert executor.stats()['parsed'] == 4
+
+
+if __name__ == "__main__":
+    test_compact_roundtrip()
+    test_process_pool_matches_inline_parsing()
+    print("🎉 TUTTI I TEST PASSATI!")
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test di RankTracker.search_keyword_complete con un crawler finto (senza avviare Chromium)
+"""
+
+import asyncio
+import sys
+import threading
+from types import SimpleNamespace
+import pytest
+from browser_pool import BrowserPool
+from crawler_lifecycle import CrawlerLifecycle
+from parse_executor import ParseExecutor
+from rank_tracker import RankTracker
+from rate_limiter import RateLimiter
+from serp_archive import SERPArchive
+
+SERP_HTML = """
+<html><body>
+<div class="g"><h3><a href="https://www.competitor.it/divise">Divise Competitor</a></h3>
+<cite class="tjvcx">https://www.competitor.it</cite></div>
+<div class="g"><h3><a href="https://www.isacco.it/abbigliamento">Isacco Abbigliamento</a></h3>
+<cite class="tjvcx">https://www.isacco.it</cite></div>
+</body></html>
+"""
+
+LOCALIZATION = {'country_code': 'IT', 'language_code': 'it'}
+
+
+class StubCrawler:
+    """Crawler finto che restituisce sempre la stessa SERP"""
+
+    def __init__(self, egress=None):
+        self.calls = 0
+
+    async def arun(self, url, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(success=True, html=SERP_HTML, error_message=None)
+
+    async def aclose(self):
+        pass
+
+
+def _make_tracker(archive_dir) -> RankTracker:
+    tracker = RankTracker(pool_size=1, archive=SERPArchive(archive_dir=str(archive_dir)))
+    tracker.pool = BrowserPool(size=1, crawler_factory=StubCrawler, egress_list=[])
+    tracker.lifecycle = CrawlerLifecycle(tracker.pool)
+    tracker.parse_executor = ParseExecutor(max_workers=0)
+    return tracker
+
+
+def test_search_keyword_complete_with_stub_crawler(tmp_path):
+    """Il check di una keyword restituisce le posizioni del dominio e i metadati del crawl"""
+    print("🧪 TEST RANK TRACKER - CHECK KEYWORD")
+
+    tracker = _make_tracker(tmp_path)
+
+    async def run():
+        try:
+            return await tracker.search_keyword_complete("divise", "isacco.it", LOCALIZATION)
+        finally:
+            await tracker.close_crawler()
+
+    result = asyncio.run(run())
+    print(f"Risultato: {result.get('target_positions')} {result.get('metadata')}")
+    assert 'error' not in result
+    assert result['target_positions']['organic']['position'] == 2
+    assert [r['domain'] for r in result['organic']] == ['competitor.it', 'isacco.it']
+    assert isinstance(result['metadata']['crawl_time'], float)
+    assert 'fetched_at' not in result and 'archive' not in result
+
+
+def test_archive_metadata_on_crawl_and_read_through(tmp_path):
+    """Crawl nuovo e lettura dall'archivio riportano la provenienza nei metadati, non tra i risultati"""
+    print("🧪 TEST RANK TRACKER - PROVENIENZA ARCHIVIO")
+
+    async def check(tracker):
+        try:
+            return await tracker.search_keyword_complete("divise", "isacco.it", LOCALIZATION,
+                                                         cache_config={'max_age_hours': 1})
+        finally:
+            await tracker.close_crawler()
+
+    crawled = asyncio.run(check(_make_tracker(tmp_path)))
+    # Un nuovo tracker (cache del coalescer vuota) legge la SERP dall'archivio senza crawl
+    reader = _make_tracker(tmp_path)
+    archived = asyncio.run(check(reader))
+
+    for result, source in ((crawled, 'crawl'), (archived, 'archive')):
+        print(f"{source}: {result.get('metadata')}")
+        assert 'error' not in result and 'archive' not in result
+        assert result['metadata']['source'] == source
+        assert result['target_positions']['organic']['position'] == 2
+    assert reader.pool.stats()['contexts'][0]['pages'] == 0
+    assert archived['metadata']['content_hash'] == crawled['metadata']['content_hash']
+    assert archived['metadata']['archive_fetch_id'] == crawled['metadata']['archive_fetch_id']
+    assert archived['metadata']['crawl_time'] == crawled['metadata']['crawl_time']
+
+
+def test_archive_io_runs_off_event_loop(tmp_path):
+    """Lettura, scrittura ed estensione dall'archivio non girano nel thread dell'event loop"""
+    print("🧪 TEST RANK TRACKER - ARCHIVIO FUORI DALL'EVENT LOOP")
+
+    tracker = _make_tracker(tmp_path)
+    archive = tracker.archive
+    calls = []
+
+    def on_thread(method):
+        def call(*args, **kwargs):
+            calls.append((method.__name__, threading.get_ident()))
+            return method(*args, **kwargs)
+        return call
+
+    for name in ('get_latest', 'load_html', 'store'):
+        setattr(archive, name, on_thread(getattr(archive, name)))
+
+    async def run():
+        try:
+            await tracker.search_keyword_complete("divise", "isacco.it", LOCALIZATION,
+                                                  tracking_config={'tracking_mode': 'ORGANIC_ONLY'},
+                                                  cache_config={'max_age_hours': 1})
+            # Progetto con più tipi sulla stessa SERP: estensione dall'HTML archiviato
+            await tracker.search_keyword_complete("divise", "isacco.it", LOCALIZATION,
+                                                  tracking_config={'tracking_mode': 'FULL_SERP'})
+        finally:
+            await tracker.close_crawler()
+
+    asyncio.run(run())
+    print(f"Chiamate all'archivio: {[name for name, _ in calls]}")
+    assert {name for name, _ in calls} == {'get_latest', 'load_html', 'store'}
+    assert all(thread != threading.get_ident() for _, thread in calls)
+
+
+def test_rate_limit_wait_does_not_hold_browser(tmp_path):
+    """Una localizzazione in attesa del token non blocca il contesto alle altre localizzazioni"""
+    print("🧪 TEST RANK TRACKER - ATTESA RATE LIMIT FUORI DAL CHECKOUT")
+
+    tracker = _make_tracker(tmp_path)
+    tracker.rate_limiter = RateLimiter(jitter_seconds=0)
+    rate_limit = {'requests_per_minute': 120, 'burst': 1}
+    us = {'country_code': 'US', 'language_code': 'en'}
+    finished = []
+
+    async def check(keyword, localization):
+        await tracker.search_keyword_complete(keyword, "isacco.it", localization, rate_limit_config=rate_limit)
+        finished.append(localization['country_code'])
+
+    async def run():
+        try:
+            # Bucket IT già vuoto: il check IT attende mezzo secondo, quello US parte subito
+            await tracker.rate_limiter.acquire(LOCALIZATION, 'direct', rate_limit)
+            await asyncio.gather(check("divise", LOCALIZATION), check("uniforms", us))
+        finally:
+            await tracker.close_crawler()
+
+    asyncio.run(run())
+    print(f"Ordine di completamento: {finished}")
+    assert finished == ['US', 'IT']
+
+
+def test_crawler_follows_recycled_context(tmp_path):
+    """tracker.crawler è sempre il crawler attuale del primo contesto, anche dopo un riciclo"""
+    print("🧪 TEST RANK TRACKER - CRAWLER DEL POOL")
+
+    tracker = _make_tracker(tmp_path)
+
+    async def run():
+        await tracker.init_crawler()
+        first = tracker.crawler
+        await tracker.pool.contexts[0].recycle()
+        second = tracker.crawler
+        await tracker.close_crawler()
+        return first, second, tracker.crawler
+
+    first, second, closed = asyncio.run(run())
+    assert isinstance(first, StubCrawler) and isinstance(second, StubCrawler)
+    assert second is not first
+    assert closed is None
+
+
+if __name__ == "__main__":
+    # tmp_path lo fornisce pytest (directory rimossa a fine test)
+    sys.exit(pytest.main([__file__, '-q', '-s']))
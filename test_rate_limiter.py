@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test del rate limiter a token bucket per localizzazione
+"""
+
+import asyncio
+from rate_limiter import DEFAULT_BURST, DEFAULT_REQUESTS_PER_MINUTE, RateLimiter, TokenBucket
+
+
+def test_token_bucket_reservations():
+    """Il bucket concede il burst subito e poi distanzia le richieste secondo il rate"""
+    print("🧪 TEST TOKEN BUCKET")
+
+    bucket = TokenBucket(requests_per_minute=60, burst=2)
+    now = bucket.updated_at
+
+    waits = [bucket.reserve(now) for _ in range(4)]
+    print(f"Attese: {waits}")
+    assert waits[:2] == [0.0, 0.0]
+    assert abs(waits[2] - 1.0) < 1e-6
+    assert abs(waits[3] - 2.0) < 1e-6
+
+    # Dopo 10 secondi il bucket torna pieno (massimo burst)
+    assert bucket.reserve(now + 10) == 0.0
+
+
+def test_rate_limiter_buckets_are_per_locale_and_egress():
+    """Localizzazioni e uscite diverse non si bloccano a vicenda"""
+    print("🧪 TEST RATE LIMITER - BUCKET SEPARATI")
+
+    limiter = RateLimiter(jitter_seconds=0)
+    config = {'requests_per_minute': 1, 'burst': 1}
+    it = {'country_code': 'IT', 'language_code': 'it'}
+    us = {'country_code': 'US', 'language_code': 'en'}
+
+    async def run():
+        return [
+            await limiter.acquire(it, 'direct', config),
+            await limiter.acquire(us, 'direct', config),
+            await limiter.acquire(it, 'http://proxy1:8080', config),
+        ]
+
+    waits = asyncio.run(run())
+    assert waits == [0.0, 0.0, 0.0]
+
+    metrics = limiter.metrics()
+    print(f"Metriche: {metrics}")
+    assert metrics['requests'] == 3
+    assert len(metrics['buckets']) == 3
+
+    # Una seconda richiesta sullo stesso bucket deve attendere
+    key = limiter.bucket_key(it, 'direct', config)
+    assert limiter.get_bucket(key).reserve() > 0
+
+
+def test_project_settings_do_not_overwrite_shared_bucket():
+    """Progetti con impostazioni diverse sulla stessa localizzazione non si cambiano il bucket"""
+    print("🧪 TEST RATE LIMITER - IMPOSTAZIONI PER PROGETTO")
+
+    limiter = RateLimiter(jitter_seconds=0)
+    it = {'country_code': 'IT', 'language_code': 'it'}
+    slow = {'requests_per_minute': 1, 'burst': 1}
+    fast = {'requests_per_minute': 60, 'burst': 3}
+
+    async def run():
+        return [
+            await limiter.acquire(it, 'direct', slow),
+            await limiter.acquire(it, 'direct', fast),
+            await limiter.acquire(it, 'direct', fast),
+        ]
+
+    assert asyncio.run(run()) == [0.0, 0.0, 0.0]
+    slow_bucket = limiter.get_bucket(limiter.bucket_key(it, 'direct', slow))
+    fast_bucket = limiter.get_bucket(limiter.bucket_key(it, 'direct', fast))
+    assert (slow_bucket.requests_per_minute, slow_bucket.burst) == (1, 1)
+    assert (fast_bucket.requests_per_minute, fast_bucket.burst) == (60, 3)
+    # Senza configurazione il progetto usa il bucket con i default
+    assert limiter.bucket_key(it) == ('IT', 'it', 'direct', DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_BURST)
+
+
+if __name__ == "__main__":
+    test_token_bucket_reservations()
+    test_rate_limiter_buckets_are_per_locale_and_egress()
+    test_project_settings_do_not_overwrite_shared_bucket()
+    print("🎉 TUTTI I TEST PASSATI!")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test della ri-analisi offline delle SERP archiviate
+"""
+
+import os
+import sys
+import pytest
+from reanalysis import ReanalysisEngine
+from serp_archive import SERPArchive
+
+SERP_HTML = """
+<html><body>
+<div class="g"><h3><a href="https://www.competitor.it/divise">Divise Competitor</a></h3>
+<cite class="tjvcx">https://www.competitor.it</cite></div>
+<div class="g"><h3><a href="https://www.isacco.it/abbigliamento">Isacco Abbigliamento</a></h3>
+<cite class="tjvcx">https://www.isacco.it</cite></div>
+</body></html>
+"""
+
+
+def test_reanalysis_rewrites_results(db, tmp_path):
+    """Le righe collegate a una SERP archiviata vengono riscritte con la nuova versione parser"""
+    print("🧪 TEST RI-ANALISI OFFLINE")
+
+    archive = SERPArchive(os.path.join(tmp_path, 'archive'))
+
+    project_id = db.create_project(name="Test", domain="https://www.isacco.it/")
+    localization = db.get_project_localization(project_id)
+    entry = archive.store("divise", localization, "https://www.google.com/search?q=divise", SERP_HTML)
+
+    # Risultato salvato da un parser "vecchio" che non aveva trovato il dominio
+    db.save_result(project_id, "divise", None, entry['content_hash'], "0")
+    db.save_serp_features_batch(project_id, "divise", [], entry['content_hash'], "0")
+
+    engine = ReanalysisEngine(db, archive_dir=archive.archive_dir, workers=1)
+    report = engine.run(project_id, parser_version="test-2")
+    print(f"Report: {report}")
+
+    assert report['serps'] == 1
+    assert report['missing'] == 0
+
+    history = db.get_results_history(project_id, days=1)
+    assert len(history) == 1
+    assert history[0]['position'] == 2
+
+    features = db.get_serp_features(project_id, "divise", result_type='organic')
+    assert [f['domain'] for f in features] == ['competitor.it', 'isacco.it']
+    assert all(f['parser_version'] == "test-2" for f in features)
+
+    # Il riferimento al check run sopravvive alla riscrittura
+    run = db.save_check_run(project_id, {"divise": {
+        'organic': [], 'target_positions': {},
+        'metadata': {'content_hash': entry['content_hash'], 'parser_version': "test-2"}
+    }})
+    engine.run(project_id, parser_version="test-3")
+    features = db.get_latest_serp_results(project_id)['organic']
+    assert [f['domain'] for f in features] == ['competitor.it', 'isacco.it']
+    assert {f['run_id'] for f in features} == {run['run_id']}
+    assert db.get_latest_results(project_id)[0]['position'] == 2
+
+    # Una seconda esecuzione "solo obsoleti" non ha nulla da fare
+    assert engine.run(project_id, parser_version="test-3", only_outdated=True)['serps'] == 0
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
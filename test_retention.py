@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test della retention dello storico con rollup giornalieri e settimanali
+"""
+
+import sys
+from datetime import datetime, timedelta, timezone
+import pytest
+from retention import RetentionManager, choose_resolution
+
+
+def _days_ago(days: int, hour: int = 10) -> str:
+    day = datetime.now(timezone.utc).date() - timedelta(days=days)
+    return f"{day.isoformat()} {hour:02d}:00:00"
+
+
+def _serp(position, ads_domain=None) -> dict:
+    """Risultato di "divise": un concorrente organico, il target (se posizionato) ed eventuale annuncio"""
+    organic = [{'position': 1, 'url': 'https://altro.it/', 'title': 'Altro', 'domain': 'altro.it'}]
+    if position:
+        organic.append({'position': position, 'url': 'https://isacco.it/divise', 'title': 'Divise',
+                        'domain': 'isacco.it'})
+    result = {'target_positions': {'organic': {'position': position}}, 'organic': organic,
+              'metadata': {'parser_version': '3'}}
+    if ads_domain:
+        result['ads'] = [{'position': 1, 'url': f'https://{ads_domain}/', 'title': 'Annuncio', 'domain': ads_domain}]
+    return result
+
+
+def test_rollups_match_raw_history(db, project_id, save_check):
+    """I rollup riportano media, migliore e peggiore posizione; le righe in attesa sono lette dal grezzo"""
+    print("🧪 TEST RETENTION - ROLLUP")
+
+    save_check(project_id, _days_ago(3, 8), {'divise': _serp(3)})
+    save_check(project_id, _days_ago(3, 20), {'divise': _serp(5, 'shop.isacco.it')})
+    save_check(project_id, _days_ago(2), {'divise': _serp(None, 'altro.it')})
+
+    # Prima del job: bucket calcolati al volo dallo storico grezzo
+    pending = db.get_results_history(project_id, days=7, resolution='daily')
+    RetentionManager(db).run()
+    daily = db.get_results_history(project_id, days=7, resolution='daily')
+    print(f"Giornaliero: {daily}")
+    assert pending == daily
+    assert [(r['checks'], r['found'], r['position'], r['best_position'], r['worst_position']) for r in daily] == [
+        (1, 0, None, None, None),
+        (2, 2, 4.0, 3, 5),
+    ]
+
+    weekly = db.get_results_history(project_id, days=400)
+    assert weekly[0]['resolution'] == 'weekly'
+    assert sum(r['checks'] for r in weekly) == 3 and sum(r['found'] for r in weekly) == 2
+
+    presence = {p['result_type']: p for p in db.get_presence_history(project_id, days=7)
+                if p['checked_at'] == _days_ago(3)[:10]}
+    print(f"Presenza: {presence}")
+    assert presence['organic']['serps'] == 2 and presence['organic']['target_serps'] == 2
+    assert presence['ads']['target_serps'] == 1  # sottodominio del target
+
+
+def test_prune_keeps_rollups(db, project_id, save_check):
+    """Le righe grezze oltre la finestra vengono rimosse solo dopo essere state aggregate"""
+    print("🧪 TEST RETENTION - PULIZIA")
+
+    for days in range(0, 60, 2):
+        save_check(project_id, _days_ago(days), {'divise': _serp(days % 10 + 1)})
+
+    retention = RetentionManager(db, raw_days=30, daily_days=45)
+    report = retention.run()
+    print(f"Report: {report}")
+    assert report['pruned_results'] == 14 and report['pruned_features'] == 28
+    assert report['pruned_daily'] == 14  # 7 giorni, posizioni e presenza
+
+    raw = db.get_results_history(project_id, days=60, resolution='raw')
+    assert len(raw) == 16
+    daily = db.get_results_history(project_id, days=60, resolution='daily')
+    assert len(daily) == 23
+    weekly = db.get_results_history(project_id, days=60, resolution='weekly')
+    assert sum(r['checks'] for r in weekly) == 30
+
+    # Dizionari ripuliti dai valori delle righe eliminate, nessuna nuova riga da aggregare
+    with db.connections.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM dict_urls").fetchone()[0] == 2
+    assert retention.run()['ranking_rows'] == 0
+
+
+def test_raw_history_kept_by_default(db, project_id, save_check):
+    """Senza RANK_TRACKER_RAW_RETENTION_DAYS il job crea i rollup ma non elimina righe grezze"""
+    print("🧪 TEST RETENTION - DEFAULT SENZA PULIZIA")
+
+    for days in (1, 200, 400):
+        save_check(project_id, _days_ago(days), {'divise': _serp(3)})
+
+    report = RetentionManager(db).run()
+    assert report['days'] == 3
+    assert report['pruned_results'] == 0 and report['pruned_features'] == 0
+    with db.connections.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM ranking_results").fetchone()[0] == 3
+        assert conn.execute("SELECT COUNT(*) FROM serp_feature_rows").fetchone()[0] == 6
+
+
+def test_choose_resolution():
+    """La risoluzione scelta dipende dall'intervallo e dalla retention disponibile"""
+    print("🧪 TEST RETENTION - RISOLUZIONE")
+
+    assert choose_resolution(7, raw_days=90) == 'raw'
+    assert choose_resolution(60, raw_days=90) == 'daily'
+    assert choose_resolution(20, raw_days=14) == 'daily'
+    assert choose_resolution(365, raw_days=90, daily_days=180) == 'weekly'
+    assert choose_resolution(1000, raw_days=0, daily_days=0) == 'weekly'
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test della pianificazione sfalsata e persistente dei check dei progetti
+"""
+
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+import pytest
+from database import Database
+from schedule_planner import first_due, format_timestamp, next_due, parse_timestamp, resume_due
+
+NOW = datetime(2024, 5, 15, 12, 0, tzinfo=timezone.utc)
+
+
+def test_projects_are_spread_over_the_interval():
+    """Progetti con lo stesso intervallo partono in momenti distribuiti, non tutti insieme"""
+    print("🧪 TEST SCHEDULE - DISTRIBUZIONE")
+
+    for count in (5, 24, 100):
+        offsets = sorted((first_due(project_id, 24, NOW, jitter=0) - NOW).total_seconds() / 3600
+                         for project_id in range(1, count + 1))
+        gaps = [b - a for a, b in zip(offsets, offsets[1:] + [offsets[0] + 24])]
+        print(f"{count} progetti: intervallo massimo tra due partenze {max(gaps):.2f}h (ideale {24 / count:.2f}h)")
+        assert all(0 <= offset < 24 for offset in offsets)
+        # Sequenza aurea: al più tre distanze diverse, la maggiore entro il doppio di quella ideale
+        assert max(gaps) <= 2 * 24 / count
+
+    rng = random.Random(7)
+    jittered = [first_due(project_id, 24, NOW, jitter=0.02, rng=rng) for project_id in range(1, 50)]
+    assert all(NOW <= due <= NOW + timedelta(hours=24) for due in jittered)
+    assert jittered != [first_due(project_id, 24, NOW, jitter=0) for project_id in range(1, 50)]
+
+
+def test_due_times_keep_their_phase():
+    """Le scadenze successive e i recuperi dopo un fermo mantengono la fase del progetto"""
+    print("🧪 TEST SCHEDULE - RIPRESA")
+
+    due = NOW - timedelta(hours=1)
+    assert next_due(due, 6, NOW) == due + timedelta(hours=6)
+    # Fermo di tre giorni: un solo recupero, poi la stessa ora del giorno di prima
+    long_ago = NOW - timedelta(days=3, hours=2)
+    assert next_due(long_ago, 24, NOW) == NOW + timedelta(hours=22)
+
+    future = NOW + timedelta(hours=3)
+    assert resume_due(1, future, 24, NOW) == future
+    assert resume_due(1, None, 24, NOW) is None
+    catch_up = [resume_due(project_id, long_ago, 24, NOW, catch_up_minutes=30) for project_id in range(1, 11)]
+    assert all(NOW <= due < NOW + timedelta(minutes=30) for due in catch_up)
+    assert len(set(catch_up)) == 10
+
+
+def test_schedule_state_is_persisted(db, project_id):
+    """Scadenza e ultima esecuzione sopravvivono al riavvio (nuova istanza del database)"""
+    print("🧪 TEST SCHEDULE - PERSISTENZA")
+
+    due = format_timestamp(first_due(project_id, 24, NOW))
+    db.save_schedule_state(project_id, 24, due)
+    db.save_schedule_state(project_id, 24, format_timestamp(NOW + timedelta(days=1)), last_run_at=format_timestamp(NOW))
+    db.save_schedule_state(project_id, 24, format_timestamp(NOW + timedelta(days=2)))
+    db.close()
+
+    restarted = Database(db.db_path)
+    state = restarted.get_schedule_state(project_id)
+    print(f"Stato: {state}")
+    assert parse_timestamp(state['next_due_at']) == NOW + timedelta(days=2)
+    assert parse_timestamp(state['last_run_at']) == NOW
+    assert restarted.get_schedule_states() == {project_id: state}
+    restarted.delete_schedule_state(project_id)
+    assert restarted.get_schedule_state(project_id) is None
+    restarted.close()
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
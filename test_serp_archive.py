@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test dell'archivio HTML delle SERP
+"""
+
+import sys
+import time
+import pytest
+from serp_archive import SERPArchive, locale_key
+
+LOCALIZATION = {'country_code': 'IT', 'language_code': 'it', 'city_code': None, 'content_restriction': True}
+URL = "https://www.google.com/search?q=divise+cucina&gl=it&hl=it&num=100&cr=countryIT"
+
+
+def test_archive_deduplicates_content(tmp_path):
+    """HTML identico viene salvato una sola volta, ma ogni fetch resta indicizzato"""
+    print("🧪 TEST ARCHIVIO SERP - DEDUPLICA")
+
+    archive = SERPArchive(str(tmp_path), max_age_days=0, max_size_mb=0)
+    html = "<html><body>" + "<div class='g'>risultato</div>" * 500 + "</body></html>"
+
+    first = archive.store("divise cucina", LOCALIZATION, URL, html)
+    second = archive.store("divise cucina", LOCALIZATION, URL, html)
+
+    stats = archive.stats()
+    print(f"Statistiche: {stats}")
+    assert first['content_hash'] == second['content_hash']
+    assert stats['fetches'] == 2
+    assert stats['blobs'] == 1
+    assert stats['compressed_bytes'] < stats['size_bytes']
+    assert archive.load_html(first['content_hash']) == html
+    assert locale_key(LOCALIZATION) == 'IT/it/-/CR'
+    assert len(archive.get_fetches("divise cucina", LOCALIZATION)) == 2
+
+
+def test_archive_read_through_freshness(tmp_path):
+    """get_latest restituisce la SERP solo entro la finestra di freschezza richiesta"""
+    print("🧪 TEST ARCHIVIO SERP - FRESCHEZZA")
+
+    archive = SERPArchive(str(tmp_path), max_age_days=0, max_size_mb=0)
+    archive.store("divise cucina", LOCALIZATION, URL, "<html>vecchia</html>", fetched_at=time.time() - 7200)
+
+    assert archive.get_latest(URL, 0) is None
+    assert archive.get_latest(URL, 3600) is None
+    assert archive.get_latest(URL, 3 * 3600) is not None
+
+
+def test_archive_eviction(tmp_path):
+    """I fetch oltre l'età massima vengono rimossi insieme ai blob orfani"""
+    print("🧪 TEST ARCHIVIO SERP - EVICTION")
+
+    archive = SERPArchive(str(tmp_path), max_age_days=1, max_size_mb=0)
+    old = archive.store("keyword", LOCALIZATION, URL, "<html>old</html>", fetched_at=time.time() - 3 * 86400)
+    archive.store("keyword", LOCALIZATION, URL, "<html>new</html>")
+
+    removed = archive.evict()
+    assert removed == {'removed_fetches': 1, 'removed_blobs': 1}
+    assert archive.load_html(old['content_hash']) is None
+    assert archive.stats()['fetches'] == 1
+
+
+if __name__ == "__main__":
+    # tmp_path lo fornisce pytest (directory rimossa a fine test)
+    sys.exit(pytest.main([__file__, '-q', '-s']))
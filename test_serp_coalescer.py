@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test della deduplicazione dei fetch SERP tra progetti
+"""
+
+import asyncio
+from serp_coalescer import DEFAULT_FRESHNESS_SECONDS, SERPFetchCoalescer
+from volatility import MIN_INTERVAL_HOURS
+from serp_analyzer import SERPAnalyzer
+
+
+def test_concurrent_fetches_are_coalesced():
+    """Richieste concorrenti e successive per la stessa URL producono un solo fetch"""
+    print("🧪 TEST COALESCER - FETCH CONDIVISI")
+
+    coalescer = SERPFetchCoalescer(freshness_seconds=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'organic': [{'position': 1, 'domain': 'example.com'}]}
+
+    async def run():
+        url = "https://www.google.com/search?q=divise&gl=it&hl=it&num=100"
+        results = await asyncio.gather(*[coalescer.fetch(url, fetch) for _ in range(5)])
+        results.append(await coalescer.fetch(url, fetch))
+        return results
+
+    results = asyncio.run(run())
+    stats = coalescer.stats()
+    print(f"Statistiche: {stats}")
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert stats['coalesced'] == 4
+    assert stats['cache_hits'] == 1
+
+
+def test_errors_are_not_cached():
+    """Un fetch fallito viene ritentato alla richiesta successiva"""
+    print("🧪 TEST COALESCER - ERRORI")
+
+    coalescer = SERPFetchCoalescer(freshness_seconds=60)
+    responses = [{'error': 'Crawling failed'}, {'organic': []}]
+
+    async def fetch():
+        return responses.pop(0)
+
+    async def run():
+        return [await coalescer.fetch('key', fetch), await coalescer.fetch('key', fetch)]
+
+    first, second = asyncio.run(run())
+    assert 'error' in first
+    assert second == {'organic': []}
+
+
+def test_next_scheduled_check_is_not_cached():
+    """La finestra resta sotto l'intervallo minimo: il check orario successivo fa un nuovo crawl"""
+    print("🧪 TEST COALESCER - FINESTRA E INTERVALLO MINIMO")
+
+    assert DEFAULT_FRESHNESS_SECONDS < MIN_INTERVAL_HOURS * 3600
+    coalescer = SERPFetchCoalescer(freshness_seconds=2 * 3600)
+    assert coalescer.freshness_seconds < MIN_INTERVAL_HOURS * 3600
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return {'organic': []}
+
+    async def run():
+        await coalescer.fetch('key', fetch)
+        # Il check del tier hourly parte fino a CLAIM_AHEAD_MINUTES prima dell'ora piena
+        fetched_at, analysis = coalescer._cache['key']
+        coalescer._cache['key'] = (fetched_at - (MIN_INTERVAL_HOURS * 3600 - 5 * 60), analysis)
+        await coalescer.fetch('key', fetch)
+
+    asyncio.run(run())
+    assert len(calls) == 2 and coalescer.cache_hits == 0
+
+
+def test_shared_analysis_per_domain():
+    """La stessa analisi produce posizioni diverse per domini diversi senza essere modificata"""
+    print("🧪 TEST COALESCER - POST-PROCESSING PER DOMINIO")
+
+    analyzer = SERPAnalyzer()
+    shared = {
+        'organic': [
+            {'position': 1, 'domain': 'competitor.it', 'url': 'https://competitor.it', 'title': ''},
+            {'position': 2, 'domain': 'isacco.it', 'url': 'https://isacco.it', 'title': ''},
+        ],
+        'ads': [],
+        'target_positions': {}
+    }
+
+    isacco = analyzer.analyze_for_domain(shared, 'isacco.it')
+    competitor = analyzer.analyze_for_domain(shared, 'competitor.it')
+
+    assert isacco['target_positions']['organic']['position'] == 2
+    assert competitor['target_positions']['organic']['position'] == 1
+    assert shared['target_positions'] == {}
+
+
+if __name__ == "__main__":
+    test_concurrent_fetches_are_coalesced()
+    test_errors_are_not_cached()
+    test_next_scheduled_check_is_not_cached()
+    test_shared_analysis_per_domain()
+    print("🎉 TUTTI I TEST PASSATI!")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Test dell'estrattore SERP single-pass (engine 'dom') rispetto ai pattern regex
+"""
+
+from serp_analyzer import EXTRACTORS, SERPAnalyzer, register_extractor, result_types_for_tracking
+from serp_extractor import AnchorIndex, SERPDocumentParser, normalize_host
+
+
+def build_serp(results: int = 10) -> str:
+    """SERP sintetica con la struttura moderna di Google"""
+    parts = ['<html><head><script>var tpl = "<div class=\\"g\\"><cite class=\\"x\\">fake.com</cite>";</script></head><body>']
+    parts.append('<div id="tads"><div class="uEierd"><a href="https://www.adsite.it/landing">Annuncio <span>Adsite</span></a></div></div>')
+    parts.append('<div class="VkpGBb"><a href="https://www.localbiz.it/">Local Biz</a></div>')
+    for i in range(results):
+        domain = f"site{i}.com"
+        parts.append(
+            f'<div class="MjjYud"><div class="g tF2Cxc"><div class="yuRUbf">'
+            f'<a href="https://www.{domain}/pagina/{i}"><h3 class="LC20lb">Titolo {i} &amp; co</h3>'
+            f'<div class="TbwUpd"><cite class="tjvcx">https://www.{domain}<span> › pagina</span></cite></div></a></div>'
+            f'<div class="VwiC3b">Descrizione <em>risultato</em> {i}</div></div></div>'
+        )
+    parts.append('<div class="pla-unit"><a href="https://shop.example.it/p/1">Prodotto 1</a></div>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def test_dom_engine_matches_regex_organic_order():
+    """Stesso ordine organico e stessa posizione target dei pattern regex"""
+    print("🧪 TEST ESTRATTORE DOM - ORGANICI")
+
+    html = build_serp()
+    dom = SERPAnalyzer(engine='dom').analyze_complete_serp(html, 'site7.com')
+    regex = SERPAnalyzer(engine='regex').analyze_complete_serp(html, 'site7.com')
+
+    assert [r['domain'] for r in dom['organic']] == [r['domain'] for r in regex['organic']]
+    assert dom['target_positions']['organic']['position'] == regex['target_positions']['organic']['position'] == 8
+    assert set(dom['organic'][0]) == set(regex['organic'][0])
+
+    first = dom['organic'][0]
+    print(f"Primo risultato: {first}")
+    assert first['url'] == 'https://www.site0.com/pagina/0'
+    assert first['title'] == 'Titolo 0 & co'
+    assert first['snippet'] == 'Descrizione risultato 0'
+
+
+def test_dom_engine_classifies_all_result_types():
+    """Ads, local pack e shopping vengono classificati nello stesso passaggio"""
+    print("🧪 TEST ESTRATTORE DOM - TIPI DI RISULTATO")
+
+    analysis = SERPAnalyzer(engine='dom').analyze_complete_serp(build_serp(3))
+
+    assert [r['domain'] for r in analysis['ads']] == ['adsite.it']
+    assert analysis['ads'][0]['title'] == 'Annuncio Adsite'
+    assert [r['domain'] for r in analysis['local_pack']] == ['localbiz.it']
+    assert [r['domain'] for r in analysis['shopping']] == ['shop.example.it']
+    assert 'fake.com' not in [r['domain'] for r in analysis['organic']]
+
+
+def test_parser_tolerates_unbalanced_html():
+    """Tag non chiusi non fanno perdere i risultati successivi"""
+    print("🧪 TEST ESTRATTORE DOM - HTML NON BILANCIATO")
+
+    html = '<div class="g"><p>testo<div class="g"><a href="https://b.it/x"><h3>B</h3></a><cite class="c">b.it</cite></div>'
+    document = SERPDocumentParser.parse(html)
+    assert [text for text, _ in document.organic_cites] == ['b.it']
+    assert len(document.organic_blocks) == 2
+
+
+def test_anchor_index_lookup():
+    """Indice host -> link: ordine di documento, sottodomini e redirect Google"""
+    print("🧪 TEST INDICE LINK")
+
+    html = ('<a href="/relativo">x</a>'
+            '<a href="https://www.google.com/url?q=https://blog.example.com/post&sa=U">redirect</a>'
+            '<h3><a href="https://www.example.com/">Example</a></h3>'
+            '<a href="https://notexample.com/">altro</a>')
+    index = SERPDocumentParser.parse(html).anchor_index
+
+    assert normalize_host('https://WWW.Example.com:8080/a?b=1') == 'example.com'
+    assert normalize_host('/url?q=https://a.it') is None
+    assert [a.url for a in index.anchors_for('www.example.com')] == [
+        'https://www.google.com/url?q=https://blog.example.com/post&sa=U', 'https://www.example.com/'
+    ]
+    assert index.first('blog.example.com').url.startswith('https://www.google.com/url')
+    assert index.title_for('example.com') == 'Example'
+    assert index.first('mple.com') is None
+    assert len(AnchorIndex([])) == 0
+
+
+def test_regex_engine_uses_anchor_index():
+    """Il contesto dei risultati regex arriva dall'indice (URL, titolo e snippet)"""
+    print("🧪 TEST CONTESTO REGEX DA INDICE")
+
+    analysis = SERPAnalyzer(engine='regex').analyze_complete_serp(build_serp(5), 'site3.com')
+    result = analysis['organic'][3]
+    assert result['url'] == 'https://www.site3.com/pagina/3'
+    assert result['title'] == 'Titolo 3 & co'
+    assert result['snippet'] == 'Descrizione risultato 3'
+    assert analysis['target_positions']['organic']['position'] == 4
+
+
+def test_only_requested_result_types_are_extracted():
+    """Estrattori e posizioni target limitati ai tipi della configurazione di tracking"""
+    print("🧪 TEST ESTRAZIONE LAZY PER TRACKING CONFIG")
+
+    assert result_types_for_tracking({'tracking_mode': 'ORGANIC_ONLY'}) == ('organic',)
+    assert result_types_for_tracking({'tracking_mode': 'CUSTOM', 'track_local': True}) == ('organic', 'local_pack')
+    assert len(result_types_for_tracking({'tracking_mode': 'FULL_SERP'})) == 5
+    assert len(result_types_for_tracking(None)) == 5
+
+    html = build_serp(3)
+    for engine in ('dom', 'regex'):
+        analysis = SERPAnalyzer(engine=engine).analyze_complete_serp(
+            html, 'adsite.it', result_types=result_types_for_tracking({'tracking_mode': 'ORGANIC_ONLY'})
+        )
+        assert set(analysis) == {'organic', 'target_positions'}
+        assert analysis['target_positions'] == {}
+
+    analysis = SERPAnalyzer().analyze_complete_serp(html, 'adsite.it', result_types=['ads'])
+    assert analysis['target_positions']['ads']['position'] == 1
+
+
+def test_custom_extractor_registration():
+    """Un nuovo tipo di risultato si aggiunge registrando un estrattore"""
+    print("🧪 TEST REGISTRO ESTRATTORI")
+
+    @register_extractor('headings')
+    def _headings(analyzer, page):
+        return [{'position': i, 'domain': '', 'title': ''.join(a.heading)}
+                for i, a in enumerate((a for a in page.document.anchors if a.heading), 1)]
+
+    try:
+        analysis = SERPAnalyzer().analyze_complete_serp(build_serp(2), result_types=['headings'])
+        assert [r['title'] for r in analysis['headings']] == ['Titolo 0 & co', 'Titolo 1 & co']
+
+        try:
+            SERPAnalyzer(engine='regex').analyze_complete_serp('', result_types=['headings'])
+            assert False, "tipo non registrato per l'engine regex"
+        except ValueError:
+            pass
+    finally:
+        EXTRACTORS['dom'].pop('headings')
+
+
+if __name__ == "__main__":
+    test_dom_engine_matches_regex_organic_order()
+    test_dom_engine_classifies_all_result_types()
+    test_parser_tolerates_unbalanced_html()
+    test_anchor_index_lookup()
+    test_regex_engine_uses_anchor_index()
+    test_only_requested_result_types_are_extracted()
+    test_custom_extractor_registration()
+    print("🎉 TUTTI I TEST PASSATI!")
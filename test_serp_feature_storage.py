@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test dello storage a dizionari di serp_features e della vista di compatibilità
+"""
+
+import os
+import sqlite3
+import sys
+import pytest
+from database import Database
+
+
+def test_features_are_dictionary_encoded(db, project_id):
+    """Testi ripetuti tra check diversi vengono salvati una sola volta"""
+    print("🧪 TEST STORAGE A DIZIONARI")
+
+    result = {
+        'organic': [
+            {'position': 1, 'domain': 'a.it', 'url': 'https://a.it/x', 'title': 'Titolo A', 'snippet': 'Testo'},
+            {'position': 2, 'domain': 'b.it', 'url': 'https://b.it/y', 'title': 'Titolo B', 'snippet': 'Testo'},
+        ],
+        'target_positions': {},
+        'metadata': {'content_hash': 'abc', 'parser_version': '3'}
+    }
+
+    for _ in range(3):
+        db.save_check_run(project_id, {"divise": result})
+
+    with db.connections.reader() as conn:
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ('serp_feature_rows', 'dict_keywords', 'dict_urls', 'dict_texts', 'dict_domains')}
+    print(f"Righe: {counts}")
+    assert counts == {'serp_feature_rows': 6, 'dict_keywords': 1, 'dict_urls': 2, 'dict_texts': 3, 'dict_domains': 2}
+
+    # I lettori esistenti vedono le stesse colonne di prima
+    features = db.get_serp_features(project_id, "divise", result_type='organic')
+    assert len(features) == 6
+    assert features[0]['title'] == 'Titolo A' and features[0]['snippet'] == 'Testo'
+    assert features[0]['content_hash'] == 'abc'
+    assert [f['domain'] for f in db.get_latest_serp_results(project_id)['organic']] == ['a.it', 'b.it']
+
+
+def test_legacy_table_is_migrated(tmp_path):
+    """La vecchia tabella serp_features viene convertita mantenendo id e contenuti"""
+    print("🧪 TEST MIGRAZIONE SERP FEATURES")
+
+    db_path = os.path.join(tmp_path, 'legacy.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE serp_features (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER, keyword TEXT NOT NULL,
+                result_type TEXT NOT NULL, position INTEGER, url TEXT, title TEXT, snippet TEXT,
+                domain TEXT, checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.executemany("""
+            INSERT INTO serp_features (id, project_id, keyword, result_type, position, url, title, snippet, domain, checked_at)
+            VALUES (?, 1, 'divise', ?, ?, ?, ?, ?, ?, '2024-01-01 10:00:00')
+        """, [
+            (7, 'organic', 1, 'https://a.it/x', 'Titolo A', None, 'a.it'),
+            (9, 'ads', 1, 'https://b.it/ad', 'Annuncio', '', 'b.it'),
+        ])
+
+    db = Database(db_path)
+    features = sorted(db.get_serp_features(1), key=lambda f: f['id'])
+    assert [(f['id'], f['result_type'], f['url'], f['title'], f['snippet'], f['domain']) for f in features] == [
+        (7, 'organic', 'https://a.it/x', 'Titolo A', None, 'a.it'),
+        (9, 'ads', 'https://b.it/ad', 'Annuncio', '', 'b.it'),
+    ]
+    assert features[0]['content_hash'] is None and features[0]['run_id'] is None
+
+    with db.connections.reader() as conn:
+        kind = conn.execute("SELECT type FROM sqlite_master WHERE name = 'serp_features'").fetchone()[0]
+        plan = conn.execute("""
+            EXPLAIN QUERY PLAN SELECT * FROM serp_features WHERE project_id = 1 AND result_type = 'organic'
+            ORDER BY checked_at DESC, id
+        """).fetchall()
+    assert kind == 'view'
+    # Gli indici per data della vecchia tabella sono sostituiti da quello su serp_feature_rows
+    assert any('idx_feature_rows_project_date' in row[-1] for row in plan)
+    assert not any('TEMP B-TREE' in row[-1] for row in plan)
+
+    # Riapertura: la migrazione non viene ripetuta
+    db.close()
+    db = Database(db_path)
+    assert len(db.get_serp_features(1)) == 2
+    db.close()
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test della frequenza di check adattiva (volatilità da posizioni e ricambio della top 10)
+"""
+
+import sys
+from datetime import datetime, timedelta, timezone
+import pytest
+from schedule_planner import format_timestamp, parse_timestamp
+from volatility import interval_factor, keyword_volatility
+
+NOW = datetime(2024, 5, 31, 9, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def history(db, project_id, save_check):
+    """
+    Storico giornaliero: 'stabile' sempre in 4a posizione con la stessa top 10, 'mobile' che salta
+    di 6 posizioni, 'ricambio' ferma ma con metà top 10 nuova ogni giorno, 'nuova' senza storico
+    """
+    days = 20
+    db.add_keywords(project_id, ["stabile", "mobile", "ricambio", "nuova"])
+
+    for day in range(days):
+        checked_at = format_timestamp(NOW - timedelta(days=days - day))
+        results = {
+            'stabile': {'target_positions': {'organic': {'position': 4}}, 'organic': [
+                {'position': p, 'domain': f'stabile{p}.it', 'url': f'https://stabile{p}.it/'} for p in range(1, 11)
+            ]},
+            'mobile': {'target_positions': {'organic': {'position': 3 if day % 2 else 9}}},
+            'ricambio': {'target_positions': {'organic': {'position': 5}}, 'organic': [
+                {'position': p, 'domain': f'giorno{day if p > 5 else 0}-{p}.it', 'url': f'https://r{day}-{p}.it/'}
+                for p in range(1, 11)
+            ]}
+        }
+        save_check(project_id, checked_at, results)
+    return project_id
+
+
+def test_volatility_scores(db, history):
+    """Posizioni ferme e top 10 invariata = volatilità 0; spostamenti e ricambio la aumentano"""
+    print("🧪 TEST VOLATILITÀ - PUNTEGGI")
+
+    project_id = history
+    with db.connections.reader() as conn:
+        scores = keyword_volatility(conn, project_id, ["stabile", "mobile", "ricambio", "nuova"],
+                                    format_timestamp(NOW - timedelta(days=30)))
+    print(f"Volatilità: {scores}")
+    assert scores['stabile'] == 0
+    assert scores['mobile'] == 3.0  # 6 posizioni per check / 2
+    assert abs(scores['ricambio'] - 0.5 / 0.2) < 1e-9  # metà top 10 nuova a ogni check
+    assert 'nuova' not in scores
+
+    assert interval_factor(None) == 1.0
+    assert interval_factor(0) == 4.0 and interval_factor(3.0) == 0.5 and interval_factor(0.5) == 2.0
+
+
+def test_stable_keywords_are_checked_less_often(db, history):
+    """La prossima scadenza si allunga per le keywords stabili e si accorcia per quelle volatili"""
+    print("🧪 TEST VOLATILITÀ - SCADENZE")
+
+    project_id = history
+    until = format_timestamp(NOW)
+    assert len(db.claim_due_keywords(project_id, 24, until, anchor=until)) == 4
+
+    keywords = {kw['keyword']: kw for kw in db.get_keywords(project_id)}
+    hours = {keyword: (parse_timestamp(kw['next_check_at']) - NOW).total_seconds() / 3600
+             for keyword, kw in keywords.items()}
+    print(f"Ore al prossimo check: {hours}")
+    assert hours == {'stabile': 96, 'mobile': 12, 'ricambio': 12, 'nuova': 24}
+    assert keywords['nuova']['volatility'] is None and keywords['stabile']['volatility'] == 0
+
+    # Senza adattamento tutte restano sull'intervallo del tier
+    db.set_keyword_tier(project_id, list(keywords), None)
+    db.claim_due_keywords(project_id, 24, until, anchor=until, adaptive=False)
+    assert {kw['next_check_at'] for kw in db.get_keywords(project_id)} == {format_timestamp(NOW + timedelta(hours=24))}
+
+
+if __name__ == "__main__":
+    # Le fixture (database in tmp_path) le fornisce pytest: conftest.py
+    sys.exit(pytest.main([__file__, '-q', '-s']))
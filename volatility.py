@@ -0,0 +1,84 @@
+"""
+Frequenza di check adattiva in base alla volatilità delle keywords
+Dallo storico recente si calcola per keyword quanto si muove la posizione tra un check e l'altro e
+quanti domini nuovi entrano nella top 10 organica: le keywords stabili vengono ricontrollate meno
+spesso (fino a ADAPTIVE_MAX_FACTOR volte l'intervallo del tier), quelle volatili più spesso
+"""
+
+import os
+from typing import Dict, Iterable, Optional
+
+from keyword_import import chunked
+
+ADAPTIVE_SCHEDULING = os.getenv('RANK_TRACKER_ADAPTIVE_SCHEDULING', '1') != '0'
+VOLATILITY_LOOKBACK_DAYS = int(os.getenv('RANK_TRACKER_VOLATILITY_LOOKBACK_DAYS', '30'))
+
+# Limiti del moltiplicatore applicato all'intervallo del tier, e intervallo minimo assoluto
+ADAPTIVE_MIN_FACTOR = float(os.getenv('RANK_TRACKER_ADAPTIVE_MIN_FACTOR', '0.5'))
+ADAPTIVE_MAX_FACTOR = float(os.getenv('RANK_TRACKER_ADAPTIVE_MAX_FACTOR', '4'))
+MIN_INTERVAL_HOURS = 1
+
+# Volatilità 1 = intervallo del tier invariato: 2 posizioni di spostamento medio per check,
+# oppure un quinto della top 10 sostituito a ogni check
+POSITION_UNIT = 2.0
+CHURN_UNIT = 0.2
+
+# Check necessari prima di adattare l'intervallo (keywords nuove restano sull'intervallo del tier)
+MIN_SAMPLES = 3
+
+# Posizione assegnata alle keywords non trovate e spostamento massimo contato per check
+NOT_FOUND_POSITION = 101
+MAX_POSITION_DELTA = 20
+
+TOP_RESULTS = 10
+
+
+def keyword_volatility(conn, project_id: int, keywords: Iterable[str], since: str) -> Dict[str, float]:
+    """Volatilità delle keywords con abbastanza storico dalla data indicata (le altre sono assenti)"""
+    movement = {}
+    churn = {}
+    for chunk in chunked(keywords, 500):
+        placeholders = ','.join('?' * len(chunk))
+
+        # Spostamento medio tra check consecutivi (indice per keyword: +project_id esclude quello di progetto)
+        for keyword, avg_delta, samples in conn.execute(f"""
+            SELECT keyword, AVG(MIN(ABS(delta), ?)), COUNT(*) FROM (
+                SELECT keyword,
+                       COALESCE(position, ?) - LAG(COALESCE(position, ?)) OVER (
+                           PARTITION BY keyword ORDER BY checked_at, id) AS delta
+                FROM ranking_results
+                WHERE keyword IN ({placeholders}) AND +project_id = ? AND checked_at >= ?
+            )
+            WHERE delta IS NOT NULL
+            GROUP BY keyword
+        """, [MAX_POSITION_DELTA, NOT_FOUND_POSITION, NOT_FOUND_POSITION, *chunk, project_id, since]):
+            if samples >= MIN_SAMPLES:
+                movement[keyword] = avg_delta
+
+        # Ricambio della top 10: domini distinti oltre quelli di un singolo check, per check successivo
+        for keyword, domains, rows, checks in conn.execute(f"""
+            SELECT k.keyword, COUNT(DISTINCT f.domain_id), COUNT(*), COUNT(DISTINCT f.checked_at)
+            FROM dict_keywords k
+            JOIN serp_feature_rows f ON f.keyword_id = k.id
+            WHERE k.keyword IN ({placeholders}) AND f.project_id = ? AND f.result_type = 'organic'
+              AND f.position <= ? AND f.checked_at >= ?
+            GROUP BY k.keyword
+        """, [*chunk, project_id, TOP_RESULTS, since]):
+            if checks > MIN_SAMPLES:
+                per_check = rows / checks
+                churn[keyword] = min(1.0, max(0.0, (domains - per_check) / (per_check * (checks - 1))))
+
+    return {
+        keyword: movement.get(keyword, 0.0) / POSITION_UNIT + churn.get(keyword, 0.0) / CHURN_UNIT
+        for keyword in movement.keys() | churn.keys()
+    }
+
+
+def interval_factor(volatility: Optional[float], min_factor: float = ADAPTIVE_MIN_FACTOR,
+                    max_factor: float = ADAPTIVE_MAX_FACTOR) -> float:
+    """Moltiplicatore dell'intervallo: inversamente proporzionale alla volatilità, entro i limiti"""
+    if volatility is None:
+        return 1.0
+    if volatility <= 0:
+        return max_factor
+    return min(max_factor, max(min_factor, 1.0 / volatility))